@@ -0,0 +1,82 @@
+"""Utilitários da API JSON somente leitura (rotas em app.py, sob /api).
+
+Cada recurso descreve seus campos como ``{nome: função(objeto)}``; o
+parâmetro ``fields`` escolhe quais serializar, e só esses são calculados.
+Páginas levam ETag forte (hash do corpo) e respondem 304 a ``If-None-Match``.
+Com ``format=ndjson`` a resposta traz todos os itens, um JSON por linha,
+lidos do banco em lotes para não acumular memória.
+"""
+import hashlib
+import json
+
+from flask import Response, abort, jsonify, make_response, request, stream_with_context
+
+from models import db
+from pagination import keyset_batches, keyset_page
+
+MAX_PAGE_SIZE = 100
+STREAM_BATCH_SIZE = 500
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def error(message, status=400):
+    abort(make_response(jsonify({'error': message}), status))
+
+
+def requested_fields(getters):
+    # ?fields=id,content,photos; sem o parâmetro, todos os campos
+    raw = request.args.get('fields')
+    if not raw:
+        return list(getters)
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in getters]
+    if unknown:
+        error(f"Campos desconhecidos: {', '.join(unknown)}. Disponíveis: {', '.join(getters)}")
+    return fields
+
+
+def page_size(default):
+    try:
+        size = int(request.args.get('limit', default))
+    except ValueError:
+        error('limit deve ser um número inteiro')
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def serialize(obj, getters, fields):
+    return {name: getters[name](obj) for name in fields}
+
+
+def wants_ndjson():
+    return (request.args.get('format') == 'ndjson'
+            or request.accept_mimetypes.best == NDJSON_MIMETYPE)
+
+
+def json_response(data):
+    response = Response(dumps(data), mimetype='application/json')
+    response.set_etag(hashlib.sha256(response.get_data()).hexdigest()[:32])
+    # O cliente sempre revalida; com ETag igual recebe 304 sem corpo
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def listing(query, columns, getters, fields, default_size, scope=None):
+    """Página JSON (``items`` + ``next_cursor``) ou, com NDJSON, tudo em streaming."""
+    if wants_ndjson():
+        def generate():
+            for batch in keyset_batches(query, columns, STREAM_BATCH_SIZE):
+                yield ''.join(dumps(serialize(obj, getters, fields)) + '\n' for obj in batch)
+                # Solta os objetos do lote: a memória fica limitada a um lote
+                db.session.expunge_all()
+        return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+    page = keyset_page(query, columns, cursor=request.args.get('cursor'),
+                       per_page=page_size(default_size), scope=scope)
+    return json_response({
+        'items': [serialize(obj, getters, fields) for obj in page.items],
+        'next_cursor': page.next_cursor,
+    })
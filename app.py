@@ -1,26 +1,152 @@
 import os
 import io
-from datetime import datetime
+import click
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
-from PIL import Image as PILImage
+from werkzeug.http import is_resource_modified
 from dotenv import load_dotenv
-from sqlalchemy import or_
+from sqlalchemy import func, or_
+from sqlalchemy.orm import joinedload, selectinload, undefer
 from functools import wraps
 from PIL import Image
-from models import db, User, ProfilePhoto, Post, Photo, Like, Dislike, Comment, Curriculo
+from models import db, User, ProfilePhoto, Post, Photo, Comment, Curriculo, DeletionJob
+from pagination import encode_cursor, keyset_page
+from images import process_image, perceptual_hash, inspect_image, decode_cost, InvalidImage, FORMATS, POST_IMAGE_SIZES, PROFILE_IMAGE_SIZES, MAX_IMAGE_PIXELS
+from image_pipeline import ImagePipeline, default_workers
+import counters
+import database
+import deletions
+import duplicates
+import facets
+import migrations
+import api
+import reactions
+import storage
+import trending
+from uploads import UploadRequest, upload_source, discard_source, spool_pending, pending_sources, discard_pending
+from search import ensure_search_index, search_posts
+from fragment_cache import FragmentCache, TTLCache
+import metrics
+import profiler
+from markupsafe import Markup
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'chave-secreta-padrao')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///site.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Réplica opcional para as leituras das requisições GET (database.py)
+app.config['DATABASE_REPLICA_URL'] = os.getenv('DATABASE_REPLICA_URL')
+app.config['REPLICA_READ_YOUR_WRITES_SECONDS'] = float(os.getenv('REPLICA_READ_YOUR_WRITES_SECONDS', 5))
+app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 5))
+app.config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', 10))
+app.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', 30))
+app.config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', 1800))
+app.config['DB_POOL_PRE_PING'] = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max-limit
+app.config['POSTS_PER_PAGE'] = int(os.getenv('POSTS_PER_PAGE', 20))
+# Tendência (trending.py): meia-vida das interações e intervalo do reescalonamento
+app.config['TRENDING_HALF_LIFE_HOURS'] = float(os.getenv('TRENDING_HALF_LIFE_HOURS', 24))
+app.config['TRENDING_DECAY_INTERVAL_HOURS'] = float(os.getenv('TRENDING_DECAY_INTERVAL_HOURS', 24))
+# Postagens apagadas por transação nas exclusões em segundo plano (deletions.py)
+app.config['DELETION_BATCH_SIZE'] = int(os.getenv('DELETION_BATCH_SIZE', deletions.BATCH_SIZE))
+# Sem heartbeat por esse tempo, o resume-deletions assume o job de outro processo
+app.config['DELETION_LEASE_SECONDS'] = int(os.getenv('DELETION_LEASE_SECONDS', deletions.LEASE_SECONDS))
+app.config['IMAGE_CACHE_MAX_AGE'] = int(os.getenv('IMAGE_CACHE_MAX_AGE', 365 * 24 * 3600))
+app.config['IMAGE_WORKERS'] = int(os.getenv('IMAGE_WORKERS', default_workers()))
+app.config['IMAGE_QUEUE_LIMIT'] = int(os.getenv('IMAGE_QUEUE_LIMIT', 32))
+# Memória estimada de decodificação em uso ao mesmo tempo, por worker web
+app.config['IMAGE_MEMORY_BUDGET'] = int(os.getenv('IMAGE_MEMORY_BUDGET', 256 * 1024 * 1024))
+app.config['MAX_IMAGE_PIXELS'] = int(os.getenv('MAX_IMAGE_PIXELS', MAX_IMAGE_PIXELS))
+# Bits de diferença (até duplicates.MAX_DISTANCE) para uma foto contar como
+# repetida nos anúncios do mesmo vendedor; -1 desativa a verificação
+app.config['DUPLICATE_PHOTO_DISTANCE'] = int(os.getenv('DUPLICATE_PHOTO_DISTANCE', duplicates.MAX_DISTANCE))
+# Requisições maiores que isto gravam os arquivos em disco (ver uploads.py)
+app.config['UPLOAD_SPOOL_THRESHOLD'] = int(os.getenv('UPLOAD_SPOOL_THRESHOLD', 1024 * 1024))
+app.config['UPLOAD_TMP_DIR'] = os.getenv('UPLOAD_TMP_DIR')
+# Pasta do storage de arquivos; em produção, num disco persistente (render.yaml)
+if os.getenv('BLOB_STORAGE_PATH'):
+    app.config['BLOB_STORAGE_PATH'] = os.getenv('BLOB_STORAGE_PATH')
+app.config['CURRICULO_MAX_SIZE'] = int(os.getenv('CURRICULO_MAX_SIZE', 5 * 1024 * 1024))
+app.config['IMAGE_PROCESSING_ASYNC'] = os.getenv('IMAGE_PROCESSING_ASYNC', '').lower() in ('1', 'true', 'yes')
+# Anúncios com fotos pendentes há mais que isto são retomados pelo flask resume-photos
+app.config['PHOTO_JOB_STALE_SECONDS'] = int(os.getenv('PHOTO_JOB_STALE_SECONDS', 900))
+app.config['FRAGMENT_CACHE_BACKEND'] = os.getenv('FRAGMENT_CACHE_BACKEND', 'memory')
+app.config['FRAGMENT_CACHE_URL'] = os.getenv('FRAGMENT_CACHE_URL', 'redis://localhost:6379/0')
+app.config['FRAGMENT_CACHE_SIZE'] = int(os.getenv('FRAGMENT_CACHE_SIZE', 2048))
+app.config['FRAGMENT_CACHE_TTL'] = int(os.getenv('FRAGMENT_CACHE_TTL', 3600))
+# No cache em memória cada worker tem a sua cópia e uma invalidação só limpa a
+# do worker que a fez: os outros servem o card antigo por até este tempo. Com
+# vários workers, use FRAGMENT_CACHE_BACKEND=redis
+app.config['FRAGMENT_CACHE_MEMORY_TTL'] = int(os.getenv('FRAGMENT_CACHE_MEMORY_TTL', 60))
+# Aumente ao alterar templates/_post_card.html para descartar o HTML antigo
+app.config['FRAGMENT_CACHE_VERSION'] = 2
+# Comentários mais recentes exibidos em cada card; os anteriores vêm sob demanda
+app.config['FEED_COMMENTS'] = int(os.getenv('FEED_COMMENTS', 3))
+app.config['COMMENTS_PER_PAGE'] = int(os.getenv('COMMENTS_PER_PAGE', 10))
+app.config['SIDEBAR_USERS_PER_PAGE'] = int(os.getenv('SIDEBAR_USERS_PER_PAGE', 10))
+app.config['SIDEBAR_CACHE_TTL'] = int(os.getenv('SIDEBAR_CACHE_TTL', 30))
+app.config['SLOW_QUERY_MS'] = int(os.getenv('SLOW_QUERY_MS', 100))
+app.config['REQUEST_LOG'] = os.getenv('REQUEST_LOG', 'true').lower() in ('1', 'true', 'yes')
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+# Pasta comum aos workers do gunicorn, para o /metrics somar todos (metrics.py)
+app.config['METRICS_DIR'] = os.getenv('METRICS_DIR')
+# Fração das requisições perfiladas (0 desliga)
+app.config['PROFILE_SAMPLE_RATE'] = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+# Aceita o cabeçalho assinado X-Debug-Profile; só com uma SECRET_KEY de
+# verdade, já que a padrão está no código e qualquer um assinaria com ela
+app.config['PROFILE_HEADER_ENABLED'] = (
+    os.getenv('PROFILE_HEADER_ENABLED', '').lower() in ('1', 'true', 'yes') and bool(os.getenv('SECRET_KEY'))
+)
+app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR', 'profiles')
+app.config['PROFILE_INTERVAL_MS'] = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+app.config['PROFILE_FLUSH_SECONDS'] = float(os.getenv('PROFILE_FLUSH_SECONDS', 10))
+app.config['PROFILE_TOKEN_MAX_AGE'] = int(os.getenv('PROFILE_TOKEN_MAX_AGE', 3600))
 
+database.init_app(app)
 db.init_app(app)
+storage.init_app(app)
+image_pipeline = ImagePipeline.from_config(app.config)
+# Threads que terminam as fotos dos anúncios no modo assíncrono
+photo_jobs = ThreadPoolExecutor(max_workers=2, thread_name_prefix='fotos')
+trending_jobs = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tendencia')
+# Um job de exclusão por vez: os lotes já são pesados para o banco
+deletion_jobs = ThreadPoolExecutor(max_workers=1, thread_name_prefix='exclusoes')
+fragment_cache = FragmentCache.from_config(app.config)
+sidebar_cache = TTLCache(app.config['SIDEBAR_CACHE_TTL'])
+
+metrics.init_app(app)
+request_profiler = profiler.init_app(app)
+metrics.registry.collector('db_pool_checkouts_total', 'counter', 'Conexões retiradas do pool',
+                           lambda: dict(database.pool_stats.checkouts), label='pool')
+metrics.registry.collector('db_pool_checkout_wait_seconds_total', 'counter', 'Tempo esperando uma conexão livre no pool',
+                           lambda: dict(database.pool_stats.wait_seconds), label='pool')
+metrics.registry.collector('db_pool_checkout_timeouts_total', 'counter', 'Esperas que estouraram o DB_POOL_TIMEOUT',
+                           lambda: dict(database.pool_stats.timeouts), label='pool')
+metrics.registry.collector('db_pool_checked_out', 'gauge', 'Conexões em uso',
+                           lambda: {name: pool.checkedout() for name, pool in database.pools.items()}, label='pool')
+metrics.registry.collector('profiled_requests_total', 'counter', 'Requisições perfiladas por amostragem',
+                           lambda: sum(request_profiler.requests.values()))
+metrics.registry.collector('image_queue_depth', 'gauge', 'Imagens aguardando o pool de processamento',
+                           lambda: image_pipeline.stats()['queue_depth'])
+metrics.registry.collector('image_memory_reserved_bytes', 'gauge', 'Memória estimada das imagens em processamento',
+                           lambda: image_pipeline.stats()['memory_reserved'])
+metrics.registry.collector('images_processed_total', 'counter', 'Imagens processadas',
+                           lambda: image_pipeline.stats()['processed'])
+metrics.registry.collector('images_failed_total', 'counter', 'Imagens que não puderam ser processadas',
+                           lambda: image_pipeline.stats()['failed'])
+metrics.registry.collector('image_processing_seconds_total', 'counter', 'Tempo total processando imagens',
+                           lambda: image_pipeline.stats()['total_seconds'])
+metrics.registry.collector('fragment_cache_hits_total', 'counter', 'Cards do feed servidos do cache',
+                           lambda: fragment_cache.stats()['hits'])
+metrics.registry.collector('fragment_cache_misses_total', 'counter', 'Cards do feed renderizados',
+                           lambda: fragment_cache.stats()['misses'])
 
 # Criar imagens padrão se não existirem
 def create_default_images():
@@ -43,31 +169,114 @@ def create_default_images():
 # Criar imagens padrão ao iniciar
 create_default_images()
 
-def process_image(image_data, max_size=(800, 800)):
-    try:
-        img = Image.open(io.BytesIO(image_data))
-        
-        # Converte para RGB se necessário
-        if img.mode in ('RGBA', 'P'):
-            img = img.convert('RGB')
-        
-        # Calcula as novas dimensões mantendo a proporção
-        width, height = img.size
-        ratio = min(max_size[0]/width, max_size[1]/height)
-        new_size = (int(width * ratio), int(height * ratio))
-        
-        # Redimensiona a imagem
-        img = img.resize(new_size, Image.Resampling.LANCZOS)
-        
-        # Salva em um buffer
-        buffer = io.BytesIO()
-        img.save(buffer, format='JPEG', quality=85, optimize=True)
-        buffer.seek(0)
-        
-        return buffer.getvalue()
-    except Exception as e:
-        app.logger.error(f"Erro ao processar imagem: {str(e)}")
-        return None
+def store_image(variants):
+    # Grava todas as variantes no storage; a 'full' em JPEG é a imagem principal
+    stored = {}
+    for name, variant in variants.items():
+        stored[name] = {'width': variant['width'], 'height': variant['height']}
+        for fmt in FORMATS:
+            if fmt in variant:
+                stored[name][fmt] = {
+                    'hash': storage.blob_store().put(variant[fmt]),
+                    'size': len(variant[fmt]),
+                }
+    full = stored['full']
+    return {
+        'blob_hash': full['jpeg']['hash'],
+        'size': full['jpeg']['size'],
+        'mime_type': 'image/jpeg',
+        'width': full['width'],
+        'height': full['height'],
+        'variants': stored,
+        'phash': variants['full'].get('phash'),
+    }
+
+def image_blob(record, size, fmt):
+    # Hash e mimetype da variante pedida; sem ela, cai para a imagem principal
+    variant = (record.variants or {}).get(size, {}).get(fmt)
+    if variant:
+        return variant['hash'], FORMATS[fmt][1]
+    return record.blob_hash, record.mime_type or 'image/jpeg'
+
+def send_stored(blob_hash, mimetype, **kwargs):
+    # Arquivo local é servido pelo caminho: Werkzeug trata Range e envia em partes
+    store = storage.blob_store()
+    path = store.local_path(blob_hash)
+    return send_file(path or store.open(blob_hash), mimetype=mimetype, **kwargs)
+
+def send_blob(record, blob_hash, mimetype, **kwargs):
+    # Serve o conteúdo do storage; linhas ainda não migradas usam o legado
+    if blob_hash:
+        return send_stored(blob_hash, mimetype, **kwargs)
+    return send_file(io.BytesIO(record.image_data), mimetype=mimetype, **kwargs)
+
+def blob_etag(record, blob_hash=None):
+    # ETag forte: o hash do conteúdo ou, para linhas legadas, a última alteração
+    if blob_hash or record.blob_hash:
+        return blob_hash or record.blob_hash
+    changed = getattr(record, 'updated_at', None) or record.created_at
+    return f'{record.id}-{int(changed.timestamp())}'
+
+def image_version(record):
+    return blob_etag(record)[:16]
+
+def send_image(record):
+    blob_hash, mimetype = image_blob(record, request.args.get('size', 'full'), request.args.get('fmt', 'jpeg'))
+    etag = blob_etag(record, blob_hash)
+    last_modified = getattr(record, 'updated_at', None) or record.created_at
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        # Responde 304 sem tocar no conteúdo da imagem
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        response.last_modified = last_modified
+    else:
+        response = send_blob(record, blob_hash, mimetype, etag=etag, last_modified=last_modified)
+
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    if request.args.get('v') == image_version(record):
+        # URL versionada: o conteúdo nunca muda, o navegador não precisa revalidar
+        response.cache_control.max_age = app.config['IMAGE_CACHE_MAX_AGE']
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.max_age = 0
+        response.cache_control.must_revalidate = True
+    return response
+
+def image_url_args(record, size, fmt):
+    args = {'v': image_version(record)}
+    if size != 'full':
+        args['size'] = size
+    if fmt != 'jpeg':
+        args['fmt'] = fmt
+    return args
+
+def image_srcset(record, build_url, fmt):
+    # "url 240w, url 480w, ..." com as variantes existentes no formato pedido
+    variants = record.variants or {}
+    return ', '.join(
+        f"{build_url(size, fmt)} {variant['width']}w"
+        for size, variant in sorted(variants.items(), key=lambda item: item[1]['width'])
+        if fmt in variant
+    )
+
+@app.template_global()
+def post_image_url(photo, size='full', fmt='jpeg'):
+    return url_for('post_image', photo_id=photo.id, **image_url_args(photo, size, fmt))
+
+@app.template_global()
+def post_image_srcset(photo, fmt='jpeg'):
+    return image_srcset(photo, lambda size, fmt: post_image_url(photo, size, fmt), fmt)
+
+@app.template_global()
+def profile_image_url(user, size='full', fmt='jpeg'):
+    return avatar_url(user.id, user.profile_photo, size, fmt)
+
+def avatar_url(user_id, profile_photo, size='full', fmt='jpeg'):
+    # Sem foto, aponta direto para o arquivo estático em vez da rota dinâmica
+    if profile_photo:
+        return url_for('profile_image', user_id=user_id, **image_url_args(profile_photo, size, fmt))
+    return url_for('static', filename='img/default_profile.png')
 
 def login_required(f):
     @wraps(f)
@@ -78,42 +287,260 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def feed_query():
+    # Carrega de uma vez tudo o que os cards do feed usam: o número de
+    # consultas por página fica constante, independente do tamanho da tabela.
+    # Os comentários vêm à parte, só os mais recentes (ver latest_comments).
+    return Post.query.options(
+        joinedload(Post.post_user).joinedload(User.profile_photo),
+        selectinload(Post.post_photos),
+    )
+
+def comments_query():
+    return Comment.query.options(joinedload(Comment.comment_user).joinedload(User.profile_photo))
+
+def latest_comments(post_ids):
+    """Os FEED_COMMENTS comentários mais recentes de cada postagem, numa consulta.
+
+    Devolve {post_id: [comentários do mais antigo ao mais novo]}.
+    """
+    if not post_ids:
+        return {}
+    comment_rank = func.row_number().over(
+        partition_by=Comment.post_id, order_by=(Comment.created_at.desc(), Comment.id.desc())
+    ).label('comment_rank')
+    ranked = (db.session.query(Comment.id, comment_rank)
+              .filter(Comment.post_id.in_(post_ids))
+              .subquery())
+    comments = (comments_query()
+                .join(ranked, ranked.c.id == Comment.id)
+                .filter(ranked.c.comment_rank <= app.config['FEED_COMMENTS'])
+                .order_by(Comment.created_at, Comment.id))
+    latest = {}
+    for comment in comments:
+        latest.setdefault(comment.post_id, []).append(comment)
+    return latest
+
+@app.template_global()
+def older_comments_url(post, comments):
+    # Página com os comentários anteriores ao mais antigo exibido, se houver
+    if post.comments_count <= len(comments):
+        return None
+    cursor = encode_cursor([comments[0].created_at, comments[0].id]) if comments else None
+    return url_for('post_comments', post_id=post.id, cursor=cursor)
+
+# Ordens do feed -> colunas do keyset; cada uma tem o seu índice em posts
+FEED_ORDERS = {
+    'recent': [Post.created_at, Post.id],
+    'trending': [Post.trending_score, Post.id],
+}
+
+def feed_order():
+    order = request.args.get('order')
+    return order if order in FEED_ORDERS else 'recent'
+
+def feed_scope(order):
+    # O reescalonamento muda todas as pontuações: o cursor da tendência leva
+    # a época e, se ela mudou, a listagem recomeça da primeira página. A
+    # época é lida antes da página, então um rebase no meio invalida o cursor
+    if order == 'trending':
+        return trending.current_epoch().isoformat()
+    return None
+
+def feed_page(query=None, order='recent'):
+    if order == 'trending':
+        schedule_trending_decay()
+    return keyset_page(
+        query if query is not None else feed_query(),
+        FEED_ORDERS[order],
+        cursor=request.args.get('cursor'),
+        per_page=app.config['POSTS_PER_PAGE'],
+        scope=feed_scope(order)
+    )
+
+def decay_trending():
+    with app.app_context():
+        try:
+            if trending.rebase(min_age=app.config['TRENDING_DECAY_INTERVAL_HOURS'] * 3600):
+                app.logger.info('Pontuações de tendência reescalonadas')
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Erro ao reescalonar a tendência: {str(e)}")
+
+_trending_decay = None
+
+def schedule_trending_decay():
+    # Sem agendador externo, a listagem por tendência dispara o job quando
+    # a época passa do intervalo; rebase confere de novo dentro da transação
+    global _trending_decay
+    if _trending_decay is not None and not _trending_decay.done():
+        return
+    epoch = trending.current_epoch()
+    if (datetime.utcnow() - epoch).total_seconds() >= app.config['TRENDING_DECAY_INTERVAL_HOURS'] * 3600:
+        _trending_decay = trending_jobs.submit(decay_trending)
+
+def reaction_state(posts):
+    # Ids das postagens da página que o usuário logado curtiu / não curtiu
+    state = reactions.reactions_of(session.get('user_id'), [post.id for post in posts])
+    liked = {post_id for post_id, kind in state.items() if kind == 'like'}
+    disliked = {post_id for post_id, kind in state.items() if kind == 'dislike'}
+    return liked, disliked
+
+def post_cards(posts, liked_ids, disliked_ids):
+    # HTML de cada card vem do cache; só as postagens ausentes carregam
+    # fotos e comentários e são renderizadas. O estado de quem está vendo
+    # (curtidas, botão de excluir) é aplicado depois, por substituição.
+    variant = 'member' if session.get('user_id') else 'anon'
+    cached = fragment_cache.get_many([post.id for post in posts], variant)
+    missing = [post.id for post in posts if post.id not in cached]
+    if missing:
+        feed_query().filter(Post.id.in_(missing)).all()
+        comments = latest_comments(missing)
+        for post in posts:
+            if post.id not in cached:
+                cached[post.id] = render_template('_post_card.html', post=post, member=variant == 'member',
+                                                  comments=comments.get(post.id, []))
+                fragment_cache.set(post.id, variant, cached[post.id])
+
+    cards = {}
+    for post in posts:
+        can_delete = session.get('user_id') == post.user_id or session.get('is_admin')
+        cards[post.id] = Markup(
+            cached[post.id]
+            .replace('__like_active__', 'active' if post.id in liked_ids else '')
+            .replace('__dislike_active__', 'active' if post.id in disliked_ids else '')
+            .replace('<!--post-actions-->', render_template('_post_actions.html', post=post) if can_delete else '')
+        )
+    return cards
+
+def active_users(page):
+    """Uma página da barra lateral: quem anunciou por último vem primeiro.
+
+    Uma única consulta agregada, guardada por SIDEBAR_CACHE_TTL segundos.
+    Devolve (usuários, há_próxima); cada usuário é um dict já com a URL do
+    avatar e ``has_photo``.
+    """
+    per_page = app.config['SIDEBAR_USERS_PER_PAGE']
+
+    def load():
+        last_post_at = func.max(Post.created_at)
+        rows = (
+            db.session.query(User.id, User.username, User.location, last_post_at.label('last_post_at'),
+                             func.count(Post.id).label('posts_count'), ProfilePhoto)
+            .outerjoin(Post, Post.user_id == User.id)
+            .outerjoin(ProfilePhoto, ProfilePhoto.user_id == User.id)
+            .group_by(User.id, ProfilePhoto.id)
+            .order_by(last_post_at.desc().nulls_last(), User.created_at.desc(), User.id.desc())
+            .offset((page - 1) * per_page)
+            .limit(per_page + 1)
+            .all()
+        )
+        users = [{
+            'id': row.id,
+            'username': row.username,
+            'location': row.location,
+            'posts_count': row.posts_count,
+            'has_photo': row.ProfilePhoto is not None,
+            'avatar_url': avatar_url(row.id, row.ProfilePhoto, 'thumb'),
+        } for row in rows[:per_page]]
+        return users, len(rows) > per_page
+
+    return sidebar_cache.get_or_set(page, load)
+
 @app.route('/')
 def index():
-    posts = Post.query.order_by(Post.created_at.desc()).all()
-    users = User.query.all()
-    return render_template('index.html', posts=posts, users=users)
+    order = feed_order()
+    page = feed_page(Post.query, order)
+    liked_ids, disliked_ids = reaction_state(page.items)
+    cards = post_cards(page.items, liked_ids, disliked_ids)
+    users_page = max(1, request.args.get('users_page', 1, type=int))
+    users, more_users = active_users(users_page)
+    return render_template('index.html', posts=page.items, next_cursor=page.next_cursor, cards=cards,
+                           users=users, users_page=users_page, more_users=more_users, order=order)
 
-@app.route('/post/<int:post_id>/like', methods=['POST'])
-def like_post(post_id):
+def parse_price(value):
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+@app.route('/search')
+def search():
+    q = request.args.get('q', '').strip()
+    location = request.args.get('location', '').strip()
+    min_price = parse_price(request.args.get('min_price'))
+    max_price = parse_price(request.args.get('max_price'))
+    order = request.args.get('order', 'relevance')
+
+    browse = facets.browse_facets()
+    if not (q or location or min_price is not None or max_price is not None):
+        return render_template('search.html', posts=None, next_cursor=None, facets=browse)
+
+    query = feed_query()
+    if location:
+        query = query.filter(Post.user_id.in_(
+            db.session.query(User.id).filter(User.location.istartswith(location, autoescape=True))
+        ))
+    if min_price is not None:
+        query = query.filter(Post.price >= min_price)
+    if max_price is not None:
+        query = query.filter(Post.price <= max_price)
+
+    if q:
+        query, score = search_posts(query, q)
+        if order == 'relevance':
+            page = keyset_page(
+                query.add_columns(score),
+                [score, Post.id],
+                cursor=request.args.get('cursor'),
+                per_page=app.config['POSTS_PER_PAGE'],
+                key=lambda row: [row[1], row[0].id]
+            )
+            posts = [row[0] for row in page.items]
+            return render_template('search.html', posts=posts, next_cursor=page.next_cursor, facets=browse)
+
+    page = feed_page(query)
+    return render_template('search.html', posts=page.items, next_cursor=page.next_cursor, facets=browse)
+
+def toggle_reaction_response(post_id, kind):
     if 'user_id' not in session:
         return jsonify({'error': 'Não autorizado'}), 401
-    
-    like = Like.query.filter_by(
-        user_id=session['user_id'],
-        post_id=post_id
-    ).first()
-    
-    if like:
-        db.session.delete(like)
-        db.session.commit()
-        return jsonify({'action': 'unliked'})
-    
-    like = Like(user_id=session['user_id'], post_id=post_id)
-    db.session.add(like)
+    try:
+        current = reactions.toggle_reaction(session['user_id'], post_id, kind)
+    except LookupError:
+        db.session.rollback()
+        return jsonify({'error': 'Postagem não encontrada'}), 404
     db.session.commit()
-    return jsonify({'action': 'liked'})
+    fragment_cache.invalidate(post_id)
+    return jsonify({'action': f'{kind}d' if current else f'un{kind}d'})
+
+@app.route('/post/<int:post_id>/like', methods=['POST'])
+def like_post(post_id):
+    return toggle_reaction_response(post_id, 'like')
 
 @app.route('/post/<int:post_id>/comment', methods=['POST'])
 def add_comment(post_id):
+    # Pedido via fetch (Accept: application/json) recebe só o comentário
+    # novo; o formulário sem JavaScript continua redirecionando
+    wants_json = request.accept_mimetypes.best == 'application/json'
     if 'user_id' not in session:
+        if wants_json:
+            return jsonify({'error': 'Não autorizado'}), 401
         flash('Você precisa estar logado para comentar')
         return redirect(url_for('login'))
     
     content = request.form.get('content')
     if not content:
+        if wants_json:
+            return jsonify({'error': 'O comentário não pode estar vazio'}), 400
         flash('O comentário não pode estar vazio')
         return redirect(url_for('index'))
+
+    if db.session.get(Post, post_id) is None:
+        if wants_json:
+            return jsonify({'error': 'Postagem não encontrada'}), 404
+        flash('Anúncio não encontrado')
+        return redirect(url_for('index'))
     
     comment = Comment(
         content=content,
@@ -121,11 +548,38 @@ def add_comment(post_id):
         post_id=post_id
     )
     db.session.add(comment)
+    counters.bump(post_id, 'comments_count')
+    db.session.flush()
+    trending.record(post_id, ('comment', comment.created_at, 1))
     db.session.commit()
+    fragment_cache.invalidate(post_id)
+
+    if wants_json:
+        comments_count = db.session.query(Post.comments_count).filter(Post.id == post_id).scalar()
+        return jsonify({
+            'post_id': post_id,
+            'comments_count': comments_count,
+            'html': render_template('_comment.html', comment=comment),
+        }), 201
     
     flash('Comentário adicionado com sucesso!')
     return redirect(url_for('index'))
 
+@app.route('/post/<int:post_id>/comments')
+def post_comments(post_id):
+    # Comentários anteriores de uma postagem, paginados por cursor e com
+    # os autores carregados na mesma consulta
+    page = keyset_page(
+        comments_query().filter(Comment.post_id == post_id),
+        [Comment.created_at, Comment.id],
+        cursor=request.args.get('cursor'),
+        per_page=app.config['COMMENTS_PER_PAGE']
+    )
+    # A página vem do mais novo para o mais antigo; exibe em ordem cronológica
+    html = ''.join(render_template('_comment.html', comment=comment) for comment in reversed(page.items))
+    next_url = url_for('post_comments', post_id=post_id, cursor=page.next_cursor) if page.next_cursor else None
+    return jsonify({'html': html, 'next_cursor': page.next_cursor, 'next_url': next_url})
+
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
@@ -195,63 +649,154 @@ def create_post():
         flash('Todos os campos são obrigatórios')
         return redirect(url_for('index'))
     
+    background = app.config['IMAGE_PROCESSING_ASYNC']
+    try:
+        uploads, costs = prepare_images([image for image in images if image and image.filename],
+                                        POST_IMAGE_SIZES, keep=background)
+    except InvalidImage as e:
+        flash(str(e))
+        return redirect(url_for('index'))
+
+    spooled_id = None
     try:
         price = float(price)
         post = Post(content=content, price=price, user_id=session['user_id'])
         db.session.add(post)
         db.session.flush()
+        facets.add_posts([(db.session.get(User, post.user_id).location, post.price)])
+        trending.record(post.id, ('post', post.created_at, 1))
         
-        for i, image in enumerate(images):
-            if image and image.filename:
-                image_data = image.read()
-                photo = Photo(
-                    post_id=post.id,
-                    image_data=process_image(image_data),
-                    is_main=(i == 0)
-                )
-                db.session.add(photo)
-        
-        db.session.commit()
+        if background:
+            # Salva o anúncio já; as fotos chegam quando o pool terminar e
+            # esperam em disco, para o flask resume-photos se o worker cair
+            post.photos_pending = len(uploads)
+            uploads = spool_pending(post.id, uploads)
+            spooled_id = post.id
+            db.session.commit()
+            photo_jobs.submit(finish_post_photos, post.id, uploads, costs)
+        else:
+            variants_list = image_pipeline.map(uploads, POST_IMAGE_SIZES, costs)
+            if not all(variants_list):
+                raise ValueError('Imagem inválida')
+            duplicate_warning = check_duplicate_photos(variants_list, post.user_id)
+            for i, variants in enumerate(variants_list):
+                db.session.add(Photo(post_id=post.id, is_main=(i == 0), **store_image(variants)))
+            db.session.commit()
+            if duplicate_warning:
+                flash(duplicate_warning)
         flash('Anúncio criado com sucesso!')
+    except InvalidImage as e:
+        db.session.rollback()
+        flash(str(e))
     except Exception as e:
         db.session.rollback()
+        if background:
+            for source in uploads:
+                discard_source(source)
+            if spooled_id is not None:
+                discard_pending(spooled_id)
         flash('Erro ao criar anúncio. Por favor, tente novamente.')
     
     return redirect(url_for('index'))
 
+def prepare_images(files, sizes, keep=False):
+    """Valida os uploads pela extensão e pelo cabeçalho, sem decodificar.
+
+    Devolve as fontes (bytes ou caminhos em disco) e a memória estimada de
+    cada uma para o image_pipeline. Com ``keep`` as fontes em disco
+    sobrevivem à requisição e quem processa as apaga.
+    """
+    sources, costs = [], []
+    try:
+        for file in files:
+            if not allowed_file(file.filename):
+                raise InvalidImage('Formato de imagem não suportado. Envie JPEG, PNG, GIF ou WebP.')
+            info = inspect_image(upload_source(file), app.config['MAX_IMAGE_PIXELS'])
+            sources.append(upload_source(file, keep=keep))
+            costs.append(decode_cost(info, sizes))
+    except InvalidImage:
+        if keep:
+            for source in sources:
+                discard_source(source)
+        raise
+    return sources, costs
+
+def check_duplicate_photos(variants_list, user_id):
+    """Aviso (ou None) se uma foto se repete no envio ou em outro anúncio do vendedor.
+
+    O hash perceptual erra com fotos parecidas de verdade (mesmo fundo,
+    mesmo ângulo), então a repetição só é avisada, não recusada.
+    """
+    max_distance = app.config['DUPLICATE_PHOTO_DISTANCE']
+    if max_distance < 0:
+        return None
+    hashes = [variants['full'].get('phash') for variants in variants_list]
+    if duplicates.repeated(hashes, max_distance):
+        return 'Atenção: a mesma foto parece ter sido enviada mais de uma vez.'
+    for phash in hashes:
+        if duplicates.find_duplicates(phash, user_id, max_distance):
+            return 'Atenção: uma das fotos parece já estar em outro anúncio seu.'
+    return None
+
+def finish_post_photos(post_id, uploads, costs=None):
+    with app.app_context():
+        try:
+            variants_list = [v for v in image_pipeline.map(uploads, POST_IMAGE_SIZES, costs) if v]
+            duplicate_warning = check_duplicate_photos(variants_list, db.session.get(Post, post_id).user_id)
+            if duplicate_warning:
+                # O anúncio já foi publicado: só registra a repetição
+                app.logger.warning(f"Anúncio {post_id}: {duplicate_warning}")
+            for i, variants in enumerate(variants_list):
+                db.session.add(Photo(post_id=post_id, is_main=(i == 0), **store_image(variants)))
+            finished = Post.query.filter(Post.id == post_id, Post.photos_pending > 0).update(
+                {Post.photos_pending: 0}, synchronize_session=False)
+            if not finished:
+                # Outro processo (flask resume-photos) já terminou este anúncio
+                db.session.rollback()
+                return
+            db.session.commit()
+            fragment_cache.invalidate(post_id)
+        except Exception as e:
+            # O anúncio pode ter sido excluído enquanto as fotos eram processadas
+            db.session.rollback()
+            app.logger.error(f"Erro ao processar fotos do anúncio {post_id}: {str(e)}")
+            # Sem as fotos, o anúncio não deve ficar "processando" para sempre
+            try:
+                Post.query.filter_by(id=post_id).update({Post.photos_pending: 0}, synchronize_session=False)
+                db.session.commit()
+                fragment_cache.invalidate(post_id)
+            except Exception:
+                db.session.rollback()
+        finally:
+            for source in uploads:
+                discard_source(source)
+            discard_pending(post_id)
+
 @app.route('/profile_image/<int:user_id>')
 def profile_image(user_id):
     try:
         profile_photo = ProfilePhoto.query.filter_by(user_id=user_id).first()
         if profile_photo:
-            return send_file(
-                io.BytesIO(profile_photo.image_data),
-                mimetype='image/jpeg',
-                cache_timeout=0
-            )
-        return send_file('static/img/default_profile.png', mimetype='image/png', cache_timeout=0)
+            return send_image(profile_photo)
+        return send_file('static/img/default_profile.png', mimetype='image/png', max_age=0)
     except Exception as e:
         app.logger.error(f"Erro ao carregar imagem do perfil: {str(e)}")
-        return send_file('static/img/default_profile.png', mimetype='image/png', cache_timeout=0)
+        return send_file('static/img/default_profile.png', mimetype='image/png', max_age=0)
 
 @app.route('/post_image/<int:photo_id>')
 def post_image(photo_id):
     try:
         photo = Photo.query.get_or_404(photo_id)
-        return send_file(
-            io.BytesIO(photo.image_data),
-            mimetype='image/jpeg',
-            cache_timeout=0
-        )
+        return send_image(photo)
     except Exception as e:
         app.logger.error(f"Erro ao carregar imagem do post: {str(e)}")
-        return send_file('static/img/default_post.png', mimetype='image/png', cache_timeout=0)
+        return send_file('static/img/default_post.png', mimetype='image/png', max_age=0)
 
 @app.route('/user/<int:user_id>')
 def user_profile(user_id):
     user = User.query.get_or_404(user_id)
-    user_posts = Post.query.filter_by(user_id=user_id).order_by(Post.created_at.desc()).all()
-    return render_template('user_profile.html', user=user, posts=user_posts)
+    page = feed_page(feed_query().filter(Post.user_id == user_id))
+    return render_template('user_profile.html', user=user, posts=page.items, next_cursor=page.next_cursor)
 
 @app.route('/post/<int:post_id>/delete', methods=['POST'])
 def delete_post(post_id):
@@ -265,15 +810,17 @@ def delete_post(post_id):
         flash('Você não tem permissão para excluir este anúncio')
         return redirect(url_for('index'))
     
-    db.session.delete(post)
-    db.session.commit()
-    flash('Anúncio excluído com sucesso!')
+    schedule_deletion('post', post_id)
+    flash('Exclusão do anúncio agendada. Ele sai do ar em instantes.')
     return redirect(url_for('index'))
 
 @app.route('/announcements')
 def announcements():
-    posts = Post.query.order_by(Post.created_at.desc()).all()
-    return render_template('announcements.html', posts=posts)
+    page = feed_page()
+    liked_ids, disliked_ids = reaction_state(page.items)
+    comments = latest_comments([post.id for post in page.items])
+    return render_template('announcements.html', posts=page.items, next_cursor=page.next_cursor,
+                           liked_ids=liked_ids, disliked_ids=disliked_ids, comments=comments)
 
 @app.route('/user/<int:user_id>/delete', methods=['POST'])
 def delete_user(user_id):
@@ -286,43 +833,214 @@ def delete_user(user_id):
         return redirect(url_for('index'))
     
     user = User.query.get_or_404(user_id)
-    db.session.delete(user)
-    db.session.commit()
-    flash('Usuário excluído com sucesso!')
+    job = schedule_deletion('user', user.id)
+    flash(f'Exclusão do usuário {user.username} iniciada. '
+          f'Acompanhe em {url_for("deletion_status", job_id=job.id)}')
     return redirect(url_for('index'))
 
+def schedule_deletion(kind, target_id):
+    # Registra o job e o executa em segundo plano; um job já aberto para o
+    # mesmo alvo não é disparado de novo
+    job = deletions.schedule(kind, target_id, session.get('user_id'))
+    if job.status == 'pending':
+        deletion_jobs.submit(run_deletion, job.id)
+    return job
+
+def deleted_posts(post_ids):
+    fragment_cache.invalidate(*post_ids)
+    sidebar_cache.clear()
+
+def run_deletion(job_id):
+    with app.app_context():
+        try:
+            deletions.run(job_id, batch_size=app.config['DELETION_BATCH_SIZE'],
+                          on_posts_deleted=deleted_posts, log=app.logger.info,
+                          lease=app.config['DELETION_LEASE_SECONDS'])
+        except Exception as e:
+            app.logger.error(f"Erro na exclusão {job_id}: {str(e)}")
+
+@app.route('/deletions/<int:job_id>')
+def deletion_status(job_id):
+    job = db.session.get(DeletionJob, job_id)
+    if job is None or not (session.get('is_admin') or job.requested_by == session.get('user_id')):
+        return jsonify({'error': 'Exclusão não encontrada'}), 404
+    return jsonify(deletions.status(job))
+
 @app.route('/post/<int:post_id>/dislike', methods=['POST'])
 def dislike_post(post_id):
+    return toggle_reaction_response(post_id, 'dislike')
+
+REACTIONS_BATCH_LIMIT = 100
+
+@app.route('/reactions', methods=['POST'])
+def batch_reactions():
+    """Aplica várias reações numa só requisição e transação.
+
+    Corpo: ``{"reactions": [{"post_id": 1, "kind": "like"}, ...]}``, com
+    ``kind`` igual a "like", "dislike" ou null (remove). Cada item define o
+    estado final, então reenviar o mesmo lote é seguro.
+    """
     if 'user_id' not in session:
         return jsonify({'error': 'Não autorizado'}), 401
-    
-    post = Post.query.get_or_404(post_id)
-    user_id = session['user_id']
-    
-    # Verifica se já existe um dislike
-    dislike = Dislike.query.filter_by(user_id=user_id, post_id=post_id).first()
-    
-    if dislike:
-        # Se já existe, remove o dislike
-        db.session.delete(dislike)
-        db.session.commit()
-        return jsonify({'action': 'undisliked'})
-    else:
-        # Remove like se existir
-        like = Like.query.filter_by(user_id=user_id, post_id=post_id).first()
-        if like:
-            db.session.delete(like)
-        
-        # Adiciona o dislike
-        new_dislike = Dislike(user_id=user_id, post_id=post_id)
-        db.session.add(new_dislike)
-        db.session.commit()
-        return jsonify({'action': 'disliked'})
+
+    payload = request.get_json(silent=True)
+    items = payload.get('reactions') if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Envie uma lista em "reactions"'}), 400
+    if len(items) > REACTIONS_BATCH_LIMIT:
+        return jsonify({'error': f'Máximo de {REACTIONS_BATCH_LIMIT} reações por requisição'}), 400
+
+    # O último pedido para a mesma postagem prevalece
+    wanted = {}
+    for item in items:
+        # bool é subclasse de int: true viraria a postagem 1
+        post_id = item.get('post_id') if isinstance(item, dict) else None
+        if not isinstance(post_id, int) or isinstance(post_id, bool) \
+                or item.get('kind') not in (*reactions.KINDS, None):
+            return jsonify({'error': 'Item inválido', 'item': item}), 400
+        wanted[item['post_id']] = item['kind']
+
+    existing = {row[0] for row in db.session.query(Post.id).filter(Post.id.in_(wanted))}
+    changed = [post_id for post_id, kind in wanted.items()
+               if post_id in existing and reactions.set_reaction(session['user_id'], post_id, kind)]
+    db.session.commit()
+    fragment_cache.invalidate(*changed)
+
+    totals = {row.id: row for row in db.session.query(Post.id, Post.likes_count, Post.dislikes_count)
+                                                .filter(Post.id.in_(existing))}
+    return jsonify({'reactions': [
+        {'post_id': post_id, 'kind': kind, 'likes_count': totals[post_id].likes_count,
+         'dislikes_count': totals[post_id].dislikes_count}
+        if post_id in existing else {'post_id': post_id, 'error': 'Postagem não encontrada'}
+        for post_id, kind in wanted.items()
+    ]})
+
+# API JSON somente leitura: imagens vão como URLs das variantes, nunca o conteúdo
+
+def api_user_summary(user):
+    return {'id': user.id, 'username': user.username, 'avatar_url': profile_image_url(user, 'thumb')}
+
+API_USER_FIELDS = {
+    'id': lambda user: user.id,
+    'username': lambda user: user.username,
+    'location': lambda user: user.location,
+    'created_at': lambda user: user.created_at.isoformat() if user.created_at else None,
+    'avatar_url': lambda user: profile_image_url(user, 'thumb'),
+}
+
+API_POST_FIELDS = {
+    'id': lambda post: post.id,
+    'content': lambda post: post.content,
+    'price': lambda post: str(post.price),
+    'created_at': lambda post: post.created_at.isoformat() if post.created_at else None,
+    'user': lambda post: api_user_summary(post.post_user) if post.post_user else None,
+    'likes_count': lambda post: post.likes_count,
+    'dislikes_count': lambda post: post.dislikes_count,
+    'comments_count': lambda post: post.comments_count,
+    'photos_pending': lambda post: post.photos_pending,
+    'photos': lambda post: [
+        {'id': photo.id, 'thumb_url': post_image_url(photo, 'thumb'), 'card_url': post_image_url(photo, 'card'),
+         'width': photo.width, 'height': photo.height}
+        for photo in post.post_photos
+    ],
+}
+
+API_COMMENT_FIELDS = {
+    'id': lambda comment: comment.id,
+    'post_id': lambda comment: comment.post_id,
+    'content': lambda comment: comment.content,
+    'created_at': lambda comment: comment.created_at.isoformat() if comment.created_at else None,
+    'user': lambda comment: api_user_summary(comment.comment_user) if comment.comment_user else None,
+}
+
+def api_posts_query(fields):
+    # Só carrega as relações dos campos pedidos
+    query = Post.query
+    if 'user' in fields:
+        query = query.options(joinedload(Post.post_user).joinedload(User.profile_photo))
+    if 'photos' in fields:
+        query = query.options(selectinload(Post.post_photos))
+    return query
+
+@app.route('/api/posts')
+def api_posts():
+    fields = api.requested_fields(API_POST_FIELDS)
+    query = api_posts_query(fields)
+    if request.args.get('user_id', type=int):
+        query = query.filter(Post.user_id == request.args.get('user_id', type=int))
+    order = feed_order()
+    return api.listing(query, FEED_ORDERS[order], API_POST_FIELDS, fields, app.config['POSTS_PER_PAGE'],
+                       scope=feed_scope(order))
+
+@app.route('/api/posts/<int:post_id>')
+def api_post(post_id):
+    fields = api.requested_fields(API_POST_FIELDS)
+    post = api_posts_query(fields).filter(Post.id == post_id).first()
+    if post is None:
+        api.error('Postagem não encontrada', 404)
+    return api.json_response(api.serialize(post, API_POST_FIELDS, fields))
+
+@app.route('/api/posts/<int:post_id>/comments')
+def api_post_comments(post_id):
+    fields = api.requested_fields(API_COMMENT_FIELDS)
+    query = Comment.query.filter(Comment.post_id == post_id)
+    if 'user' in fields:
+        query = query.options(joinedload(Comment.comment_user).joinedload(User.profile_photo))
+    return api.listing(query, [Comment.created_at, Comment.id], API_COMMENT_FIELDS, fields,
+                       app.config['POSTS_PER_PAGE'])
+
+@app.route('/api/users')
+def api_users():
+    fields = api.requested_fields(API_USER_FIELDS)
+    query = User.query
+    if 'avatar_url' in fields:
+        query = query.options(joinedload(User.profile_photo))
+    return api.listing(query, [User.created_at, User.id], API_USER_FIELDS, fields, app.config['POSTS_PER_PAGE'])
+
+@app.route('/api/users/<int:user_id>')
+def api_user(user_id):
+    fields = api.requested_fields(API_USER_FIELDS)
+    user = User.query.options(joinedload(User.profile_photo)).filter(User.id == user_id).first()
+    if user is None:
+        api.error('Usuário não encontrado', 404)
+    return api.json_response(api.serialize(user, API_USER_FIELDS, fields))
 
 @app.route('/curriculos')
 def curriculos():
-    curriculos = Curriculo.query.order_by(Curriculo.created_at.desc()).all()
-    return render_template('curriculos.html', curriculos=curriculos)
+    page = keyset_page(
+        Curriculo.query,
+        [Curriculo.created_at, Curriculo.id],
+        cursor=request.args.get('cursor'),
+        per_page=app.config['POSTS_PER_PAGE']
+    )
+    # Currículos de antes do storage ainda com o PDF na tabela: o tamanho
+    # vem do banco, sem carregar o conteúdo
+    legacy_pdfs = dict(db.session.query(Curriculo.id, func.length(Curriculo.curriculo_pdf)).filter(
+        Curriculo.id.in_([curriculo.id for curriculo in page.items]),
+        Curriculo.pdf_hash.is_(None),
+        Curriculo.curriculo_pdf.isnot(None),
+    ))
+    return render_template('curriculos.html', curriculos=page.items, next_cursor=page.next_cursor,
+                           legacy_pdfs=legacy_pdfs)
+
+@app.template_filter('filesize')
+def filesize_filter(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024 or unit == 'MB':
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+
+def upload_size(file):
+    # Mede o upload pelo fim do stream, sem carregá-lo na memória
+    file.stream.seek(0, os.SEEK_END)
+    size = file.stream.tell()
+    file.stream.seek(0)
+    return size
+
+def is_pdf(file):
+    header = file.stream.read(5)
+    file.stream.seek(0)
+    return header == b'%PDF-' and file.filename.lower().endswith('.pdf')
 
 @app.route('/curriculo/create', methods=['POST'])
 @login_required
@@ -337,11 +1055,19 @@ def create_curriculo():
         habilidades = request.form['habilidades']
         objetivo = request.form['objetivo']
         
-        curriculo_pdf = None
+        pdf_hash = pdf_size = None
         if 'curriculo_pdf' in request.files:
             file = request.files['curriculo_pdf']
             if file and file.filename:
-                curriculo_pdf = file.read()
+                # Valida tipo e tamanho antes de gravar; o conteúdo vai em partes para o storage
+                if not is_pdf(file):
+                    flash('O currículo deve ser um arquivo PDF.', 'danger')
+                    return redirect(url_for('curriculos'))
+                pdf_size = upload_size(file)
+                if pdf_size > app.config['CURRICULO_MAX_SIZE']:
+                    flash('O PDF do currículo é grande demais.', 'danger')
+                    return redirect(url_for('curriculos'))
+                pdf_hash = storage.blob_store().put(file.stream)
         
         new_curriculo = Curriculo(
             user_id=session['user_id'],
@@ -353,7 +1079,8 @@ def create_curriculo():
             formacao=formacao,
             habilidades=habilidades,
             objetivo=objetivo,
-            curriculo_pdf=curriculo_pdf
+            pdf_hash=pdf_hash,
+            pdf_size=pdf_size
         )
         
         db.session.add(new_curriculo)
@@ -365,16 +1092,27 @@ def create_curriculo():
 @app.route('/curriculo/<int:curriculo_id>/download')
 def download_curriculo(curriculo_id):
     curriculo = Curriculo.query.get_or_404(curriculo_id)
-    if not curriculo.curriculo_pdf:
-        flash('Este currículo não possui arquivo PDF.', 'warning')
-        return redirect(url_for('curriculos'))
+    download_name = f'curriculo_{curriculo.nome_completo}.pdf'
+    if curriculo.pdf_hash:
+        # ETag pelo hash do conteúdo; Range e envio em partes ficam com o Werkzeug
+        return send_stored(
+            curriculo.pdf_hash,
+            'application/pdf',
+            as_attachment=True,
+            download_name=download_name,
+            etag=curriculo.pdf_hash,
+            last_modified=curriculo.updated_at
+        )
+    if curriculo.curriculo_pdf:
+        return send_file(
+            io.BytesIO(curriculo.curriculo_pdf),
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name=download_name
+        )
     
-    return send_file(
-        io.BytesIO(curriculo.curriculo_pdf),
-        mimetype='application/pdf',
-        as_attachment=True,
-        download_name=f'curriculo_{curriculo.nome_completo}.pdf'
-    )
+    flash('Este currículo não possui arquivo PDF.', 'warning')
+    return redirect(url_for('curriculos'))
 
 @app.route('/upload_profile_picture', methods=['POST'])
 @login_required
@@ -390,26 +1128,34 @@ def upload_profile_picture():
     
     if file:
         try:
-            # Lê a imagem
-            image_data = file.read()
-            
-            # Processa a imagem para o perfil (400x400 para melhor qualidade)
-            processed_image = process_image(image_data, max_size=(400, 400))
+            # Confere o cabeçalho antes de decodificar; o upload não é lido para a memória
+            sources, costs = prepare_images([file], PROFILE_IMAGE_SIZES)
+        except InvalidImage as e:
+            flash(str(e), 'error')
+            return redirect(url_for('user_profile', user_id=session['user_id']))
+
+        try:
+            # Processa a imagem para o perfil (até 400x400 e versões menores)
+            processed_image = image_pipeline.map(sources, PROFILE_IMAGE_SIZES, costs)[0]
             
             if processed_image:
                 # Atualiza ou cria a foto de perfil
+                blob = store_image(processed_image)
                 profile_photo = ProfilePhoto.query.filter_by(user_id=session['user_id']).first()
                 if profile_photo:
-                    profile_photo.image_data = processed_image
+                    for field, value in blob.items():
+                        setattr(profile_photo, field, value)
+                    profile_photo.image_data = None
                     profile_photo.updated_at = datetime.utcnow()
                 else:
-                    profile_photo = ProfilePhoto(
-                        user_id=session['user_id'],
-                        image_data=processed_image
-                    )
+                    profile_photo = ProfilePhoto(user_id=session['user_id'], **blob)
                     db.session.add(profile_photo)
                 
                 db.session.commit()
+                # Os cards em cache trazem a URL versionada do avatar de quem comentou
+                commented = db.session.query(Comment.post_id).filter(Comment.user_id == session['user_id']).distinct()
+                fragment_cache.invalidate(*[post_id for post_id, in commented])
+                sidebar_cache.clear()
                 flash('Foto de perfil atualizada com sucesso!', 'success')
             else:
                 flash('Erro ao processar a imagem', 'error')
@@ -419,9 +1165,234 @@ def upload_profile_picture():
     
     return redirect(url_for('user_profile', user_id=session['user_id']))
 
+@app.cli.command('seed')
+@click.option('--users', default=50, show_default=True)
+@click.option('--posts', default=500, show_default=True)
+@click.option('--photos-per-post', default=3, show_default=True, help='Máximo de fotos por anúncio.')
+@click.option('--likes-per-post', default=10, show_default=True, help='Média de reações por anúncio.')
+@click.option('--comments-per-post', default=5, show_default=True, help='Média de comentários por anúncio.')
+@click.option('--curriculos', default=50, show_default=True)
+@click.option('--image-size', default='3024x4032', show_default=True, help='Tamanho das fotos de origem.')
+@click.option('--random-seed', default=42, show_default=True)
+def seed_command(users, posts, photos_per_post, likes_per_post, comments_per_post, curriculos, image_size, random_seed):
+    """Preenche o banco com dados sintéticos para testes de carga."""
+    from seed import seed
+    width, height = (int(v) for v in image_size.lower().split('x'))
+    db.create_all()
+    totals = seed(store_image, users=users, posts=posts, photos_per_post=photos_per_post,
+                  likes_per_post=likes_per_post, comments_per_post=comments_per_post,
+                  curriculos=curriculos, source_size=(width, height), random_seed=random_seed)
+    print(', '.join(f'{count} {name}' for name, count in totals.items()) + ' criados')
+
+@app.cli.command('import-catalog')
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.option('--images', 'image_dir', type=click.Path(exists=True, file_okay=False), default='.',
+              show_default=True, help='Diretório base dos caminhos de imagem do manifesto.')
+@click.option('--user', 'username', required=True, help='Usuário dono dos anúncios importados.')
+@click.option('--batch-size', default=50, show_default=True, help='Anúncios por transação.')
+@click.option('--workers', default=default_workers(), show_default=True, help='Processos de imagem.')
+def import_catalog_command(manifest, image_dir, username, batch_size, workers):
+    """Importa anúncios de um manifesto CSV/JSONL; pode ser retomado."""
+    from catalog import import_catalog
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.UsageError(f'Usuário não encontrado: {username}')
+    pipeline = ImagePipeline(workers, queue_limit=max(1, workers) * 4)
+    try:
+        progress, rate = import_catalog(manifest, image_dir, user.id, pipeline, store_image, batch_size=batch_size)
+    finally:
+        pipeline.shutdown()
+    print(f'{progress.posts_created} anúncio(s) importado(s), {progress.records_failed} ignorado(s); '
+          f'{rate:.1f} anúncios/s')
+
+@app.cli.command('export-catalog')
+@click.argument('output', type=click.Path(dir_okay=False))
+@click.option('--user', 'username', help='Exporta só os anúncios deste usuário.')
+def export_catalog_command(output, username):
+    """Exporta anúncios e fotos para um .tar.gz (manifest.jsonl + images/)."""
+    from catalog import export_catalog
+    user_id = None
+    if username:
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.UsageError(f'Usuário não encontrado: {username}')
+        user_id = user.id
+    exported, rate = export_catalog(output, user_id)
+    print(f'{exported} anúncio(s) exportado(s) para {output}; {rate:.1f} anúncios/s')
+
+@app.cli.command('init-search')
+def init_search_command():
+    """Cria (ou atualiza) o índice de busca de texto das postagens."""
+    ensure_search_index()
+    print('Índice de busca criado com sucesso!')
+
+@app.cli.command('db-upgrade')
+@click.option('--dry-run', is_flag=True, help='Só lista as migrações pendentes.')
+def db_upgrade_command(dry_run):
+    """Aplica as migrações pendentes do esquema (ver migrations.py)."""
+    if dry_run:
+        for migration in migrations.pending_migrations():
+            print(f'{migration.version}: {migration.description}')
+        return
+    applied = migrations.upgrade()
+    print(f'{len(applied)} migração(ões) aplicada(s); esquema atualizado.')
+
+@app.cli.command('rebuild-facets')
+def rebuild_facets_command():
+    """Recalcula as facetas de localização e preço da busca."""
+    facets.rebuild()
+    print('Facetas recalculadas com sucesso!')
+
+@app.cli.command('decay-trending')
+@click.option('--recompute', is_flag=True, help='Recalcula tudo a partir das reações e comentários.')
+def decay_trending_command(recompute):
+    """Reescalona as pontuações de tendência (para rodar num agendador)."""
+    if recompute:
+        trending.recompute()
+        db.session.commit()
+    trending.rebase()
+    print('Pontuações de tendência atualizadas!')
+
+@app.cli.command('resume-deletions')
+def resume_deletions_command():
+    """Retoma as exclusões interrompidas (com erro, ou paradas há DELETION_LEASE_SECONDS)."""
+    lease = app.config['DELETION_LEASE_SECONDS']
+    job_ids = deletions.resumable(lease)
+    for job_id in job_ids:
+        job = deletions.run(job_id, batch_size=app.config['DELETION_BATCH_SIZE'],
+                            on_posts_deleted=deleted_posts, lease=lease)
+        if job is None:
+            print(f'Exclusão {job_id}: já retomada por outro processo')
+            continue
+        print(f'Exclusão {job.id}: {job.posts_deleted} anúncio(s), {job.blobs_deleted} arquivo(s) removidos')
+    if not job_ids:
+        print('Nenhuma exclusão pendente.')
+
+@app.cli.command('resume-photos')
+def resume_photos_command():
+    """Processa as fotos de anúncios parados há PHOTO_JOB_STALE_SECONDS (worker reiniciado)."""
+    cutoff = datetime.utcnow() - timedelta(seconds=app.config['PHOTO_JOB_STALE_SECONDS'])
+    post_ids = [post_id for (post_id,) in db.session.query(Post.id).filter(
+        Post.photos_pending > 0, Post.created_at < cutoff)]
+    for post_id in post_ids:
+        sources = pending_sources(post_id)
+        if sources:
+            finish_post_photos(post_id, sources)
+            print(f'Anúncio {post_id}: {len(sources)} foto(s) processada(s)')
+        else:
+            # Os arquivos se perderam (ex.: a pasta temporária foi limpa)
+            Post.query.filter_by(id=post_id).update({Post.photos_pending: 0}, synchronize_session=False)
+            db.session.commit()
+            fragment_cache.invalidate(post_id)
+            print(f'Anúncio {post_id}: fotos perdidas, publicado sem elas')
+    if not post_ids:
+        print('Nenhum anúncio com fotos pendentes.')
+
+@app.cli.command('sweep-blobs')
+def sweep_blobs_command():
+    """Apaga os arquivos que as exclusões deixaram para depois (para rodar num agendador)."""
+    removed = deletions.sweep_blobs()
+    print(f'{removed} arquivo(s) removido(s)')
+
+@app.cli.command('profile-token')
+def profile_token_command():
+    """Gera o valor do cabeçalho X-Debug-Profile para perfilar uma requisição."""
+    if not app.config['PROFILE_HEADER_ENABLED']:
+        raise click.UsageError('Defina PROFILE_HEADER_ENABLED=true e uma SECRET_KEY para aceitar o cabeçalho.')
+    print(profiler.make_token(app.config['SECRET_KEY']))
+    print(f'Válido por {app.config["PROFILE_TOKEN_MAX_AGE"]} segundos.')
+
+@app.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Recalcula curtidas, não curtidas e comentários de cada postagem."""
+    counters.reconcile()
+    print('Contadores recalculados com sucesso!')
+
+def migrate_legacy_blobs(model, legacy_column, batch_size, apply_blob):
+    # Percorre as linhas com conteúdo legado em lotes ordenados por id,
+    # carregando apenas um lote de blobs por vez na memória
+    last_id = 0
+    migrated = 0
+    while True:
+        rows = (model.query
+                .options(undefer(legacy_column))
+                .filter(model.id > last_id, legacy_column.isnot(None))
+                .order_by(model.id)
+                .limit(batch_size)
+                .all())
+        if not rows:
+            return migrated
+        for row in rows:
+            # Linhas que não puderam ser convertidas mantêm o conteúdo legado
+            if apply_blob(row, getattr(row, legacy_column.key)):
+                setattr(row, legacy_column.key, None)
+                migrated += 1
+        last_id = rows[-1].id
+        db.session.commit()
+        db.session.expunge_all()
+
+def apply_image_blob(row, data):
+    sizes = PROFILE_IMAGE_SIZES if isinstance(row, ProfilePhoto) else POST_IMAGE_SIZES
+    variants = process_image(data, sizes)
+    if not variants:
+        return False
+    for field, value in store_image(variants).items():
+        setattr(row, field, value)
+    return True
+
+def apply_pdf_blob(row, data):
+    row.pdf_hash = storage.blob_store().put(data)
+    row.pdf_size = len(data)
+    return True
+
+@app.cli.command('migrate-blobs')
+@click.option('--batch-size', default=100, show_default=True, help='Linhas por transação.')
+def migrate_blobs_command(batch_size):
+    """Move imagens e PDFs gravados no banco para o storage de arquivos."""
+    for model, column, apply_blob in ((Photo, Photo.image_data, apply_image_blob),
+                                      (ProfilePhoto, ProfilePhoto.image_data, apply_image_blob),
+                                      (Curriculo, Curriculo.curriculo_pdf, apply_pdf_blob)):
+        migrated = migrate_legacy_blobs(model, column, batch_size, apply_blob)
+        print(f'{model.__tablename__}: {migrated} arquivo(s) migrado(s)')
+
+@app.cli.command('backfill-phash')
+@click.option('--batch-size', default=200, show_default=True, help='Fotos por transação.')
+def backfill_phash_command(batch_size):
+    """Calcula o hash perceptual das fotos de anúncio que ainda não têm."""
+    last_id = 0
+    hashed = failed = 0
+    while True:
+        photos = (Photo.query
+                  .options(undefer(Photo.image_data))
+                  .filter(Photo.id > last_id, Photo.phash.is_(None))
+                  .order_by(Photo.id)
+                  .limit(batch_size)
+                  .all())
+        if not photos:
+            break
+        for photo in photos:
+            # A miniatura basta: o hash é calculado sobre uma imagem 9x8
+            blob_hash, _ = image_blob(photo, 'thumb', 'jpeg')
+            try:
+                if blob_hash:
+                    with storage.blob_store().open(blob_hash) as f:
+                        data = f.read()
+                else:
+                    data = photo.image_data
+                with Image.open(io.BytesIO(data)) as img:
+                    photo.phash = perceptual_hash(img)
+                hashed += 1
+            except Exception as e:
+                app.logger.error(f"Foto {photo.id} sem hash perceptual: {str(e)}")
+                failed += 1
+        last_id = photos[-1].id
+        db.session.commit()
+        db.session.expunge_all()
+        print(f'{hashed} foto(s) com hash, {failed} com erro')
+
 def allowed_file(filename):
     return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif'}
+           filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
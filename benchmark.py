@@ -0,0 +1,189 @@
+"""Benchmark das rotas principais contra o banco configurado em DATABASE_URL.
+
+Uso típico (banco descartável, populado com ``flask seed``):
+
+    DATABASE_URL=sqlite:///bench.db flask --app app seed --posts 2000
+    DATABASE_URL=sqlite:///bench.db python benchmark.py --output antes.json
+    DATABASE_URL=sqlite:///bench.db python benchmark.py --compare antes.json
+
+Cada rota é medida em duas passadas: uma só de tempo (latência p50/p95/p99,
+vazão e número de consultas SQL) e outra curta com tracemalloc para o pico
+de memória, que sozinho distorceria as latências.
+"""
+import argparse
+import functools
+import io
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from PIL import Image, ImageDraw
+from sqlalchemy import event, func
+
+from app import app, db
+from models import User, Post, Photo
+
+MEMORY_SAMPLES = 5
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+@functools.lru_cache(maxsize=1)
+def _noise():
+    return Image.effect_noise((2048, 1536), 64).convert('RGB')
+
+
+def sample_image(rng):
+    # Uma foto diferente por requisição: com a mesma imagem o create_post
+    # mediria o aviso de foto repetida, não o envio normal
+    img = _noise().copy()
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.randrange(1900), rng.randrange(1400)
+        draw.rectangle((x, y, x + rng.randrange(50, 600), y + rng.randrange(50, 600)),
+                       fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def build_routes(rng):
+    with app.app_context():
+        user_ids = [row[0] for row in db.session.query(User.id).limit(1000)]
+        post_ids = [row[0] for row in db.session.query(Post.id).order_by(func.random()).limit(1000)]
+        photo_ids = [row[0] for row in db.session.query(Photo.id).order_by(func.random()).limit(1000)]
+    if not (user_ids and post_ids and photo_ids):
+        sys.exit('Banco vazio: rode "flask seed" antes do benchmark.')
+
+    # Nome -> (método, função que gera (url, kwargs) a cada requisição)
+    return {
+        'index': ('GET', lambda: ('/', {})),
+        'announcements': ('GET', lambda: ('/announcements', {})),
+        'user_profile': ('GET', lambda: (f'/user/{rng.choice(user_ids)}', {})),
+        'post_image': ('GET', lambda: (f'/post_image/{rng.choice(photo_ids)}?size=card', {})),
+        'like_post': ('POST', lambda: (f'/post/{rng.choice(post_ids)}/like', {})),
+        'create_post': ('POST', lambda: ('/create_post', {
+            'data': {'content': 'Anúncio de benchmark', 'price': '10',
+                     'images': [(io.BytesIO(sample_image(rng)), 'foto.jpg')]},
+            'content_type': 'multipart/form-data',
+        })),
+        'curriculos': ('GET', lambda: ('/curriculos', {})),
+    }
+
+
+def run_route(client, method, make_request, requests, counter):
+    latencies = []
+    queries = 0
+    for _ in range(requests):
+        url, kwargs = make_request()
+        counter['queries'] = 0
+        t0 = time.perf_counter()
+        response = client.open(url, method=method, **kwargs)
+        response.get_data()
+        latencies.append(time.perf_counter() - t0)
+        queries += counter['queries']
+        if response.status_code >= 500:
+            raise RuntimeError(f'{method} {url} respondeu {response.status_code}')
+
+    tracemalloc.start()
+    for _ in range(MEMORY_SAMPLES):
+        url, kwargs = make_request()
+        client.open(url, method=method, **kwargs).get_data()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'requests': requests,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        # Só o tempo das requisições: gerar a foto do create_post fica de fora
+        'throughput_rps': requests / sum(latencies),
+        'queries_per_request': queries / requests,
+        'peak_memory_kb': peak / 1024,
+    }
+
+
+def compare(current, baseline, threshold):
+    # Regressão: p95 piora além do limite ou aumenta o número de consultas
+    regressions = []
+    for route, result in current['routes'].items():
+        before = baseline['routes'].get(route)
+        if not before:
+            continue
+        if result['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f"{route}: p95 {before['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+        if result['queries_per_request'] > before['queries_per_request'] + 0.01:
+            regressions.append(f"{route}: consultas {before['queries_per_request']:.1f} -> "
+                               f"{result['queries_per_request']:.1f} por requisição")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100, help='Requisições medidas por rota.')
+    parser.add_argument('--warmup', type=int, default=5, help='Requisições descartadas por rota.')
+    parser.add_argument('--routes', nargs='*', help='Rotas a medir (padrão: todas).')
+    parser.add_argument('--random-seed', type=int, default=42)
+    parser.add_argument('--output', help='Grava os resultados em JSON neste arquivo.')
+    parser.add_argument('--compare', help='JSON de uma execução anterior para comparar.')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Piora relativa tolerada no p95.')
+    args = parser.parse_args()
+
+    rng = random.Random(args.random_seed)
+    routes = build_routes(rng)
+    selected = args.routes or list(routes)
+
+    counter = {'queries': 0}
+    with app.app_context():
+        # Principal e réplica: com DATABASE_REPLICA_URL as leituras GET vão para ela
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute',
+                         lambda *a: counter.__setitem__('queries', counter['queries'] + 1))
+
+    client = app.test_client()
+    with app.app_context():
+        user = db.session.get(User, db.session.query(func.min(User.id)).scalar())
+    with client.session_transaction() as sess:
+        sess['user_id'] = user.id
+        sess['username'] = user.username
+
+    results = {
+        'created_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0],
+        'routes': {},
+    }
+    for name in selected:
+        method, make_request = routes[name]
+        for _ in range(args.warmup):
+            url, kwargs = make_request()
+            client.open(url, method=method, **kwargs).get_data()
+        results['routes'][name] = result = run_route(client, method, make_request, args.requests, counter)
+        print(f"{name:15} p50 {result['p50_ms']:7.1f} ms  p95 {result['p95_ms']:7.1f} ms  "
+              f"p99 {result['p99_ms']:7.1f} ms  {result['throughput_rps']:7.1f} req/s  "
+              f"{result['queries_per_request']:5.1f} SQL  {result['peak_memory_kb']:8.0f} KB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f'REGRESSÃO {line}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
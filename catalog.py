@@ -0,0 +1,252 @@
+"""Importação e exportação de catálogos de anúncios (comandos em app.py).
+
+O manifesto é CSV (colunas ``content``, ``price`` e ``images``, com os
+arquivos separados por ``|``) ou JSONL (``{"content", "price", "images": [...]}``);
+as imagens são caminhos relativos ao diretório informado. A exportação gera
+um .tar.gz com ``manifest.jsonl`` e ``images/`` no mesmo formato, pronto para
+ser importado de novo.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import tarfile
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.orm import selectinload
+
+import facets
+import storage
+import trending
+from images import POST_IMAGE_SIZES
+from models import db, Post, Photo, CatalogImport, User
+from pagination import keyset_batches
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ManifestError(ValueError):
+    pass
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_manifest(path):
+    # Gera (posição, registro) sem carregar o arquivo inteiro
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            for position, row in enumerate(csv.DictReader(f)):
+                images = [name.strip() for name in (row.get('images') or '').split('|') if name.strip()]
+                yield position, {'content': row.get('content'), 'price': row.get('price'), 'images': images}
+        else:
+            position = 0
+            for line in f:
+                if line.strip():
+                    try:
+                        record = json.loads(line)
+                    except ValueError as e:
+                        # Linha quebrada conta como registro com falha, sem parar a importação
+                        record = ManifestError(f'JSON inválido: {e}')
+                    yield position, record
+                    position += 1
+
+
+def parse_listing(record, image_dir):
+    # Valida um registro e lê as suas imagens; ManifestError descarta o anúncio
+    if isinstance(record, ManifestError):
+        raise record
+    if not isinstance(record, dict):
+        raise ManifestError('registro não é um objeto JSON')
+    content = record.get('content') or ''
+    if not isinstance(content, str) or not content.strip():
+        raise ManifestError('sem descrição')
+    content = content.strip()
+    try:
+        price = float(record.get('price'))
+    except (TypeError, ValueError):
+        raise ManifestError(f"preço inválido: {record.get('price')!r}")
+    created_at = None
+    if record.get('created_at'):
+        try:
+            created_at = datetime.fromisoformat(record['created_at'])
+        except (TypeError, ValueError):
+            raise ManifestError(f"data inválida: {record['created_at']!r}")
+    names = record.get('images') or []
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        raise ManifestError(f'lista de imagens inválida: {names!r}')
+    images = []
+    for name in names:
+        path = os.path.join(image_dir, name)
+        if not os.path.isfile(path):
+            raise ManifestError(f'imagem não encontrada: {name}')
+        with open(path, 'rb') as f:
+            images.append(f.read())
+    listing = {'content': content, 'price': price}
+    if created_at:
+        listing['created_at'] = created_at
+    return listing, images
+
+
+def import_batch(batch, pipeline, store_image, user_id, log):
+    """Processa as imagens do lote em paralelo e devolve as linhas a inserir."""
+    listings = []
+    for position, parsed in batch:
+        if isinstance(parsed, ManifestError):
+            log(f'Registro {position + 1} ignorado: {parsed}')
+            continue
+        listings.append((position, parsed))
+
+    # Todas as imagens do lote vão juntas para o pool, na ordem de entrada
+    variants = pipeline.map([image for _, (_, images) in listings for image in images], POST_IMAGE_SIZES)
+    posts, photos = [], []
+    offset = 0
+    for position, (listing, images) in listings:
+        processed = variants[offset:offset + len(images)]
+        offset += len(images)
+        if not all(processed):
+            log(f'Registro {position + 1} ignorado: imagem inválida')
+            continue
+        posts.append(dict(listing, user_id=user_id))
+        photos.append([store_image(v) for v in processed])
+    return posts, photos
+
+
+def import_catalog(manifest_path, image_dir, user_id, pipeline, store_image,
+                   batch_size=50, log=print):
+    """Importa os anúncios do manifesto para ``user_id``, em lotes.
+
+    Cada lote (anúncios, fotos e progresso) é gravado numa única transação;
+    rodar de novo o mesmo manifesto retoma do primeiro lote não gravado.
+    """
+    started = time.perf_counter()
+    manifest_hash = file_hash(manifest_path)
+    progress = CatalogImport.query.filter_by(manifest_hash=manifest_hash, user_id=user_id).first()
+    if progress is None:
+        progress = CatalogImport(manifest_hash=manifest_hash, user_id=user_id,
+                                 records_done=0, posts_created=0, records_failed=0)
+        db.session.add(progress)
+        db.session.commit()
+    elif progress.finished_at:
+        log('Este manifesto já foi importado por completo.')
+        return progress, 0.0
+    elif progress.records_done:
+        log(f'Retomando do registro {progress.records_done + 1}')
+
+    skip = progress.records_done
+    location = db.session.query(User.location).filter(User.id == user_id).scalar()
+    imported = 0
+    batch = []
+
+    def flush():
+        nonlocal imported
+        posts, photos = import_batch(batch, pipeline, store_image, user_id, log)
+        if posts:
+            post_ids = db.session.execute(
+                insert(Post).returning(Post.id, sort_by_parameter_order=True), posts
+            ).scalars().all()
+            db.session.execute(insert(Photo), [
+                dict(photo, post_id=post_id, is_main=(i == 0))
+                for post_id, post_photos in zip(post_ids, photos)
+                for i, photo in enumerate(post_photos)
+            ])
+            facets.add_posts((location, post['price']) for post in posts)
+            trending.recompute(post_ids)
+        progress.records_done += len(batch)
+        progress.posts_created += len(posts)
+        progress.records_failed += len(batch) - len(posts)
+        db.session.commit()
+        imported += len(posts)
+        log(f'{progress.records_done} registros processados, {progress.posts_created} anúncios criados')
+        batch.clear()
+
+    for position, record in read_manifest(manifest_path):
+        if position < skip:
+            continue
+        try:
+            parsed = parse_listing(record, image_dir)
+        except ManifestError as e:
+            parsed = e
+        batch.append((position, parsed))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    progress.finished_at = datetime.utcnow()
+    db.session.commit()
+    elapsed = time.perf_counter() - started
+    return progress, imported / elapsed if elapsed else 0.0
+
+
+def _add_bytes(archive, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    archive.addfile(info, io.BytesIO(data))
+
+
+def _add_blob(archive, name, blob_hash):
+    store = storage.blob_store()
+    path = store.local_path(blob_hash)
+    if path:
+        archive.add(path, arcname=name)
+        return
+    info = tarfile.TarInfo(name)
+    info.size = store.size(blob_hash)
+    info.mtime = int(time.time())
+    with store.open(blob_hash) as f:
+        archive.addfile(info, f)
+
+
+def export_catalog(output, user_id=None, batch_size=500, log=print):
+    """Grava anúncios e fotos num .tar.gz em streaming.
+
+    Os anúncios são lidos em lotes por keyset e cada imagem é copiada do
+    storage direto para o arquivo; na memória fica só um lote por vez. O
+    manifesto vai para um temporário e entra no fim do arquivo.
+    """
+    started = time.perf_counter()
+    query = Post.query.options(selectinload(Post.post_photos))
+    if user_id:
+        query = query.filter(Post.user_id == user_id)
+
+    exported = 0
+    written = set()
+    with tarfile.open(output, 'w:gz') as archive, tempfile.TemporaryFile('w+b') as manifest:
+        for posts in keyset_batches(query, [Post.created_at, Post.id], batch_size):
+            for post in posts:
+                images = []
+                for photo in sorted(post.post_photos, key=lambda photo: (not photo.is_main, photo.id)):
+                    name = f'{photo.blob_hash or f"legado-{photo.id}"}.jpg'
+                    if name not in written:
+                        if photo.blob_hash:
+                            _add_blob(archive, f'images/{name}', photo.blob_hash)
+                        else:
+                            _add_bytes(archive, f'images/{name}', photo.image_data)
+                        written.add(name)
+                    images.append(name)
+                line = {'content': post.content, 'price': str(post.price), 'images': images,
+                        'created_at': post.created_at.isoformat() if post.created_at else None}
+                manifest.write((json.dumps(line, ensure_ascii=False) + '\n').encode())
+                exported += 1
+            db.session.expunge_all()
+            log(f'{exported} anúncios exportados')
+
+        info = tarfile.TarInfo('manifest.jsonl')
+        info.size = manifest.tell()
+        info.mtime = int(time.time())
+        manifest.seek(0)
+        archive.addfile(info, manifest)
+
+    elapsed = time.perf_counter() - started
+    return exported, exported / elapsed if elapsed else 0.0
@@ -0,0 +1,71 @@
+from sqlalchemy import func, select, true, update
+from models import db, Post, Reaction, Comment
+
+# Coluna de contador em Post -> (tabela de origem, filtro das linhas contadas)
+COUNTERS = {
+    'likes_count': (Reaction, Reaction.kind == 'like'),
+    'dislikes_count': (Reaction, Reaction.kind == 'dislike'),
+    'comments_count': (Comment, true()),
+}
+
+
+def bump(post_id, counter, delta=1):
+    adjust(post_id, {counter: delta})
+
+
+def adjust(post_id, deltas):
+    # UPDATE posts SET x = x + dx, y = y + dy: atômico no banco, sem ler a
+    # linha antes, e um único comando mesmo quando vários contadores mudam
+    deltas = {counter: delta for counter, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    db.session.execute(
+        update(Post)
+        .where(Post.id == post_id)
+        .values({getattr(Post, counter): getattr(Post, counter) + delta for counter, delta in deltas.items()})
+        .execution_options(synchronize_session=False)
+    )
+
+
+def remove_user_activity(user_id):
+    # Antes de excluir um usuário, desconta das postagens as curtidas,
+    # não curtidas e comentários que ele deixou e apaga essas linhas.
+    # Devolve os ids das postagens afetadas.
+    affected = set()
+    for counter, (model, condition) in COUNTERS.items():
+        affected.update(
+            row[0] for row in db.session.query(model.post_id).filter(model.user_id == user_id, condition).distinct()
+        )
+        column = getattr(Post, counter)
+        per_post = (
+            select(func.count(model.id))
+            .where(model.post_id == Post.id, model.user_id == user_id, condition)
+            .scalar_subquery()
+        )
+        db.session.execute(
+            update(Post)
+            .where(Post.id.in_(select(model.post_id).where(model.user_id == user_id, condition)))
+            .values({column: column - per_post})
+            .execution_options(synchronize_session=False)
+        )
+        model.query.filter(model.user_id == user_id, condition).delete(synchronize_session=False)
+    return affected
+
+
+def reconcile(connection=None):
+    # Recalcula todos os contadores a partir das tabelas de origem; com
+    # ``connection`` roda dentro da transação de quem chamou (migrações)
+    executor = connection if connection is not None else db.session
+    for counter, (model, condition) in COUNTERS.items():
+        total = (
+            select(func.count(model.id))
+            .where(model.post_id == Post.id, condition)
+            .scalar_subquery()
+        )
+        executor.execute(
+            update(Post)
+            .values({getattr(Post, counter): total})
+            .execution_options(synchronize_session=False)
+        )
+    if connection is None:
+        db.session.commit()
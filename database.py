@@ -0,0 +1,141 @@
+"""Pool de conexões e roteamento de leituras para a réplica.
+
+Com DATABASE_REPLICA_URL definido, as consultas das requisições GET/HEAD
+vão para o bind ``replica``; escritas (flush do ORM, INSERT/UPDATE/DELETE,
+SELECT ... FOR UPDATE), outros métodos, CLI e jobs em segundo plano usam
+sempre o banco principal. Quem acabou de escrever continua lendo do
+principal por REPLICA_READ_YOUR_WRITES_SECONDS, para não ver a réplica
+atrasada sem o que acabou de publicar.
+
+Para testar localmente, duas cópias do arquivo SQLite fazem o papel de
+principal e réplica.
+"""
+import threading
+import time
+
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA = 'replica'
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+class PoolStats:
+    """Esperas por conexão de cada pool, lidas pelo /metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = {}
+        self.wait_seconds = {}
+        self.timeouts = {}
+
+    def register(self, name):
+        with self._lock:
+            self.checkouts.setdefault(name, 0)
+            self.wait_seconds.setdefault(name, 0.0)
+            self.timeouts.setdefault(name, 0)
+
+    def observe(self, name, seconds, timed_out=False):
+        with self._lock:
+            self.checkouts[name] = self.checkouts.get(name, 0) + 1
+            self.wait_seconds[name] = self.wait_seconds.get(name, 0.0) + seconds
+            if timed_out:
+                self.timeouts[name] = self.timeouts.get(name, 0) + 1
+
+
+pool_stats = PoolStats()
+pools = {}
+
+
+class TimedQueuePool(QueuePool):
+    # QueuePool que mede quanto cada checkout esperou por uma conexão livre
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        pools[self.logging_name] = self
+        pool_stats.register(self.logging_name)
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.observe(self.logging_name, time.perf_counter() - started, timed_out=True)
+            raise
+        pool_stats.observe(self.logging_name, time.perf_counter() - started)
+        return connection
+
+
+def engine_options(url, config, name):
+    """Opções de ``create_engine`` para o banco ``url``, conforme as DB_POOL_*."""
+    options = {
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+    }
+    parsed = make_url(url)
+    if parsed.get_backend_name() == 'sqlite' and parsed.database in (None, '', ':memory:'):
+        # SQLite em memória usa um StaticPool (uma conexão só), sem fila
+        return options
+    options.update(
+        poolclass=TimedQueuePool,
+        pool_logging_name=name,
+        pool_size=config['DB_POOL_SIZE'],
+        max_overflow=config['DB_MAX_OVERFLOW'],
+        pool_timeout=config['DB_POOL_TIMEOUT'],
+    )
+    return options
+
+
+def _is_write(clause):
+    if isinstance(clause, UpdateBase):
+        return True
+    return getattr(clause, '_for_update_arg', None) is not None
+
+
+class RoutingSession(Session):
+    """Sessão que manda as leituras das requisições GET para a réplica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if self._flushing or _is_write(clause):
+                # Daqui em diante a requisição lê do principal o que escreveu
+                g.db_read_replica = False
+                g.db_wrote = True
+            elif g.get('db_read_replica'):
+                return self._db.engines[REPLICA]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def init_app(app):
+    """Configura pool e réplica; precisa rodar antes de ``db.init_app``."""
+    app.config.setdefault('DATABASE_REPLICA_URL', None)
+    app.config.setdefault('DB_POOL_SIZE', 5)
+    app.config.setdefault('DB_MAX_OVERFLOW', 10)
+    app.config.setdefault('DB_POOL_TIMEOUT', 30)
+    app.config.setdefault('DB_POOL_RECYCLE', 1800)
+    app.config.setdefault('DB_POOL_PRE_PING', True)
+    app.config.setdefault('REPLICA_READ_YOUR_WRITES_SECONDS', 5)
+
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+        app.config['SQLALCHEMY_DATABASE_URI'], app.config, 'primary')
+    replica_url = app.config['DATABASE_REPLICA_URL']
+    if not replica_url:
+        return
+    app.config.setdefault('SQLALCHEMY_BINDS', {})[REPLICA] = dict(
+        engine_options(replica_url, app.config, REPLICA), url=replica_url)
+
+    @app.before_request
+    def route_reads():
+        wrote_at = session.get('db_wrote_at', 0)
+        g.db_read_replica = (request.method in SAFE_METHODS
+                             and time.time() - wrote_at > app.config['REPLICA_READ_YOUR_WRITES_SECONDS'])
+
+    @app.after_request
+    def remember_write(response):
+        if g.get('db_wrote'):
+            session['db_wrote_at'] = time.time()
+        return response
@@ -0,0 +1,259 @@
+"""Exclusão em lote de usuários e anúncios, em segundo plano.
+
+Em vez de carregar cada objeto relacionado para o ``db.session.delete``, as
+postagens são apagadas com ``DELETE ... WHERE id IN (lote)`` e o banco
+remove fotos, reações e comentários pelo ``ON DELETE CASCADE`` das chaves
+estrangeiras (models.py). Cada lote é uma transação que grava o progresso
+em ``exclusoes``; um job interrompido retoma do que sobrou. No fim, os
+arquivos do storage que nenhuma linha usa mais são apagados; os gravados há
+pouco ficam anotados no job e saem depois, com ``sweep_blobs``.
+
+Cada lote renova ``heartbeat_at``. Um job em andamento só é assumido por
+outro processo (``flask resume-deletions``) depois de LEASE_SECONDS sem sinal
+de vida, para não rodar em dois lugares ao mesmo tempo.
+"""
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, or_, select, update
+
+import counters
+import facets
+import storage
+import trending
+from models import db, Curriculo, DeletionJob, Photo, Post, ProfilePhoto, User
+
+BATCH_SIZE = 200
+# Arquivos gravados há menos que isso ficam: podem ser de um envio cuja
+# linha ainda não foi gravada
+ORPHAN_GRACE_SECONDS = 3600
+# Tempo sem heartbeat depois do qual um job em andamento é dado como parado
+LEASE_SECONDS = 600
+
+
+def schedule(kind, target_id, requested_by=None):
+    """Registra a exclusão e devolve o job; um job ainda aberto é reaproveitado."""
+    job = DeletionJob.query.filter(
+        DeletionJob.kind == kind, DeletionJob.target_id == target_id,
+        DeletionJob.status.in_(('pending', 'running')),
+    ).first()
+    if job is None:
+        job = DeletionJob(kind=kind, target_id=target_id, requested_by=requested_by, status='pending')
+        db.session.add(job)
+        db.session.commit()
+    return job
+
+
+def _photo_blobs(rows):
+    # {hash principal: todos os hashes da foto}; as variantes de fotos com
+    # o mesmo conteúdo principal são as mesmas, então o principal decide
+    blobs = {}
+    for blob_hash, variants in rows:
+        if not blob_hash:
+            continue
+        hashes = blobs.setdefault(blob_hash, {blob_hash})
+        for variant in (variants or {}).values():
+            hashes.update(fmt['hash'] for fmt in variant.values() if isinstance(fmt, dict) and 'hash' in fmt)
+    return blobs
+
+
+def remove_orphan_blobs(blobs):
+    """Apaga do storage os arquivos cujo hash principal nenhuma linha usa mais.
+
+    Roda depois do commit da exclusão. Um envio concorrente grava o arquivo
+    antes da linha que o usa; por isso arquivos gravados nos últimos
+    ORPHAN_GRACE_SECONDS ficam para ``sweep_blobs``. Devolve quantos
+    arquivos apagou e os grupos adiados ({hash principal: hashes}).
+    """
+    if not blobs:
+        return 0, {}
+    groups = list(blobs)
+    referenced = set()
+    for column in (Photo.blob_hash, ProfilePhoto.blob_hash, Curriculo.pdf_hash):
+        referenced.update(db.session.execute(select(column).where(column.in_(groups))).scalars())
+    store = storage.blob_store()
+    cutoff = time.time() - ORPHAN_GRACE_SECONDS
+    deleted = 0
+    skipped = {}
+    for group in groups:
+        if group in referenced:
+            continue
+        existing = [blob_hash for blob_hash in blobs[group] if store.exists(blob_hash)]
+        if any(store.modified(blob_hash) > cutoff for blob_hash in existing):
+            skipped[group] = set(blobs[group])
+            continue
+        for blob_hash in existing:
+            store.delete(blob_hash)
+            deleted += 1
+    return deleted, skipped
+
+
+def _pending_json(blobs):
+    # JSON de ``pending_blobs``; None quando não sobrou nada
+    return {group: sorted(hashes) for group, hashes in blobs.items()} or None
+
+
+def sweep_blobs():
+    """Apaga os arquivos que os jobs concluídos adiaram por serem recentes.
+
+    Os que continuam recentes ficam para a próxima vez; os que voltaram a
+    ser usados saem da lista. Devolve quantos arquivos apagou.
+    """
+    deleted = 0
+    jobs = DeletionJob.query.filter(DeletionJob.status == 'done', DeletionJob.pending_blobs.isnot(None)).all()
+    for job in jobs:
+        removed, skipped = remove_orphan_blobs(
+            {group: set(hashes) for group, hashes in job.pending_blobs.items()})
+        db.session.execute(update(DeletionJob).where(DeletionJob.id == job.id).values(
+            blobs_deleted=DeletionJob.blobs_deleted + removed, pending_blobs=_pending_json(skipped)))
+        db.session.commit()
+        deleted += removed
+    return deleted
+
+
+def delete_posts(post_ids):
+    """Apaga as postagens (e, em cascata, fotos, reações e comentários).
+
+    Devolve os arquivos candidatos a órfãos. Quem chama faz o commit.
+    """
+    blobs = _photo_blobs(db.session.execute(
+        select(Photo.blob_hash, Photo.variants).where(Photo.post_id.in_(post_ids))
+    ))
+    listings = db.session.execute(
+        select(User.location, Post.price).outerjoin(User, User.id == Post.user_id).where(Post.id.in_(post_ids))
+    ).all()
+    db.session.execute(delete(Post).where(Post.id.in_(post_ids)).execution_options(synchronize_session=False))
+    facets.remove_posts(listings)
+    return blobs
+
+
+def _progress(job, **values):
+    db.session.execute(update(DeletionJob).where(DeletionJob.id == job.id)
+                       .values(heartbeat_at=datetime.utcnow(), **values))
+
+
+def _stale(lease):
+    # Em andamento, mas sem heartbeat há ``lease`` segundos (jobs de antes
+    # da coluna usam updated_at)
+    cutoff = datetime.utcnow() - timedelta(seconds=lease)
+    return func.coalesce(DeletionJob.heartbeat_at, DeletionJob.updated_at) < cutoff
+
+
+def _claim(job_id, lease):
+    # UPDATE condicional: de dois processos que tentam assumir o job, só
+    # um altera a linha
+    claimed = db.session.execute(
+        update(DeletionJob)
+        .where(DeletionJob.id == job_id, or_(
+            DeletionJob.status.in_(('pending', 'failed')),
+            (DeletionJob.status == 'running') & _stale(lease),
+        ))
+        .values(status='running', heartbeat_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return claimed == 1
+
+
+def resumable(lease=LEASE_SECONDS):
+    """Ids dos jobs a retomar: com erro, ou pendentes/em andamento parados há ``lease`` segundos."""
+    return db.session.execute(
+        select(DeletionJob.id)
+        .where(or_(
+            DeletionJob.status == 'failed',
+            DeletionJob.status.in_(('pending', 'running')) & _stale(lease),
+        ))
+        .order_by(DeletionJob.id)
+    ).scalars().all()
+
+
+def run(job_id, batch_size=BATCH_SIZE, on_posts_deleted=None, log=print, lease=LEASE_SECONDS):
+    """Executa (ou retoma) o job de exclusão ``job_id``.
+
+    ``on_posts_deleted(post_ids)`` é chamado depois de cada lote gravado,
+    para invalidar caches. Erros ficam registrados no job. Devolve None se
+    o job não existe ou se outro processo está com ele (heartbeat há menos
+    de ``lease`` segundos).
+    """
+    job = db.session.get(DeletionJob, job_id)
+    if job is None or job.status == 'done':
+        return job
+    if not _claim(job_id, lease):
+        return None
+    db.session.refresh(job)
+    pending = {group: set(hashes) for group, hashes in (job.pending_blobs or {}).items()}
+    try:
+        affected = set()
+        if job.kind == 'user':
+            posts = select(Post.id).where(Post.user_id == job.target_id)
+            # Curtidas e comentários do usuário em postagens alheias:
+            # descontados dos contadores e apagados em poucos comandos
+            affected = counters.remove_user_activity(job.target_id)
+            trending.recompute(affected)
+        else:
+            posts = select(Post.id).where(Post.id == job.target_id)
+        remaining = db.session.execute(select(db.func.count()).select_from(posts.subquery())).scalar()
+        _progress(job, status='running', posts_total=job.posts_deleted + remaining)
+        db.session.commit()
+        if on_posts_deleted and affected:
+            on_posts_deleted(affected)
+
+        while True:
+            post_ids = db.session.execute(posts.order_by(Post.id).limit(batch_size)).scalars().all()
+            if not post_ids:
+                break
+            blobs = delete_posts(post_ids)
+            _progress(job, posts_deleted=DeletionJob.posts_deleted + len(post_ids))
+            db.session.commit()
+            removed, skipped = remove_orphan_blobs(blobs)
+            if removed or skipped:
+                pending.update(skipped)
+                _progress(job, blobs_deleted=DeletionJob.blobs_deleted + removed,
+                          pending_blobs=_pending_json(pending))
+                db.session.commit()
+            if on_posts_deleted:
+                on_posts_deleted(post_ids)
+            log(f'Exclusão {job_id}: {job.posts_deleted} de {job.posts_total} anúncios')
+
+        blobs = {}
+        if job.kind == 'user':
+            # Foto de perfil, currículo e importações saem em cascata com o usuário
+            blobs = _photo_blobs(db.session.execute(
+                select(ProfilePhoto.blob_hash, ProfilePhoto.variants).where(ProfilePhoto.user_id == job.target_id)
+            ))
+            for pdf_hash in db.session.execute(
+                select(Curriculo.pdf_hash).where(Curriculo.user_id == job.target_id)
+            ).scalars():
+                if pdf_hash:
+                    blobs[pdf_hash] = {pdf_hash}
+            db.session.execute(delete(User).where(User.id == job.target_id))
+        _progress(job, status='done', finished_at=datetime.utcnow())
+        db.session.commit()
+        removed, skipped = remove_orphan_blobs(blobs)
+        if removed or skipped:
+            pending.update(skipped)
+            _progress(job, blobs_deleted=DeletionJob.blobs_deleted + removed,
+                      pending_blobs=_pending_json(pending))
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        _progress(job, status='failed', error=str(e))
+        db.session.commit()
+        raise
+    db.session.refresh(job)
+    return job
+
+
+def status(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'target_id': job.target_id,
+        'status': job.status,
+        'posts_total': job.posts_total,
+        'posts_deleted': job.posts_deleted,
+        'blobs_deleted': job.blobs_deleted,
+        'blobs_pending': sum(len(hashes) for hashes in (job.pending_blobs or {}).values()),
+        'error': job.error,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
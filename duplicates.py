@@ -0,0 +1,71 @@
+"""Detecção de fotos repetidas pelo hash perceptual (ver images.perceptual_hash).
+
+A busca usa índice múltiplo: o hash de 64 bits é dividido em CHUNKS blocos
+de 16 bits, cada um com um índice de expressão em ``fotos_anuncio``. Duas
+fotos a no máximo ``CHUNKS - 1`` bits de distância têm pelo menos um bloco
+idêntico, então a consulta procura só blocos exatos (pelos índices, sem
+varrer a tabela) e a distância de Hamming é conferida nos poucos candidatos.
+
+Hashes com quase todos os bits iguais (imagens lisas ou degradês, ver
+``informative``) não dizem nada sobre a foto e não entram na comparação.
+"""
+from sqlalchemy import func, literal_column, or_, select
+
+from models import db, Photo, Post
+
+CHUNKS = 4
+CHUNK_DIGITS = 16 // CHUNKS
+MAX_DISTANCE = CHUNKS - 1
+# Mínimo de bits 1 (e de bits 0) para o hash identificar a foto
+MIN_BITS = 8
+
+
+def chunk_expressions(column):
+    # SQL de cada bloco, igual ao dos índices (literais, não parâmetros:
+    # só assim o banco reconhece a expressão indexada)
+    return [f'substr({column}, {1 + i * CHUNK_DIGITS}, {CHUNK_DIGITS})' for i in range(CHUNKS)]
+
+
+def _chunks(phash):
+    return [phash[i * CHUNK_DIGITS:(i + 1) * CHUNK_DIGITS] for i in range(CHUNKS)]
+
+
+def distance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def informative(phash):
+    # Tudo zero (imagem lisa) ou tudo um (degradê) casaria com qualquer
+    # outra imagem do mesmo tipo
+    return bool(phash) and MIN_BITS <= bin(int(phash, 16)).count('1') <= 64 - MIN_BITS
+
+
+def find_duplicates(phash, user_id=None, max_distance=MAX_DISTANCE):
+    """Fotos de anúncio parecidas com ``phash``, da mais próxima à mais distante.
+
+    Devolve ``[(photo_id, post_id, distância)]``; com ``user_id`` só entre
+    os anúncios desse usuário. ``max_distance`` acima de MAX_DISTANCE
+    poderia perder fotos e é reduzido a ele.
+    """
+    if not informative(phash):
+        return []
+    max_distance = min(max_distance, MAX_DISTANCE)
+    query = select(Photo.id, Photo.post_id, Photo.phash).where(or_(*[
+        func.substr(Photo.phash, literal_column(str(1 + i * CHUNK_DIGITS)), literal_column(str(CHUNK_DIGITS))) == chunk
+        for i, chunk in enumerate(_chunks(phash))
+    ]))
+    if user_id is not None:
+        query = query.join(Post, Post.id == Photo.post_id).where(Post.user_id == user_id)
+    matches = []
+    for photo_id, post_id, candidate in db.session.execute(query):
+        d = distance(phash, candidate)
+        if d <= max_distance:
+            matches.append((photo_id, post_id, d))
+    return sorted(matches, key=lambda match: match[2])
+
+
+def repeated(hashes, max_distance=MAX_DISTANCE):
+    # Há duas fotos parecidas entre as enviadas juntas?
+    hashes = [phash for phash in hashes if informative(phash)]
+    return any(distance(a, b) <= max_distance
+               for i, a in enumerate(hashes) for b in hashes[i + 1:])
@@ -0,0 +1,168 @@
+"""Facetas da navegação: anúncios por localização e por faixa de preço.
+
+Os agregados ficam na tabela ``facetas`` e são atualizados na mesma
+transação que cria ou apaga as postagens (``add_posts`` / ``remove_posts``),
+com um upsert por lote; a busca só lê essa tabela pequena em vez de agrupar
+todas as postagens a cada página. ``rebuild`` recalcula tudo a partir de
+``posts`` (``flask --app app rebuild-facets``).
+"""
+from bisect import bisect_right
+from collections import Counter
+
+from sqlalchemy import case, delete, func, select
+
+from models import db, Facet, Post, User
+from reactions import INSERTS
+
+# Limites inferiores das faixas de preço; a última não tem teto
+PRICE_BUCKETS = (0, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+TOP_LOCATIONS = 15
+
+
+def price_bucket(price):
+    return PRICE_BUCKETS[max(0, bisect_right(PRICE_BUCKETS, float(price)) - 1)]
+
+
+def _location(location):
+    return (location or '').strip() or None
+
+
+def _counts(listings):
+    # (localização, preço) -> {(faceta, valor): quantidade}; None é ignorado
+    counts = Counter()
+    for location, price in listings:
+        if _location(location):
+            counts['location', _location(location)] += 1
+        if price is not None:
+            counts['price', str(price_bucket(price))] += 1
+    return counts
+
+
+def _insert():
+    return INSERTS[db.engine.dialect.name]
+
+
+def _upsert_counts(counts, sign):
+    if not counts:
+        return
+    insert = _insert()
+    statement = insert(Facet).values([
+        {'facet': facet, 'value': value, 'posts_count': sign * count}
+        for (facet, value), count in counts.items()
+    ])
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['facet', 'value'],
+        set_={'posts_count': Facet.posts_count + statement.excluded.posts_count},
+    ))
+
+
+def _widen_range(prices):
+    # Novo mínimo/máximo só se o preço passar do atual: CASE em vez de
+    # LEAST/GREATEST, que o SQLite não tem
+    insert = _insert()
+    for bound, price in (('min', min(prices)), ('max', max(prices))):
+        statement = insert(Facet).values(facet='price_range', value=bound, posts_count=0, amount=price)
+        excluded = statement.excluded.amount
+        wider = excluded < Facet.amount if bound == 'min' else excluded > Facet.amount
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['facet', 'value'],
+            set_={'amount': case((Facet.amount.is_(None) | wider, excluded), else_=Facet.amount)},
+        ))
+
+
+def _refresh_bound(bound):
+    # MIN/MAX(price) pelo índice ix_posts_price: uma leitura, não uma varredura
+    aggregate = func.min if bound == 'min' else func.max
+    amount = db.session.execute(select(aggregate(Post.price))).scalar()
+    db.session.execute(delete(Facet).where(Facet.facet == 'price_range', Facet.value == bound))
+    if amount is not None:
+        db.session.execute(Facet.__table__.insert().values(
+            facet='price_range', value=bound, posts_count=0, amount=amount,
+        ))
+
+
+def add_posts(listings):
+    """Conta novas postagens, dadas como pares (localização, preço).
+
+    Quem chama faz o commit.
+    """
+    listings = list(listings)
+    _upsert_counts(_counts(listings), 1)
+    prices = [price for _, price in listings if price is not None]
+    if prices:
+        _widen_range(prices)
+
+
+def remove_posts(listings):
+    """Desconta postagens já apagadas (ou que perderam o dono).
+
+    Precisa rodar depois do flush da exclusão: se um preço extremo saiu,
+    o mínimo/máximo é lido de novo de ``posts``. Quem chama faz o commit.
+    """
+    listings = list(listings)
+    _upsert_counts(_counts(listings), -1)
+    db.session.execute(delete(Facet).where(Facet.facet.in_(('location', 'price')), Facet.posts_count <= 0))
+    prices = [price for _, price in listings if price is not None]
+    if prices:
+        current = dict(db.session.execute(
+            select(Facet.value, Facet.amount).where(Facet.facet == 'price_range')
+        ).all())
+        if current.get('min') is None or min(prices) <= current['min']:
+            _refresh_bound('min')
+        if current.get('max') is None or max(prices) >= current['max']:
+            _refresh_bound('max')
+
+
+def rebuild(connection=None):
+    # Recalcula todas as facetas a partir das postagens; com ``connection``
+    # roda dentro da transação de quem chamou (migrações)
+    executor = connection if connection is not None else db.session
+    location = func.trim(User.location)
+    bucket = case(
+        *[(Post.price >= low, low) for low in reversed(PRICE_BUCKETS[1:])],
+        else_=PRICE_BUCKETS[0],
+    ).label('bucket')
+    rows = [
+        {'facet': 'location', 'value': value, 'posts_count': count}
+        for value, count in executor.execute(
+            select(location, func.count(Post.id))
+            .join(User, Post.user_id == User.id)
+            .where(location != '')
+            .group_by(location)
+        )
+    ]
+    rows += [
+        {'facet': 'price', 'value': str(low), 'posts_count': count}
+        for low, count in executor.execute(select(bucket, func.count(Post.id)).group_by('bucket'))
+    ]
+    low, high = executor.execute(select(func.min(Post.price), func.max(Post.price))).one()
+    if low is not None:
+        rows += [{'facet': 'price_range', 'value': 'min', 'posts_count': 0, 'amount': low},
+                 {'facet': 'price_range', 'value': 'max', 'posts_count': 0, 'amount': high}]
+
+    executor.execute(delete(Facet))
+    if rows:
+        executor.execute(Facet.__table__.insert(), [dict({'amount': None}, **row) for row in rows])
+    if connection is None:
+        db.session.commit()
+
+
+def browse_facets(locations=TOP_LOCATIONS):
+    """Facetas para a busca, lidas só da tabela ``facetas``.
+
+    Devolve ``{'locations': [(nome, n)], 'prices': [(de, até, n)],
+    'min_price': ..., 'max_price': ...}``; ``até`` é None na última faixa.
+    """
+    rows = db.session.execute(select(Facet.facet, Facet.value, Facet.posts_count, Facet.amount)).all()
+    by_location = sorted(((row.value, row.posts_count) for row in rows if row.facet == 'location'),
+                         key=lambda item: (-item[1], item[0].lower()))
+    buckets = {row.value: row.posts_count for row in rows if row.facet == 'price'}
+    bounds = {row.value: row.amount for row in rows if row.facet == 'price_range'}
+    uppers = PRICE_BUCKETS[1:] + (None,)
+    return {
+        'locations': by_location[:locations],
+        'prices': [(low, high, buckets[str(low)]) for low, high in zip(PRICE_BUCKETS, uppers)
+                   if buckets.get(str(low))],
+        'min_price': bounds.get('min'),
+        'max_price': bounds.get('max'),
+    }
@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # redis é opcional: só necessário com FRAGMENT_CACHE_BACKEND=redis
+    redis = None
+
+
+class LRUBackend:
+    """Cache em memória do processo, limitado a ``max_entries`` itens.
+
+    Com ``ttl`` (segundos) cada item expira sozinho. Cada worker tem a sua
+    cópia e ``delete_many`` só limpa a do processo atual: o ``ttl`` limita por
+    quanto tempo os outros workers servem um valor antigo.
+    """
+
+    def __init__(self, max_entries=2048, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                if key not in self._items:
+                    continue
+                expires_at, value = self._items[key]
+                if expires_at is not None and expires_at <= now:
+                    del self._items[key]
+                    continue
+                self._items.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._items[key] = (expires_at, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class RedisBackend:
+    """Cache compartilhado entre workers.
+
+    ``client`` só precisa de ``mget``, ``set(..., ex=)`` e ``delete``; nos
+    testes locais qualquer objeto com essa interface serve no lugar do Redis.
+    """
+
+    def __init__(self, client, ttl=3600):
+        self.client = client
+        self.ttl = ttl
+
+    @classmethod
+    def from_url(cls, url, ttl=3600):
+        if redis is None:
+            raise RuntimeError('Instale o pacote redis para usar FRAGMENT_CACHE_BACKEND=redis')
+        return cls(redis.Redis.from_url(url), ttl)
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        values = self.client.mget(keys)
+        return {
+            key: value.decode() if isinstance(value, bytes) else value
+            for key, value in zip(keys, values)
+            if value is not None
+        }
+
+    def set(self, key, value):
+        self.client.set(key, value, ex=self.ttl)
+
+    def delete_many(self, keys):
+        if keys:
+            self.client.delete(*keys)
+
+
+class FragmentCache:
+    """HTML renderizado por postagem, com contadores de acertos e falhas."""
+
+    def __init__(self, backend, version=1, variants=('anon', 'member')):
+        self.backend = backend
+        self.version = version
+        self.variants = variants
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        if config['FRAGMENT_CACHE_BACKEND'] == 'redis':
+            backend = RedisBackend.from_url(config['FRAGMENT_CACHE_URL'], config['FRAGMENT_CACHE_TTL'])
+        else:
+            backend = LRUBackend(config['FRAGMENT_CACHE_SIZE'], config['FRAGMENT_CACHE_MEMORY_TTL'])
+        return cls(backend, config['FRAGMENT_CACHE_VERSION'])
+
+    def key(self, post_id, variant):
+        return f'post-card:v{self.version}:{post_id}:{variant}'
+
+    def get_many(self, post_ids, variant):
+        keys = {self.key(post_id, variant): post_id for post_id in post_ids}
+        found = self.backend.get_many(list(keys))
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return {keys[key]: html for key, html in found.items()}
+
+    def set(self, post_id, variant, html):
+        self.backend.set(self.key(post_id, variant), html)
+
+    def invalidate(self, *post_ids):
+        self.backend.delete_many([
+            self.key(post_id, variant) for post_id in post_ids for variant in self.variants
+        ])
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+class TTLCache:
+    """Resultados calculados guardados por ``ttl`` segundos no processo.
+
+    Para dados baratos de ficarem um pouco desatualizados (ex.: a lista de
+    usuários da barra lateral), em que invalidar a cada escrita não compensa.
+    """
+
+    def __init__(self, ttl=30, max_entries=64):
+        self.ttl = ttl
+        self._items = LRUBackend(max_entries)
+
+    def get_or_set(self, key, compute):
+        entry = self._items.get_many([key]).get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        value = compute()
+        self._items.set(key, (time.monotonic() + self.ttl, value))
+        return value
+
+    def clear(self):
+        self._items.clear()
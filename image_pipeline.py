@@ -0,0 +1,131 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from images import process_image
+
+logger = logging.getLogger(__name__)
+
+
+def timed_process_image(image_data, sizes):
+    # Executado no processo filho: devolve as variantes e o tempo gasto
+    started = time.perf_counter()
+    variants = process_image(image_data, sizes)
+    return variants, time.perf_counter() - started
+
+
+class MemoryBudget:
+    """Orçamento de memória compartilhado pelas imagens em processamento.
+
+    ``acquire`` espera até haver memória livre; um pedido maior que o
+    orçamento inteiro é reduzido a ele, ou seja, roda sozinho em vez de
+    nunca rodar.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.reserved = 0
+        self._changed = threading.Condition()
+
+    def acquire(self, amount):
+        amount = min(amount, self.limit)
+        with self._changed:
+            self._changed.wait_for(lambda: self.reserved + amount <= self.limit)
+            self.reserved += amount
+        return amount
+
+    def release(self, amount):
+        with self._changed:
+            self.reserved -= amount
+            self._changed.notify_all()
+
+
+class ImagePipeline:
+    """Processa imagens num pool de processos de tamanho limitado.
+
+    No máximo ``queue_limit`` imagens ficam na fila ao mesmo tempo; acima
+    disso ``submit`` espera uma vaga. Além disso, a memória estimada das
+    imagens em processamento não passa de ``memory_budget`` bytes: uploads
+    grandes esperam a vez em vez de derrubar o worker. Com ``workers=0`` o
+    processamento é feito no próprio processo (útil em desenvolvimento).
+    """
+
+    def __init__(self, workers=2, queue_limit=32, memory_budget=256 * 1024 * 1024):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(queue_limit)
+        self.memory = MemoryBudget(memory_budget)
+        self.pending = 0
+        self.processed = 0
+        self.failed = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['IMAGE_WORKERS'], config['IMAGE_QUEUE_LIMIT'], config['IMAGE_MEMORY_BUDGET'])
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _record(self, future, reserved=0):
+        self.memory.release(reserved)
+        with self._lock:
+            self.pending -= 1
+            if future.exception() is not None or future.result()[0] is None:
+                self.failed += 1
+            else:
+                elapsed = future.result()[1]
+                self.processed += 1
+                self.total_seconds += elapsed
+                self.max_seconds = max(self.max_seconds, elapsed)
+                logger.info(f"Imagem processada em {elapsed * 1000:.0f} ms")
+        self._slots.release()
+
+    def submit(self, image_data, sizes, cost=0):
+        # ``cost``: memória estimada da decodificação (ver images.decode_cost)
+        self._slots.acquire()
+        reserved = self.memory.acquire(cost)
+        with self._lock:
+            self.pending += 1
+        if self.workers:
+            future = self._pool().submit(timed_process_image, image_data, sizes)
+        else:
+            future = Future()
+            future.set_result(timed_process_image(image_data, sizes))
+        future.add_done_callback(lambda done: self._record(done, reserved))
+        return future
+
+    def map(self, images, sizes, costs=None):
+        # Processa todas as imagens em paralelo, mantendo a ordem de entrada
+        costs = costs or [0] * len(images)
+        futures = [self.submit(image_data, sizes, cost) for image_data, cost in zip(images, costs)]
+        return [future.result()[0] for future in futures]
+
+    def shutdown(self):
+        # Espera as imagens em andamento e encerra os processos do pool
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self.pending,
+                'memory_reserved': self.memory.reserved,
+                'processed': self.processed,
+                'failed': self.failed,
+                'total_seconds': self.total_seconds,
+                'max_seconds': self.max_seconds,
+            }
+
+
+def default_workers():
+    return min(4, os.cpu_count() or 1)
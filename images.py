@@ -0,0 +1,160 @@
+import io
+import logging
+import warnings
+from collections import namedtuple
+
+from PIL import Image, features
+
+logger = logging.getLogger(__name__)
+
+# Variantes geradas em cada upload: nome -> caixa máxima (largura, altura)
+POST_IMAGE_SIZES = {
+    'full': (800, 800),
+    'card': (480, 480),
+    'thumb': (240, 240),
+}
+PROFILE_IMAGE_SIZES = {
+    'full': (400, 400),
+    'card': (200, 200),
+    'thumb': (96, 96),
+}
+
+# Formato -> (formato do Pillow, mimetype, opções de gravação)
+FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 85, 'optimize': True}),
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+}
+
+WEBP_AVAILABLE = features.check('webp')
+
+# Formatos aceitos no upload, conferidos pelo cabeçalho (não pela extensão)
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+# Padrão de MAX_IMAGE_PIXELS: 40 megapixels cobre qualquer câmera de celular
+MAX_IMAGE_PIXELS = 40_000_000
+
+ImageInfo = namedtuple('ImageInfo', ['format', 'width', 'height'])
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def open_source(source):
+    # ``source`` é o conteúdo (bytes) ou o caminho de um arquivo em disco
+    return Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+
+
+def inspect_image(source, max_pixels=MAX_IMAGE_PIXELS):
+    """Confere formato e dimensões só pelo cabeçalho, sem decodificar os pixels.
+
+    Levanta InvalidImage com uma mensagem para o usuário quando a imagem
+    não é aceita, inclusive bombas de descompressão (dimensões enormes em
+    poucos bytes).
+    """
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            with open_source(source) as img:
+                info = ImageInfo(img.format, img.width, img.height)
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise InvalidImage('A imagem tem dimensões grandes demais.')
+    except Exception:
+        raise InvalidImage('O arquivo enviado não é uma imagem válida.')
+    if info.format not in ALLOWED_FORMATS:
+        raise InvalidImage('Formato de imagem não suportado. Envie JPEG, PNG, GIF ou WebP.')
+    if info.width * info.height > max_pixels:
+        raise InvalidImage('A imagem tem dimensões grandes demais.')
+    return info
+
+
+def decode_cost(info, sizes=POST_IMAGE_SIZES):
+    """Memória estimada (bytes) para decodificar a imagem em process_image."""
+    width, height = info.width, info.height
+    if info.format == 'JPEG':
+        # Mesma redução do draft: divide por 2 enquanto couber a maior variante
+        target = fit((width, height), max(sizes.values()))
+        scale = 1
+        while scale < 8 and width // (scale * 2) >= target[0] and height // (scale * 2) >= target[1]:
+            scale *= 2
+        width, height = -(-width // scale), -(-height // scale)
+    # RGBA no pior caso, mais a conversão para RGB
+    return width * height * 7
+
+
+def fit(size, max_size):
+    # Dimensões que cabem em max_size mantendo a proporção (sem ampliar)
+    width, height = size
+    ratio = min(max_size[0] / width, max_size[1] / height, 1)
+    return max(1, int(width * ratio)), max(1, int(height * ratio))
+
+
+def encode(img, fmt):
+    pil_format, _, options = FORMATS[fmt]
+    buffer = io.BytesIO()
+    img.save(buffer, format=pil_format, **options)
+    return buffer.getvalue()
+
+
+# Diferença mínima de brilho (0-255) na miniatura do hash perceptual
+PHASH_MIN_CONTRAST = 16
+
+
+def perceptual_hash(img):
+    """dHash de 64 bits, em hexadecimal.
+
+    Compara o brilho de pixels vizinhos numa miniatura 9x8 em tons de
+    cinza: a mesma foto reduzida, recomprimida ou com cores levemente
+    alteradas dá um hash a poucos bits de distância. Devolve None para
+    imagens lisas (fundo de uma cor, pouco contraste): o hash delas é quase
+    todo zero e seria "igual" ao de qualquer outra imagem lisa.
+    """
+    pixels = img.convert('L').resize((9, 8), Image.Resampling.LANCZOS).tobytes()
+    if max(pixels) - min(pixels) < PHASH_MIN_CONTRAST:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = bits << 1 | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f'{bits:016x}'
+
+
+def process_image(image_data, sizes=POST_IMAGE_SIZES, webp=WEBP_AVAILABLE):
+    """Decodifica a imagem uma vez e gera todas as variantes de ``sizes``.
+
+    ``image_data`` é o conteúdo ou o caminho do arquivo (uploads grandes
+    ficam em disco e não passam pela memória do processo web). Devolve ``{nome: {'width', 'height', 'jpeg', ['webp']}}`` com o conteúdo
+    codificado de cada formato, ou None se a imagem não puder ser lida.
+    A maior variante leva também o ``phash`` da imagem (perceptual_hash).
+    """
+    try:
+        with warnings.catch_warnings():
+            # Acima do limite do Pillow a imagem é recusada, não só avisada
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            img = open_source(image_data)
+
+        # JPEG grande: reduz já na decodificação (escala 1/2, 1/4 ou 1/8),
+        # sem nunca ficar abaixo da maior variante pedida
+        if img.format == 'JPEG':
+            img.draft('RGB', fit(img.size, max(sizes.values())))
+
+        # Converte para RGB se necessário
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+
+        # Da maior para a menor: cada variante é reduzida a partir da anterior
+        formats = ['jpeg', 'webp'] if webp else ['jpeg']
+        variants = {}
+        for name, max_size in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+            new_size = fit(img.size, max_size)
+            if new_size != img.size:
+                img = img.resize(new_size, Image.Resampling.LANCZOS)
+            variant = {'width': img.width, 'height': img.height}
+            for fmt in formats:
+                variant[fmt] = encode(img, fmt)
+            variants[name] = variant
+        # Calculado sobre a menor variante, já reduzida: custa quase nada
+        variants[max(sizes, key=sizes.get)]['phash'] = perceptual_hash(img)
+        return variants
+    except Exception as e:
+        logger.error(f"Erro ao processar imagem: {str(e)}")
+        return None
@@ -0,0 +1,334 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import Response, abort, before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = 'nossoanuncio'
+
+request_log = logging.getLogger('nossoanuncio.requests')
+
+
+class Registry:
+    """Métricas agregadas, exportadas no formato texto do Prometheus.
+
+    Cada worker do gunicorn tem o seu registro, e o scrape cai num worker
+    qualquer. Com ``directory`` (METRICS_DIR, uma pasta comum aos workers e
+    esvaziada a cada deploy), cada um grava ali o seu estado e o /metrics
+    soma os arquivos de todos; sem ela, os números são só do worker que
+    atendeu o scrape.
+    """
+
+    def __init__(self, directory=None, flush_interval=1.0):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.latency = {}
+        self.totals = {}
+        self.collectors = []
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._flushed = 0.0
+
+    def observe(self, endpoint, method, status, seconds, queries, sql_seconds, rows, size):
+        with self._lock:
+            key = (endpoint, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+            buckets = self.latency.setdefault(endpoint, [0] * len(LATENCY_BUCKETS) + [0.0, 0])
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+            buckets[-2] += seconds
+            buckets[-1] += 1
+
+            totals = self._totals(endpoint)
+            totals['sql_queries'] += queries
+            totals['sql_seconds'] += sql_seconds
+            totals['rows_fetched'] += rows
+            if size is None:
+                # Arquivo repassado sem tamanho conhecido: não entra na soma
+                totals['responses_unknown_size'] += 1
+            else:
+                totals['response_bytes'] += size
+        self._maybe_flush()
+
+    def add_bytes(self, endpoint, size):
+        # Bytes de uma resposta em streaming, contados ao terminar de enviar
+        with self._lock:
+            self._totals(endpoint)['response_bytes'] += size
+        self._maybe_flush()
+
+    def _totals(self, endpoint):
+        return self.totals.setdefault(endpoint, {'sql_queries': 0, 'sql_seconds': 0.0, 'rows_fetched': 0,
+                                                 'response_bytes': 0, 'responses_unknown_size': 0})
+
+    def collector(self, name, kind, help_text, read, label=None):
+        # Métrica lida na hora da exportação (ex.: fila do pool de imagens);
+        # com ``label``, ``read`` devolve {valor do rótulo: valor da métrica}
+        self.collectors.append((name, kind, help_text, read, label))
+
+    def snapshot(self):
+        """Estado deste processo, em tipos que cabem em JSON."""
+        with self._lock:
+            state = {
+                'pid': os.getpid(),
+                'requests': [[*key, count] for key, count in self.requests.items()],
+                'latency': {endpoint: list(buckets) for endpoint, buckets in self.latency.items()},
+                'totals': {endpoint: dict(totals) for endpoint, totals in self.totals.items()},
+            }
+        state['collectors'] = {name: read() for name, kind, help_text, read, label in self.collectors}
+        return state
+
+    def _maybe_flush(self):
+        if self.directory and time.monotonic() - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if not self.directory:
+            return
+        self._flushed = time.monotonic()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        # Troca atômica: o worker que lê nunca vê um arquivo pela metade
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def _snapshots(self):
+        if not self.directory:
+            return [self.snapshot()]
+        self.flush()
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def _merge(self, snapshots):
+        kinds = {name: kind for name, kind, help_text, read, label in self.collectors}
+        requests, latency, totals, collected = {}, {}, {}, {}
+        for snapshot in snapshots:
+            # Contadores de workers que já saíram continuam somando; os
+            # gauges deles não valem mais
+            alive = _alive(snapshot['pid'])
+            for endpoint, method, status, count in snapshot['requests']:
+                requests[endpoint, method, status] = requests.get((endpoint, method, status), 0) + count
+            for endpoint, buckets in snapshot['latency'].items():
+                merged = latency.setdefault(endpoint, [0] * len(buckets))
+                latency[endpoint] = [a + b for a, b in zip(merged, buckets)]
+            for endpoint, values in snapshot['totals'].items():
+                merged = totals.setdefault(endpoint, {})
+                for field, value in values.items():
+                    merged[field] = merged.get(field, 0) + value
+            for name, value in snapshot['collectors'].items():
+                if name not in kinds or (kinds[name] == 'gauge' and not alive):
+                    continue
+                if isinstance(value, dict):
+                    merged = collected.setdefault(name, {})
+                    for label_value, amount in value.items():
+                        merged[label_value] = merged.get(label_value, 0) + amount
+                else:
+                    collected[name] = collected.get(name, 0) + value
+        return requests, latency, totals, collected
+
+    def render(self):
+        requests, latency, totals, collected = self._merge(self._snapshots())
+        lines = [f'# HELP {PREFIX}_requests_total Requisições atendidas',
+                 f'# TYPE {PREFIX}_requests_total counter']
+        for (endpoint, method, status), count in sorted(requests.items()):
+            lines.append(f'{PREFIX}_requests_total{{endpoint="{endpoint}",method="{method}",'
+                         f'status="{status}"}} {count}')
+
+        lines += [f'# HELP {PREFIX}_request_duration_seconds Latência por rota',
+                  f'# TYPE {PREFIX}_request_duration_seconds histogram']
+        for endpoint, buckets in sorted(latency.items()):
+            for bound, count in zip(LATENCY_BUCKETS, buckets):
+                lines.append(f'{PREFIX}_request_duration_seconds_bucket{{endpoint="{endpoint}",'
+                             f'le="{bound}"}} {count}')
+            lines.append(f'{PREFIX}_request_duration_seconds_bucket{{endpoint="{endpoint}",'
+                         f'le="+Inf"}} {buckets[-1]}')
+            lines.append(f'{PREFIX}_request_duration_seconds_sum{{endpoint="{endpoint}"}} {buckets[-2]}')
+            lines.append(f'{PREFIX}_request_duration_seconds_count{{endpoint="{endpoint}"}} {buckets[-1]}')
+
+        for field, help_text in (('sql_queries', 'Consultas SQL executadas'),
+                                 ('sql_seconds', 'Tempo gasto em SQL'),
+                                 ('rows_fetched', 'Objetos carregados do banco pelo ORM'),
+                                 ('response_bytes', 'Bytes enviados nas respostas'),
+                                 ('responses_unknown_size', 'Respostas repassadas sem tamanho conhecido')):
+            lines += [f'# HELP {PREFIX}_{field}_total {help_text}', f'# TYPE {PREFIX}_{field}_total counter']
+            for endpoint, values in sorted(totals.items()):
+                lines.append(f'{PREFIX}_{field}_total{{endpoint="{endpoint}"}} {values.get(field, 0)}')
+
+        for name, kind, help_text, read, label in self.collectors:
+            lines += [f'# HELP {PREFIX}_{name} {help_text}', f'# TYPE {PREFIX}_{name} {kind}']
+            value = collected.get(name, {} if label else 0)
+            if label is None:
+                lines.append(f'{PREFIX}_{name} {value}')
+            else:
+                for label_value, amount in sorted(value.items()):
+                    lines.append(f'{PREFIX}_{name}{{{label}="{label_value}"}} {amount}')
+        return '\n'.join(lines) + '\n'
+
+
+def _alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _count_sent(iterable, done):
+    # Repassa a resposta em streaming somando o que de fato foi enviado
+    sent = 0
+    try:
+        for chunk in iterable:
+            sent += len(chunk.encode() if isinstance(chunk, str) else chunk)
+            yield chunk
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+        done(sent)
+
+
+registry = Registry()
+
+
+def _request_stats():
+    # Só conta o que acontece dentro de uma requisição (não CLI nem threads)
+    if has_request_context() and 'metrics' in g:
+        return g.metrics
+    return None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    stats = _request_stats()
+    if stats is None:
+        return
+    stats['sql_queries'] += 1
+    stats['sql_seconds'] += elapsed
+    if elapsed * 1000 >= stats['slow_query_ms']:
+        request_log.warning(json.dumps({
+            'event': 'slow_query',
+            'endpoint': request.endpoint,
+            'duration_ms': round(elapsed * 1000, 1),
+            'statement': ' '.join(statement.split())[:500],
+        }))
+
+
+def _loaded(session, instance):
+    stats = _request_stats()
+    if stats is not None:
+        stats['rows_fetched'] += 1
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _request_stats()
+    if stats is not None:
+        stats['render_started'].append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    stats = _request_stats()
+    if stats is not None and stats['render_started']:
+        stats['render_seconds'] += time.perf_counter() - stats['render_started'].pop()
+
+
+def init_app(app):
+    app.config.setdefault('SLOW_QUERY_MS', 100)
+    app.config.setdefault('REQUEST_LOG', True)
+    app.config.setdefault('METRICS_TOKEN', None)
+    app.config.setdefault('METRICS_DIR', None)
+    registry.directory = app.config['METRICS_DIR']
+    atexit.register(registry.flush)
+
+    if app.config['REQUEST_LOG'] and not request_log.handlers:
+        request_log.addHandler(logging.StreamHandler())
+        request_log.setLevel(logging.INFO)
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Session, 'loaded_as_persistent', _loaded)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics = {
+            'started': time.perf_counter(),
+            'sql_queries': 0,
+            'sql_seconds': 0.0,
+            'rows_fetched': 0,
+            'render_started': [],
+            'render_seconds': 0.0,
+            'slow_query_ms': app.config['SLOW_QUERY_MS'],
+        }
+
+    @app.after_request
+    def finish_request_metrics(response):
+        stats = g.pop('metrics', None)
+        if stats is None:
+            return response
+        total = time.perf_counter() - stats['started']
+        endpoint = request.endpoint or 'not_found'
+        size = response.content_length
+        if size is None and not response.direct_passthrough:
+            # Streaming (NDJSON, CSV): o tamanho só existe no fim do envio
+            response.response = _count_sent(response.response,
+                                            lambda sent: registry.add_bytes(endpoint, sent))
+            size = 0
+
+        response.headers['Server-Timing'] = (
+            f'db;dur={stats["sql_seconds"] * 1000:.1f};desc="{stats["sql_queries"]} queries", '
+            f'render;dur={stats["render_seconds"] * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}'
+        )
+        registry.observe(endpoint, request.method, response.status_code, total,
+                         stats['sql_queries'], stats['sql_seconds'], stats['rows_fetched'], size)
+        if app.config['REQUEST_LOG']:
+            request_log.info(json.dumps({
+                'event': 'request',
+                'method': request.method,
+                'endpoint': endpoint,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(total * 1000, 1),
+                'sql_queries': stats['sql_queries'],
+                'sql_ms': round(stats['sql_seconds'] * 1000, 1),
+                'render_ms': round(stats['render_seconds'] * 1000, 1),
+                'rows_fetched': stats['rows_fetched'],
+                'bytes': response.content_length,
+            }))
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        # Sem METRICS_TOKEN o endpoint fica fechado
+        token = app.config['METRICS_TOKEN']
+        if not token:
+            abort(404)
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            abort(401)
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,396 @@
+"""Migrações versionadas do esquema, para SQLite e Postgres.
+
+Cada migração roda uma única vez e a versão aplicada fica registrada em
+``schema_migrations``. As operações conferem o esquema antes de alterá-lo
+(coluna ou índice já existente é ignorado), então um banco criado com
+``db.create_all()`` ou atualizado à mão passa pelas migrações sem erro.
+
+Uso: ``flask --app app db-upgrade`` (o release do Procfile roda ``update_db.py``).
+Novas migrações entram no fim da lista, com a próxima versão (a única
+exceção é a 0006.1, ver o comentário dela).
+"""
+import re
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, select, text
+
+import counters
+import duplicates
+import facets
+import trending
+from models import db
+from search import POSTGRES_INDEX, backfill_search_vectors, ensure_search_index
+
+Migration = namedtuple('Migration', ['version', 'description', 'apply', 'transactional'])
+MIGRATIONS = []
+
+# Chave do advisory lock do Postgres: dois releases simultâneos não migram juntos
+LOCK_KEY = 720140
+
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('version', String(32), primary_key=True),
+    Column('description', String(200)),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def migration(version, description, transactional=True):
+    """Registra uma migração.
+
+    Migrações com ``transactional=False`` rodam fora de transação, o que no
+    Postgres permite ``CREATE INDEX CONCURRENTLY`` sem travar as escritas.
+    Como podem parar no meio, precisam ser seguras para rodar de novo.
+    """
+    def register(apply):
+        MIGRATIONS.append(Migration(version, description, apply, transactional))
+        return apply
+    return register
+
+
+class Operations:
+    """Operações idempotentes sobre a conexão de uma migração."""
+
+    def __init__(self, connection, concurrent=False, log=print):
+        self.connection = connection
+        self.log = log
+        self.dialect = connection.dialect.name
+        self.concurrent = concurrent and self.dialect == 'postgresql'
+        self.quote = connection.dialect.identifier_preparer.quote
+
+    def execute(self, statement, **params):
+        return self.connection.execute(text(statement), params)
+
+    def has_table(self, table):
+        return inspect(self.connection).has_table(table)
+
+    def has_column(self, table, column):
+        return column in {c['name'] for c in inspect(self.connection).get_columns(table)}
+
+    def has_index(self, table, name):
+        if self.dialect == 'sqlite':
+            # O inspetor do SQLite não enxerga índices de expressão
+            return self.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name", name=name,
+            ).scalar() is not None
+        return name in {i['name'] for i in inspect(self.connection).get_indexes(table)}
+
+    def create_table(self, table):
+        # Cria uma tabela do modelo (com seus índices) se ainda não existir
+        db.metadata.tables[table].create(bind=self.connection, checkfirst=True)
+
+    def add_column(self, table, column, ddl):
+        # Devolve True quando a coluna foi de fato criada
+        if self.has_column(table, column):
+            return False
+        self.execute(f'ALTER TABLE {self.quote(table)} ADD COLUMN {column} {ddl}')
+        return True
+
+    def drop_not_null(self, table, column):
+        # Devolve True quando a coluna deixou de ser obrigatória
+        if self.dialect != 'sqlite':
+            self.execute(f'ALTER TABLE {self.quote(table)} ALTER COLUMN {column} DROP NOT NULL')
+            return True
+        info = self.execute(f'PRAGMA table_info({self.quote(table)})').all()
+        if not any(row.name == column and row.notnull for row in info):
+            return False
+        self._rebuild_sqlite_table(table, column, [row.name for row in info])
+        return True
+
+    def _rebuild_sqlite_table(self, table, column, columns):
+        # O SQLite não altera colunas: cria a cópia sem o NOT NULL, copia as
+        # linhas, apaga a original e renomeia a cópia, recriando os índices
+        # e triggers com o SQL guardado em sqlite_master
+        create = self.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name", name=table,
+        ).scalar()
+        dependents = self.execute(
+            "SELECT sql FROM sqlite_master WHERE type IN ('index', 'trigger') "
+            "AND tbl_name = :name AND sql IS NOT NULL", name=table,
+        ).scalars().all()
+        copy = f'{table}_copia'
+        create = re.sub(r'^CREATE TABLE\s+("[^"]+"|\S+)', f'CREATE TABLE {self.quote(copy)}', create)
+        create = re.sub(rf'(\b{column}\s+[^,()]*?)\s+NOT NULL', r'\1', create, count=1)
+        # Linhas órfãs (de antes das chaves estrangeiras ligadas, ver models.py)
+        # apontam para registros que não existem mais e não passariam na cópia
+        orphans = ' AND '.join(
+            f'({self.quote(fk["from"])} IS NULL OR {self.quote(fk["from"])} IN '
+            f'(SELECT {self.quote(fk["to"] or "rowid")} FROM {self.quote(fk["table"])}))'
+            for fk in self.execute(f'PRAGMA foreign_key_list({self.quote(table)})').mappings()
+        ) or '1 = 1'
+        names = ', '.join(self.quote(name) for name in columns)
+        self.execute(f'DROP TABLE IF EXISTS {self.quote(copy)}')
+        self.execute(create)
+        copied = self.execute(f'INSERT INTO {self.quote(copy)} ({names}) '
+                              f'SELECT {names} FROM {self.quote(table)} WHERE {orphans}').rowcount
+        dropped = self.execute(f'SELECT COUNT(*) FROM {self.quote(table)}').scalar() - copied
+        if dropped:
+            self.log(f'{table}: {dropped} linha(s) órfã(s) descartada(s)')
+        self.execute(f'DROP TABLE {self.quote(table)}')
+        self.execute(f'ALTER TABLE {self.quote(copy)} RENAME TO {self.quote(table)}')
+        for statement in dependents:
+            self.execute(statement)
+
+    def create_index(self, name, table, columns=(), expressions=(), using=None):
+        # ``expressions`` entram como SQL literal, ex.: 'substr(phash, 1, 4)';
+        # ``using`` escolhe o tipo do índice no Postgres, ex.: 'GIN'
+        columns = ', '.join([self.quote(column) for column in columns] + list(expressions))
+        method = f' USING {using}' if using and self.dialect == 'postgresql' else ''
+        if not self.concurrent:
+            if self.has_index(table, name):
+                return False
+            self.execute(f'CREATE INDEX {name} ON {self.quote(table)}{method} ({columns})')
+            return True
+
+        valid = self.execute(
+            'SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid '
+            'WHERE c.relname = :name', name=name,
+        ).scalar()
+        if valid:
+            return False
+        if valid is False:
+            # Um CREATE INDEX CONCURRENTLY interrompido deixa o índice inválido
+            self.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+        self.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {self.quote(table)}{method} ({columns})')
+        return True
+
+
+@migration('0001', 'Tabelas do modelo')
+def create_tables(ops):
+    # Só cria o que falta: num banco vazio, já sai com o esquema atual
+    db.metadata.create_all(bind=ops.connection)
+
+
+@migration('0002', 'Coluna is_admin em usuários')
+def add_admin_flag(ops):
+    ops.add_column('usuários', 'is_admin', 'BOOLEAN DEFAULT FALSE')
+
+
+@migration('0003', 'Contadores desnormalizados das postagens')
+def add_post_counters(ops):
+    added = [ops.add_column('posts', column, 'INTEGER NOT NULL DEFAULT 0')
+             for column in counters.COUNTERS]
+    if any(added):
+        counters.reconcile(ops.connection)
+
+
+@migration('0004', 'Metadados do storage de arquivos')
+def add_blob_columns(ops):
+    for table in ('fotos_anuncio', 'fotos_perfil'):
+        # O conteúdo legado passa a ser opcional: as fotos novas vão para o storage
+        ops.drop_not_null(table, 'image_data')
+        ops.add_column(table, 'blob_hash', 'VARCHAR(64)')
+        ops.add_column(table, 'size', 'INTEGER')
+        ops.add_column(table, 'mime_type', 'VARCHAR(50)')
+        ops.add_column(table, 'width', 'INTEGER')
+        ops.add_column(table, 'height', 'INTEGER')
+        ops.add_column(table, 'variants', 'JSON')
+    ops.add_column('curriculos', 'pdf_hash', 'VARCHAR(64)')
+    ops.add_column('curriculos', 'pdf_size', 'INTEGER')
+    # Os índices de blob_hash e pdf_hash ficam na 0016, sem transação
+
+
+@migration('0005', 'Fotos pendentes de processamento')
+def add_photos_pending(ops):
+    ops.add_column('posts', 'photos_pending', 'INTEGER NOT NULL DEFAULT 0')
+
+
+@migration('0006', 'Índice de busca de texto')
+def add_search_index(ops):
+    # O índice GIN do Postgres fica na 0016 e o preenchimento na 0019, sem transação
+    ensure_search_index(ops.connection, index=False)
+
+
+@migration('0006.1', 'Tabelas antigas de reações num banco novo')
+def create_legacy_reaction_tables(ops):
+    # Exceção à ordem da lista: a 0007 indexa gosta e nao_gosta, que saíram
+    # do models.py com a 0008. Um banco novo as recebe vazias aqui e segue o
+    # mesmo caminho de um banco antigo (a 0008 junta e apaga as duas). Num
+    # banco que já passou da 0007 não faz nada.
+    if ops.execute("SELECT 1 FROM schema_migrations WHERE version = '0007'").scalar():
+        return
+    for table in ('gosta', 'nao_gosta'):
+        if not ops.has_table(table):
+            ops.execute(f"""
+                CREATE TABLE {table} (
+                    id INTEGER PRIMARY KEY,
+                    user_id INTEGER REFERENCES {ops.quote('usuários')} (id) ON DELETE CASCADE,
+                    post_id INTEGER REFERENCES posts (id) ON DELETE CASCADE,
+                    created_at TIMESTAMP
+                )
+            """)
+
+
+@migration('0007', 'Índices das consultas quentes', transactional=False)
+def add_hot_indexes(ops):
+    # Mesmos nomes dos __table_args__ em models.py
+    ops.create_index('ix_posts_created_at_id', 'posts', ['created_at', 'id'])
+    ops.create_index('ix_posts_user_id_created_at', 'posts', ['user_id', 'created_at', 'id'])
+    ops.create_index('ix_fotos_anuncio_post_id', 'fotos_anuncio', ['post_id'])
+    ops.create_index('ix_gosta_user_id_post_id', 'gosta', ['user_id', 'post_id'])
+    ops.create_index('ix_gosta_post_id', 'gosta', ['post_id'])
+    ops.create_index('ix_nao_gosta_user_id_post_id', 'nao_gosta', ['user_id', 'post_id'])
+    ops.create_index('ix_nao_gosta_post_id', 'nao_gosta', ['post_id'])
+    ops.create_index('ix_comentarios_post_id_created_at', 'comentarios', ['post_id', 'created_at'])
+    ops.create_index('ix_curriculos_created_at_id', 'curriculos', ['created_at', 'id'])
+
+
+@migration('0008', 'Reações unificadas em reacoes')
+def merge_reactions(ops):
+    legacy = [table for table in ('gosta', 'nao_gosta') if ops.has_table(table)]
+    if not legacy:
+        return
+    # Quem curtiu e também não curtiu fica com a reação mais recente
+    sources = ' UNION ALL '.join(
+        f"SELECT user_id, post_id, '{kind}' AS kind, created_at FROM {table}"
+        for table, kind in (('gosta', 'like'), ('nao_gosta', 'dislike')) if table in legacy
+    )
+    ops.execute(f"""
+        INSERT INTO reacoes (user_id, post_id, kind, created_at)
+        SELECT user_id, post_id, kind, created_at FROM (
+            SELECT r.*, ROW_NUMBER() OVER (
+                PARTITION BY user_id, post_id
+                ORDER BY created_at IS NULL, created_at DESC, kind
+            ) AS reaction_rank
+            FROM ({sources}) r
+            WHERE user_id IS NOT NULL AND post_id IS NOT NULL
+        ) ranked
+        WHERE reaction_rank = 1
+        ON CONFLICT (user_id, post_id) DO NOTHING
+    """)
+    for table in legacy:
+        ops.execute(f'DROP TABLE {table}')
+    counters.reconcile(ops.connection)
+
+
+@migration('0009', 'Progresso das importações de catálogo')
+def add_catalog_imports(ops):
+    ops.create_table('importacoes')
+
+
+@migration('0010', 'Facetas de localização e preço')
+def add_facets(ops):
+    # O índice de preço fica na 0017, sem transação
+    ops.create_table('facetas')
+    facets.rebuild(ops.connection)
+
+
+@migration('0011', 'Hash perceptual das fotos', transactional=False)
+def add_photo_phash(ops):
+    ops.add_column('fotos_anuncio', 'phash', 'VARCHAR(16)')
+    ops.add_column('fotos_perfil', 'phash', 'VARCHAR(16)')
+    # Mesmos índices de models.py; as fotos antigas recebem o hash com
+    # flask --app app backfill-phash
+    for i, expression in enumerate(duplicates.chunk_expressions('phash')):
+        ops.create_index(f'ix_fotos_anuncio_phash_{i}', 'fotos_anuncio', expressions=[expression])
+
+
+@migration('0012', 'Pontuação de tendência das postagens')
+def add_trending_score(ops):
+    ops.add_column('posts', 'trending_score', 'FLOAT NOT NULL DEFAULT 0')
+    ops.create_table('tendencia')
+    trending.recompute(connection=ops.connection)
+
+
+@migration('0013', 'Índice da tendência', transactional=False)
+def add_trending_index(ops):
+    ops.create_index('ix_posts_trending_score_id', 'posts', ['trending_score', 'id'])
+
+
+@migration('0014', 'Jobs de exclusão em lote', transactional=False)
+def add_deletion_jobs(ops):
+    ops.create_table('exclusoes')
+    # O lote de postagens de um usuário é buscado por user_id; os comentários
+    # do usuário são apagados por user_id antes dele (counters.remove_user_activity)
+    ops.create_index('ix_comentarios_user_id', 'comentarios', ['user_id'])
+
+
+@migration('0015', 'Conteúdo legado das fotos opcional no SQLite')
+def drop_image_data_not_null(ops):
+    # Bancos SQLite migrados antes da 0004 refazer a tabela ainda têm o
+    # image_data obrigatório, e toda foto nova falhava
+    for table in ('fotos_anuncio', 'fotos_perfil'):
+        if ops.dialect == 'sqlite':
+            ops.drop_not_null(table, 'image_data')
+
+
+@migration('0016', 'Índices do storage e da busca sem travar escritas', transactional=False)
+def add_storage_and_search_indexes(ops):
+    # Saíram da 0004 e da 0006, que os criavam dentro da transação: no
+    # Postgres, um CREATE INDEX comum bloqueia as escritas até terminar
+    for table in ('fotos_anuncio', 'fotos_perfil'):
+        ops.create_index(f'ix_{table}_blob_hash', table, ['blob_hash'])
+    ops.create_index('ix_curriculos_pdf_hash', 'curriculos', ['pdf_hash'])
+    if ops.dialect == 'postgresql':
+        ops.create_index(POSTGRES_INDEX, 'posts', ['search_vector'], using='GIN')
+
+
+@migration('0017', 'Índice de preço das postagens', transactional=False)
+def add_price_index(ops):
+    # Saiu da 0010: o MIN/MAX de preço das facetas lê por ele (facets.py)
+    ops.create_index('ix_posts_price', 'posts', ['price'])
+
+
+@migration('0018', 'Heartbeat e arquivos adiados das exclusões')
+def add_deletion_lease(ops):
+    ops.add_column('exclusoes', 'heartbeat_at', 'TIMESTAMP')
+    ops.add_column('exclusoes', 'pending_blobs', 'JSON')
+
+
+@migration('0019', 'Vetor de busca das postagens antigas', transactional=False)
+def fill_search_vectors(ops):
+    # A 0006 cria a coluna vazia e o gatilho das linhas novas; as antigas
+    # são preenchidas aqui, um lote por transação
+    if ops.dialect == 'postgresql':
+        backfill_search_vectors(ops.connection)
+
+
+def applied_versions(engine):
+    schema_migrations.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        return {row.version for row in connection.execute(select(schema_migrations.c.version))}
+
+
+def pending_migrations(engine=None):
+    applied = applied_versions(engine or db.engine)
+    return [m for m in MIGRATIONS if m.version not in applied]
+
+
+def _apply(engine, migration, log=print):
+    if migration.transactional:
+        with engine.begin() as connection:
+            migration.apply(Operations(connection, log=log))
+            _record(connection, migration)
+    else:
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            migration.apply(Operations(connection, concurrent=True, log=log))
+            _record(connection, migration)
+
+
+def _record(connection, migration):
+    connection.execute(schema_migrations.insert().values(
+        version=migration.version, description=migration.description, applied_at=datetime.utcnow(),
+    ))
+
+
+def upgrade(engine=None, log=print):
+    """Aplica, em ordem, as migrações ainda não registradas e devolve suas versões."""
+    engine = engine or db.engine
+    postgres = engine.dialect.name == 'postgresql'
+    # Conexão só do lock, em autocommit: uma transação aberta aqui faria o
+    # CREATE INDEX CONCURRENTLY esperar por ela indefinidamente
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as lock:
+        if postgres:
+            lock.execute(text('SELECT pg_advisory_lock(:key)'), {'key': LOCK_KEY})
+        try:
+            done = []
+            # Lido depois do lock: outro release pode ter acabado de migrar
+            for migration in pending_migrations(engine):
+                log(f'Aplicando {migration.version}: {migration.description}')
+                _apply(engine, migration, log)
+                done.append(migration.version)
+            return done
+        finally:
+            if postgres:
+                lock.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': LOCK_KEY})
@@ -1,7 +1,20 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # O SQLite só aplica as chaves estrangeiras (e o ON DELETE CASCADE das
+    # exclusões em lote, ver deletions.py) com o pragma ligado em cada conexão
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys = ON')
+        cursor.close()
 
 class User(db.Model):
     __tablename__ = 'usuários'
@@ -14,8 +27,7 @@ class User(db.Model):
     
     # Relacionamentos
     user_posts = db.relationship('Post', backref='post_user', lazy=True)
-    user_likes = db.relationship('Like', backref='like_user', lazy=True)
-    user_dislikes = db.relationship('Dislike', backref='dislike_user', lazy=True)
+    user_reactions = db.relationship('Reaction', backref='reaction_user', lazy=True)
     user_comments = db.relationship('Comment', backref='comment_user', lazy=True)
     user_curriculo = db.relationship('Curriculo', backref='curriculo_user', lazy=True, uselist=False)
     profile_photo = db.relationship('ProfilePhoto', backref='photo_user', lazy=True, uselist=False)
@@ -24,48 +36,87 @@ class ProfilePhoto(db.Model):
     __tablename__ = 'fotos_perfil'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('usuários.id', ondelete='CASCADE'), unique=True)
-    image_data = db.Column(db.LargeBinary, nullable=False)
+    # Conteúdo legado: novas imagens vão para o storage (ver storage.py)
+    image_data = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    blob_hash = db.Column(db.String(64), index=True)
+    size = db.Column(db.Integer)
+    mime_type = db.Column(db.String(50))
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    # Variantes (thumb/card/full) em cada formato: ver images.py
+    variants = db.Column(db.JSON)
+    phash = db.Column(db.String(16))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Post(db.Model):
     __tablename__ = 'posts'
+    # Índices das consultas quentes (ver migrations.py): feed e perfil em keyset
+    __table_args__ = (
+        db.Index('ix_posts_created_at_id', 'created_at', 'id'),
+        db.Index('ix_posts_user_id_created_at', 'user_id', 'created_at', 'id'),
+        db.Index('ix_posts_price', 'price'),
+        db.Index('ix_posts_trending_score_id', 'trending_score', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     price = db.Column(db.Numeric(10,2), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('usuários.id', ondelete='CASCADE'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Contadores desnormalizados (mantidos por counters.py)
+    likes_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    dislikes_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    comments_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Fotos ainda sendo processadas em segundo plano
+    photos_pending = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Pontuação de tendência relativa à época em TrendingEpoch (ver trending.py)
+    trending_score = db.Column(db.Float, nullable=False, default=0, server_default='0')
     
     # Relacionamentos
     post_photos = db.relationship('Photo', backref='photo_post', lazy=True)
-    post_likes = db.relationship('Like', backref='like_post', lazy=True)
-    post_dislikes = db.relationship('Dislike', backref='dislike_post', lazy=True)
+    post_reactions = db.relationship('Reaction', backref='reaction_post', lazy=True)
     post_comments = db.relationship('Comment', backref='comment_post', lazy=True)
 
 class Photo(db.Model):
     __tablename__ = 'fotos_anuncio'
     id = db.Column(db.Integer, primary_key=True)
-    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'))
-    image_data = db.Column(db.LargeBinary, nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), index=True)
+    # Conteúdo legado: novas imagens vão para o storage (ver storage.py)
+    image_data = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    blob_hash = db.Column(db.String(64), index=True)
+    size = db.Column(db.Integer)
+    mime_type = db.Column(db.String(50))
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    # Variantes (thumb/card/full) em cada formato: ver images.py
+    variants = db.Column(db.JSON)
     is_main = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Hash perceptual (dHash de 64 bits, em hexadecimal): ver duplicates.py
+    phash = db.Column(db.String(16))
 
-class Like(db.Model):
-    __tablename__ = 'gosta'
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('usuários.id', ondelete='CASCADE'))
-    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+# Um índice por bloco de 16 bits do hash, para a busca de fotos repetidas
+# (duplicates.py); a migração 0011 cria os mesmos índices
+for _chunk in range(4):
+    db.Index(f'ix_fotos_anuncio_phash_{_chunk}', db.func.substr(Photo.phash, 1 + 4 * _chunk, 4))
 
-class Dislike(db.Model):
-    __tablename__ = 'nao_gosta'
+class Reaction(db.Model):
+    __tablename__ = 'reacoes'
+    # Uma reação por usuário e postagem: a restrição é o alvo do upsert (ver reactions.py)
+    __table_args__ = (db.UniqueConstraint('user_id', 'post_id', name='uq_reacoes_user_id_post_id'),)
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('usuários.id', ondelete='CASCADE'))
-    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'))
+    user_id = db.Column(db.Integer, db.ForeignKey('usuários.id', ondelete='CASCADE'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), nullable=False, index=True)
+    kind = db.Column(db.String(10), nullable=False)  # 'like' ou 'dislike'
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Comment(db.Model):
     __tablename__ = 'comentarios'
+    __table_args__ = (
+        db.Index('ix_comentarios_post_id_created_at', 'post_id', 'created_at'),
+        db.Index('ix_comentarios_user_id', 'user_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('usuários.id', ondelete='CASCADE'))
@@ -74,6 +125,7 @@ class Comment(db.Model):
 
 class Curriculo(db.Model):
     __tablename__ = 'curriculos'
+    __table_args__ = (db.Index('ix_curriculos_created_at_id', 'created_at', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('usuários.id', ondelete='CASCADE'))
     nome_completo = db.Column(db.String(100), nullable=False)
@@ -84,6 +136,64 @@ class Curriculo(db.Model):
     formacao = db.Column(db.Text, nullable=False)
     habilidades = db.Column(db.Text, nullable=False)
     objetivo = db.Column(db.Text, nullable=False)
-    curriculo_pdf = db.Column(db.LargeBinary)
+    # Conteúdo legado: novos PDFs vão para o storage (ver storage.py)
+    curriculo_pdf = db.deferred(db.Column(db.LargeBinary))
+    pdf_hash = db.Column(db.String(64), index=True)
+    pdf_size = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow) 
\ No newline at end of file
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class CatalogImport(db.Model):
+    __tablename__ = 'importacoes'
+    # Progresso de uma importação de catálogo (ver catalog.py): gravado na
+    # mesma transação de cada lote, permite retomar sem duplicar anúncios
+    __table_args__ = (db.UniqueConstraint('manifest_hash', 'user_id', name='uq_importacoes_manifest_hash_user_id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    manifest_hash = db.Column(db.String(64), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('usuários.id', ondelete='CASCADE'), nullable=False)
+    records_done = db.Column(db.Integer, nullable=False, default=0)
+    posts_created = db.Column(db.Integer, nullable=False, default=0)
+    records_failed = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+class Facet(db.Model):
+    __tablename__ = 'facetas'
+    # Agregados da navegação (ver facets.py): anúncios por localização
+    # ('location'), por faixa de preço ('price') e os preços extremos
+    # ('price_range', com o valor em amount)
+    __table_args__ = (db.UniqueConstraint('facet', 'value', name='uq_facetas_facet_value'),)
+    id = db.Column(db.Integer, primary_key=True)
+    facet = db.Column(db.String(20), nullable=False)
+    value = db.Column(db.String(100), nullable=False)
+    posts_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    amount = db.Column(db.Numeric(10,2))
+
+class TrendingEpoch(db.Model):
+    __tablename__ = 'tendencia'
+    # Linha única: instante de referência das pontuações de tendência,
+    # trazido para perto de agora pelo job de decaimento (trending.rebase)
+    id = db.Column(db.Integer, primary_key=True)
+    epoch = db.Column(db.DateTime, nullable=False)
+
+class DeletionJob(db.Model):
+    __tablename__ = 'exclusoes'
+    # Exclusão em lote de um usuário ou anúncio (ver deletions.py), com o
+    # progresso gravado a cada lote para acompanhar e retomar
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(10), nullable=False)  # 'user' ou 'post'
+    target_id = db.Column(db.Integer, nullable=False)
+    requested_by = db.Column(db.Integer)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending, running, done, failed
+    posts_total = db.Column(db.Integer, nullable=False, default=0)
+    posts_deleted = db.Column(db.Integer, nullable=False, default=0)
+    blobs_deleted = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    # Renovado a cada lote: sem ele por deletions.LEASE_SECONDS, o job é dado como parado
+    heartbeat_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Arquivos recentes demais para apagar, {hash principal: hashes} (deletions.sweep_blobs)
+    pending_blobs = db.Column(db.JSON(none_as_null=True))
@@ -0,0 +1,90 @@
+import base64
+import binascii
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+from sqlalchemy.types import DateTime
+
+# Página de resultados: itens e o cursor para a próxima página (None se acabou)
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+
+def encode_cursor(values, scope=None):
+    # Serializa os valores da chave de ordenação num token seguro para URLs;
+    # ``scope`` vai na frente e o cursor só vale enquanto ele não mudar
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    if scope is not None:
+        payload = [scope, *payload]
+    raw = json.dumps(payload, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns, scope=None):
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        if scope is not None:
+            # Cursor de outro escopo (ex.: antes de reescalar a tendência)
+            if not isinstance(payload, list) or not payload or payload[0] != scope:
+                return None
+            payload = payload[1:]
+        if not isinstance(payload, list) or len(payload) != len(columns):
+            return None
+        values = []
+        for column, value in zip(columns, payload):
+            if isinstance(column.type, DateTime):
+                value = datetime.fromisoformat(value)
+            values.append(value)
+        return values
+    except (ValueError, TypeError, UnicodeDecodeError, binascii.Error):
+        # Cursor inválido ou adulterado: recomeça da primeira página
+        return None
+
+
+def _after(columns, values):
+    # (c1, c2, ...) < (v1, v2, ...) em ordem lexicográfica, tudo descendente
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*equal, column < values[i]))
+    return or_(*clauses)
+
+
+def keyset_page(query, columns, cursor=None, per_page=20, key=None, scope=None):
+    """Pagina ``query`` por chave (keyset) em ordem descendente de ``columns``.
+
+    A última coluna deve ser única (normalmente o id) para desempatar.
+    O custo por página não depende de quantas páginas vêm antes.
+    ``key`` extrai de uma linha os valores de ``columns``; por padrão são
+    lidos como atributos da entidade. Um cursor emitido com outro ``scope``
+    é descartado e a paginação recomeça da primeira página.
+    """
+    values = decode_cursor(cursor, columns, scope)
+    if values is not None:
+        query = query.filter(_after(columns, values))
+
+    rows = query.order_by(*[c.desc() for c in columns]).limit(per_page + 1).all()
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+
+    next_cursor = None
+    if has_next:
+        last = rows[-1]
+        values = key(last) if key else [getattr(last, c.key) for c in columns]
+        next_cursor = encode_cursor(values, scope)
+    return Page(rows, next_cursor)
+
+
+def keyset_batches(query, columns, per_page=500):
+    # Percorre todas as páginas em sequência (exportações, streaming)
+    cursor = None
+    while True:
+        page = keyset_page(query, columns, cursor=cursor, per_page=per_page)
+        yield page.items
+        if page.next_cursor is None:
+            return
+        cursor = page.next_cursor
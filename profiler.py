@@ -0,0 +1,215 @@
+"""Profiler por amostragem das requisições, para usar em produção.
+
+Uma fração das requisições (PROFILE_SAMPLE_RATE) ou, com
+PROFILE_HEADER_ENABLED, as que trazem o cabeçalho assinado
+``X-Debug-Profile`` são perfiladas: enquanto elas rodam,
+uma thread lê a pilha da thread de cada uma a cada PROFILE_INTERVAL_MS
+(``sys._current_frames``) e soma as pilhas por rota. Fora dessas
+requisições a thread fica parada e o custo é um sorteio por requisição.
+
+As pilhas vão para PROFILE_DIR, um par de arquivos por rota e processo:
+``<rota>.<pid>.collapsed`` (formato do flamegraph.pl / inferno) e
+``<rota>.<pid>.speedscope.json`` (https://www.speedscope.app).
+"""
+import atexit
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+from itsdangerous import BadSignature, TimestampSigner
+
+HEADER = 'X-Debug-Profile'
+SALT = 'nossoanuncio-profile'
+
+
+def _signer(secret_key):
+    return TimestampSigner(secret_key, salt=SALT)
+
+
+def make_token(secret_key):
+    """Valor do cabeçalho X-Debug-Profile, assinado com a SECRET_KEY."""
+    return _signer(secret_key).sign('profile').decode()
+
+
+def valid_token(secret_key, token, max_age):
+    try:
+        _signer(secret_key).unsign(token, max_age=max_age)
+    except BadSignature:
+        return False
+    return True
+
+
+class Profiler:
+    """Amostrador de pilhas das requisições perfiladas de um processo."""
+
+    def __init__(self, directory, interval=0.005, flush_interval=10.0, root_path=''):
+        self.directory = directory
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.root_path = root_path
+        self._lock = threading.Lock()
+        self._active = {}  # ident da thread -> rota
+        self._wake = threading.Event()
+        self._thread = None
+        self._names = {}
+        self.stacks = {}  # rota -> Counter(pilha -> amostras)
+        self.requests = Counter()
+        self.samples = 0
+        self._dirty = False
+        self._flushed = time.monotonic()
+
+    def start(self, endpoint):
+        ident = threading.get_ident()
+        with self._lock:
+            self._active[ident] = endpoint
+            self.requests[endpoint] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def stop(self):
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+
+    def _frame_name(self, code):
+        name = self._names.get(code)
+        if name is None:
+            filename = code.co_filename
+            if self.root_path and filename.startswith(self.root_path):
+                filename = os.path.relpath(filename, self.root_path)
+            else:
+                filename = '/'.join(filename.split(os.sep)[-2:])
+            # ';' separa os quadros no formato collapsed
+            name = f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ':')
+            self._names[code] = name
+        return name
+
+    def _sample(self, active):
+        frames = sys._current_frames()
+        with self._lock:
+            for ident, endpoint in active.items():
+                frame = frames.get(ident)
+                names = []
+                while frame is not None:
+                    names.append(self._frame_name(frame.f_code))
+                    frame = frame.f_back
+                if names:
+                    names.reverse()
+                    self.stacks.setdefault(endpoint, Counter())[';'.join(names)] += 1
+                    self.samples += 1
+                    self._dirty = True
+
+    def _run(self):
+        while True:
+            with self._lock:
+                active = dict(self._active)
+            if active:
+                self._sample(active)
+                time.sleep(self.interval)
+            else:
+                # Sem requisições perfiladas: dorme até a próxima (ou até a
+                # hora de gravar o que já foi somado)
+                self._wake.clear()
+                if not self._active:
+                    self._wake.wait(self.flush_interval)
+            if self._dirty and time.monotonic() - self._flushed >= self.flush_interval:
+                self.flush()
+
+    def flush(self):
+        """Grava as pilhas acumuladas (todas desde o início do processo)."""
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = {endpoint: Counter(stacks) for endpoint, stacks in self.stacks.items()}
+            requests = Counter(self.requests)
+            self._dirty = False
+            self._flushed = time.monotonic()
+        os.makedirs(self.directory, exist_ok=True)
+        pid = os.getpid()
+        for endpoint, stacks in snapshot.items():
+            name = re.sub(r'[^\w.-]', '_', endpoint)
+            base = os.path.join(self.directory, f'{name}.{pid}')
+            collapsed = ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+            self._write(f'{base}.collapsed', collapsed)
+            self._write(f'{base}.speedscope.json',
+                        json.dumps(self._speedscope(endpoint, stacks, requests[endpoint])))
+
+    @staticmethod
+    def _write(path, content):
+        # Troca atômica: quem lê o diretório nunca vê um arquivo pela metade
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+    def _speedscope(self, endpoint, stacks, requests):
+        frames, index, samples, weights = [], {}, [], []
+        for stack, count in stacks.most_common():
+            sample = []
+            for name in stack.split(';'):
+                if name not in index:
+                    index[name] = len(frames)
+                    frames.append({'name': name})
+                sample.append(index[name])
+            samples.append(sample)
+            weights.append(count * self.interval * 1000)
+        total = sum(weights)
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': endpoint,
+            'exporter': 'nossoanuncio profiler',
+            'activeProfileIndex': 0,
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': f'{endpoint} ({requests} requisições)',
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': total,
+                'samples': samples,
+                'weights': weights,
+            }],
+        }
+
+
+def init_app(app):
+    app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+    app.config.setdefault('PROFILE_HEADER_ENABLED', False)
+    app.config.setdefault('PROFILE_DIR', 'profiles')
+    app.config.setdefault('PROFILE_INTERVAL_MS', 5)
+    app.config.setdefault('PROFILE_FLUSH_SECONDS', 10)
+    app.config.setdefault('PROFILE_TOKEN_MAX_AGE', 3600)
+
+    profiler = Profiler(
+        app.config['PROFILE_DIR'],
+        interval=app.config['PROFILE_INTERVAL_MS'] / 1000,
+        flush_interval=app.config['PROFILE_FLUSH_SECONDS'],
+        root_path=app.root_path,
+    )
+    app.extensions['profiler'] = profiler
+    atexit.register(profiler.flush)
+
+    @app.before_request
+    def start_profile():
+        rate = app.config['PROFILE_SAMPLE_RATE']
+        token = request.headers.get(HEADER) if app.config['PROFILE_HEADER_ENABLED'] else None
+        if not (rate and random.random() < rate) and not (
+            token and valid_token(app.config['SECRET_KEY'], token, app.config['PROFILE_TOKEN_MAX_AGE'])
+        ):
+            return
+        g.profiled = True
+        profiler.start(request.endpoint or 'not_found')
+
+    @app.teardown_request
+    def stop_profile(exc):
+        if g.pop('profiled', False):
+            profiler.stop()
+
+    return profiler
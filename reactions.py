@@ -0,0 +1,102 @@
+from datetime import datetime
+
+from sqlalchemy import delete, exists, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+import counters
+import trending
+from models import db, Post, Reaction
+
+# Tipo de reação -> contador desnormalizado em Post
+KINDS = {
+    'like': 'likes_count',
+    'dislike': 'dislikes_count',
+}
+
+INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def _remove(user_id, post_id, keep=None):
+    # DELETE ... RETURNING: apaga e diz o que havia (tipo e data), num só comando
+    statement = delete(Reaction).where(Reaction.user_id == user_id, Reaction.post_id == post_id)
+    if keep is not None:
+        statement = statement.where(Reaction.kind != keep)
+    return db.session.execute(statement.returning(Reaction.kind, Reaction.created_at)).first()
+
+
+def _add(user_id, post_id, kind, now):
+    # INSERT ... SELECT ... WHERE EXISTS (postagem) ON CONFLICT DO NOTHING:
+    # um clique duplo concorrente esbarra na restrição única em vez de
+    # duplicar a linha, e uma postagem inexistente não insere nada
+    insert = INSERTS[db.engine.dialect.name]
+    source = select(literal(user_id), literal(post_id), literal(kind), literal(now)).where(
+        exists().where(Post.id == post_id)
+    )
+    statement = (
+        insert(Reaction)
+        .from_select(['user_id', 'post_id', 'kind', 'created_at'], source)
+        .on_conflict_do_nothing(index_elements=['user_id', 'post_id'])
+        .returning(Reaction.id)
+    )
+    return db.session.execute(statement).scalar() is not None
+
+
+def _apply(post_id, previous, added, now):
+    # ``previous`` é a linha removida (tipo, data) ou None
+    deltas = dict.fromkeys(KINDS.values(), 0)
+    events = []
+    if previous:
+        deltas[KINDS[previous.kind]] -= 1
+        events.append((previous.kind, previous.created_at, -1))
+    if added:
+        deltas[KINDS[added]] += 1
+        events.append((added, now, 1))
+    counters.adjust(post_id, deltas)
+    if events:
+        trending.record(post_id, *events)
+
+
+def toggle_reaction(user_id, post_id, kind):
+    """Liga ou desliga a reação ``kind`` do usuário na postagem.
+
+    Uma reação diferente que já existisse é trocada. Devolve a reação atual
+    (``kind`` ou None) ou levanta LookupError se a postagem não existe.
+    Quem chama faz o commit.
+    """
+    now = datetime.utcnow()
+    previous = _remove(user_id, post_id)
+    if previous and previous.kind == kind:
+        _apply(post_id, previous, None, now)
+        return None
+    added = _add(user_id, post_id, kind, now)
+    if not added and previous is None and db.session.get(Post, post_id) is None:
+        raise LookupError(post_id)
+    _apply(post_id, previous, kind if added else None, now)
+    return kind
+
+
+def set_reaction(user_id, post_id, kind):
+    """Define a reação do usuário na postagem (``'like'``, ``'dislike'`` ou None).
+
+    Idempotente: repetir o mesmo pedido não altera nada, o que torna seguro
+    reenviar um lote. Devolve True se algo mudou. Quem chama faz o commit.
+    """
+    now = datetime.utcnow()
+    previous = _remove(user_id, post_id, keep=kind)
+    added = kind is not None and _add(user_id, post_id, kind, now)
+    _apply(post_id, previous, kind if added else None, now)
+    return bool(previous or added)
+
+
+def reactions_of(user_id, post_ids):
+    # post_id -> reação do usuário, para as postagens dadas
+    if not user_id or not post_ids:
+        return {}
+    rows = db.session.execute(
+        select(Reaction.post_id, Reaction.kind)
+        .where(Reaction.user_id == user_id, Reaction.post_id.in_(post_ids))
+    )
+    return dict(rows.all())
@@ -1,10 +1,12 @@
 from app import app, db
+from migrations import schema_migrations, upgrade
 
 with app.app_context():
     # Apaga todas as tabelas
     db.drop_all()
+    schema_migrations.drop(db.engine, checkfirst=True)
     print("Tabelas apagadas com sucesso!")
     
-    # Recria todas as tabelas
-    db.create_all()
-    print("Tabelas recriadas com sucesso!") 
\ No newline at end of file
+    # Recria todas as tabelas pelas migrações
+    upgrade()
+    print("Tabelas recriadas com sucesso!")
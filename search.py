@@ -0,0 +1,124 @@
+import re
+
+from sqlalchemy import column, func, literal_column, table, text
+
+from models import db, Post
+
+# Índice de texto sobre posts.content: FTS5 no SQLite, tsvector + GIN no Postgres
+FTS_TABLE = 'posts_fts'
+TS_CONFIG = 'portuguese'
+
+SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        content, content='posts', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    # Gatilhos mantêm o índice em sincronia com inserções, edições e exclusões
+    f"""CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE OF content ON posts BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+    END""",
+]
+
+POSTGRES_DDL = [
+    # Coluna comum, sem valor padrão: o ADD COLUMN só muda o catálogo. Uma
+    # coluna GENERATED ... STORED reescreveria a tabela inteira sob ACCESS
+    # EXCLUSIVE; aqui o gatilho preenche as linhas novas e
+    # backfill_search_vectors as antigas, em lotes
+    """ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector tsvector""",
+    f"""CREATE OR REPLACE FUNCTION posts_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := to_tsvector('{TS_CONFIG}', coalesce(NEW.content, ''));
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    """DROP TRIGGER IF EXISTS posts_search_vector ON posts""",
+    """CREATE TRIGGER posts_search_vector BEFORE INSERT OR UPDATE OF content ON posts
+        FOR EACH ROW EXECUTE PROCEDURE posts_search_vector()""",
+]
+POSTGRES_INDEX = 'ix_posts_search_vector'
+BACKFILL_BATCH_SIZE = 1000
+
+
+def _generated_column(executor):
+    # Bancos que passaram pela primeira versão da 0006 têm a coluna gerada,
+    # que já se mantém sozinha e não aceita o gatilho
+    return executor.execute(text(
+        "SELECT is_generated = 'ALWAYS' FROM information_schema.columns "
+        "WHERE table_name = 'posts' AND column_name = 'search_vector'"
+    )).scalar()
+
+
+def ensure_search_index(connection=None, index=True):
+    # Com ``connection`` roda dentro da transação de quem chamou (migrações);
+    # as migrações preenchem a coluna e criam o índice GIN à parte, sem
+    # transação (em lotes e CONCURRENTLY)
+    executor = connection if connection is not None else db.session
+    dialect = (db.engine if connection is None else connection).dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_DDL:
+            executor.execute(text(statement))
+        # Reindexa a partir de posts (cobre postagens anteriores aos gatilhos)
+        executor.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        if not _generated_column(executor):
+            for statement in POSTGRES_DDL:
+                executor.execute(text(statement))
+        if index:
+            backfill_search_vectors(executor)
+            executor.execute(text(f'CREATE INDEX IF NOT EXISTS {POSTGRES_INDEX} ON posts USING GIN (search_vector)'))
+    if connection is None:
+        db.session.commit()
+
+
+def backfill_search_vectors(executor=None, batch_size=BACKFILL_BATCH_SIZE):
+    """Preenche ``posts.search_vector`` das postagens anteriores ao gatilho (Postgres).
+
+    Um UPDATE por lote de ``batch_size`` postagens: numa conexão em
+    autocommit (migração sem transação) cada lote é uma transação curta;
+    na sessão, cada lote recebe o seu commit. Devolve quantas preencheu.
+    """
+    executor = executor if executor is not None else db.session
+    if _generated_column(executor):
+        return 0
+    filled = 0
+    while True:
+        updated = executor.execute(text(f"""
+            UPDATE posts SET search_vector = to_tsvector('{TS_CONFIG}', coalesce(content, ''))
+            WHERE id IN (SELECT id FROM posts WHERE search_vector IS NULL ORDER BY id LIMIT :batch_size)
+        """), {'batch_size': batch_size}).rowcount
+        if executor is db.session:
+            db.session.commit()
+        filled += updated
+        if updated < batch_size:
+            return filled
+
+
+def match_terms(q):
+    # Cada palavra vira um termo entre aspas com busca por prefixo, o que
+    # evita erros de sintaxe do FTS5 com aspas ou operadores digitados
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', q))
+
+
+def search_posts(query, q):
+    """Restringe ``query`` às postagens que casam com ``q``.
+
+    Devolve a consulta filtrada e uma expressão de relevância em que
+    valores maiores são mais relevantes.
+    """
+    if db.engine.dialect.name == 'sqlite':
+        fts = table(FTS_TABLE, column('rowid'), column('rank'))
+        query = query.join(fts, fts.c.rowid == Post.id).filter(
+            text(f'{FTS_TABLE} MATCH :terms').bindparams(terms=match_terms(q) or '""')
+        )
+        # rank do FTS5 é o bm25, onde menor é melhor
+        return query, -fts.c.rank
+
+    tsquery = func.plainto_tsquery(TS_CONFIG, q)
+    vector = literal_column('posts.search_vector')
+    return query.filter(vector.op('@@')(tsquery)), func.ts_rank(vector, tsquery)
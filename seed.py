@@ -0,0 +1,120 @@
+import io
+import random
+from datetime import datetime, timedelta
+
+from PIL import Image
+from sqlalchemy import func, insert
+from werkzeug.security import generate_password_hash
+
+import counters
+import facets
+import storage
+import trending
+from images import POST_IMAGE_SIZES, PROFILE_IMAGE_SIZES, process_image
+from models import db, User, ProfilePhoto, Post, Photo, Reaction, Comment, Curriculo
+from search import ensure_search_index
+
+LOCATIONS = ['Lisboa', 'Porto', 'Braga', 'Coimbra', 'Faro', 'Aveiro', 'Setúbal', 'Funchal']
+WORDS = ('bicicleta sofá mesa cadeira telemóvel portátil casaco sapatos livro guitarra '
+         'frigorífico carro mota aulas explicações limpeza jardinagem pintura usado novo '
+         'barato impecável urgente entrega grátis negociável garantia').split()
+
+# Fotos de celular típicas: o processamento reduz para as variantes do feed
+SOURCE_IMAGE_SIZE = (3024, 4032)
+SOURCE_IMAGES = 6
+BATCH_SIZE = 1000
+
+
+def noise_image(rng, size):
+    # Ruído com gradiente: comprime mal, como uma foto real
+    img = Image.effect_noise(size, rng.randint(40, 90)).convert('RGB')
+    tint = Image.new('RGB', size, tuple(rng.randint(0, 255) for _ in range(3)))
+    img = Image.blend(img, tint, 0.5)
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=92)
+    return buffer.getvalue()
+
+
+def stored_variants(store_image, rng, sizes, count, source_size):
+    # Processa algumas imagens de origem e reaproveita-as nas linhas geradas
+    return [store_image(process_image(noise_image(rng, source_size), sizes)) for _ in range(count)]
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def insert_batches(model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(insert(model), rows[start:start + BATCH_SIZE])
+    db.session.commit()
+
+
+def seed(store_image, users=50, posts=500, photos_per_post=3, likes_per_post=10,
+         comments_per_post=5, curriculos=50, source_size=SOURCE_IMAGE_SIZE, random_seed=42):
+    """Preenche o banco com dados sintéticos reprodutíveis (mesma semente, mesmos dados)."""
+    rng = random.Random(random_seed)
+    now = datetime.utcnow()
+    password = generate_password_hash('senha123')
+
+    first_user = (db.session.query(func.max(User.id)).scalar() or 0) + 1
+    insert_batches(User, [
+        {'username': f'usuario{first_user + i}', 'password': password,
+         'location': rng.choice(LOCATIONS), 'created_at': now - timedelta(days=rng.randint(0, 365))}
+        for i in range(users)
+    ])
+    user_ids = [row[0] for row in db.session.query(User.id).filter(User.id >= first_user)]
+
+    avatars = stored_variants(store_image, rng, PROFILE_IMAGE_SIZES, SOURCE_IMAGES, (1024, 1024))
+    insert_batches(ProfilePhoto, [
+        dict(rng.choice(avatars), user_id=user_id)
+        for user_id in user_ids if rng.random() < 0.6
+    ])
+
+    first_post = (db.session.query(func.max(Post.id)).scalar() or 0) + 1
+    insert_batches(Post, [
+        {'content': sentence(rng, rng.randint(8, 40)), 'price': round(rng.uniform(1, 2000), 2),
+         'user_id': rng.choice(user_ids), 'created_at': now - timedelta(minutes=rng.randint(0, 525600))}
+        for _ in range(posts)
+    ])
+    post_ids = [row[0] for row in db.session.query(Post.id).filter(Post.id >= first_post)]
+
+    photos = stored_variants(store_image, rng, POST_IMAGE_SIZES, SOURCE_IMAGES, source_size)
+    insert_batches(Photo, [
+        dict(rng.choice(photos), post_id=post_id, is_main=(i == 0))
+        for post_id in post_ids for i in range(rng.randint(1, photos_per_post))
+    ])
+
+    reactions, comments = [], []
+    for post_id in post_ids:
+        # Cada usuário reage no máximo uma vez por postagem
+        reactors = rng.sample(user_ids, min(len(user_ids), rng.randint(0, likes_per_post * 2)))
+        for user_id in reactors:
+            kind = 'like' if rng.random() < 0.8 else 'dislike'
+            reactions.append({'user_id': user_id, 'post_id': post_id, 'kind': kind})
+        for _ in range(rng.randint(0, comments_per_post * 2)):
+            comments.append({'user_id': rng.choice(user_ids), 'post_id': post_id,
+                             'content': sentence(rng, rng.randint(3, 15))})
+    insert_batches(Reaction, reactions)
+    insert_batches(Comment, comments)
+
+    pdf = b'%PDF-1.4\n' + bytes(rng.getrandbits(8) for _ in range(150 * 1024))
+    pdf_hash = storage.blob_store().put(pdf)
+    with_pdf = [rng.random() < 0.7 for _ in range(curriculos)]
+    insert_batches(Curriculo, [
+        {'user_id': rng.choice(user_ids), 'nome_completo': f'Candidato {i}', 'email': f'candidato{i}@exemplo.pt',
+         'area_profissional': rng.choice(WORDS), 'experiencia': sentence(rng, 60), 'formacao': sentence(rng, 20),
+         'habilidades': sentence(rng, 15), 'objetivo': sentence(rng, 12),
+         'pdf_hash': pdf_hash if with_pdf[i] else None, 'pdf_size': len(pdf) if with_pdf[i] else None,
+         'created_at': now - timedelta(days=rng.randint(0, 365))}
+        for i in range(curriculos)
+    ])
+
+    counters.reconcile()
+    facets.rebuild()
+    trending.recompute(post_ids)
+    db.session.commit()
+    ensure_search_index()
+    likes = sum(1 for reaction in reactions if reaction['kind'] == 'like')
+    return {'users': len(user_ids), 'posts': len(post_ids), 'likes': likes,
+            'dislikes': len(reactions) - likes, 'comments': len(comments), 'curriculos': curriculos}
@@ -0,0 +1,54 @@
+// Comentários do feed: páginas anteriores sob demanda e envio sem recarregar
+// (usado por index.html e announcements.html)
+
+function loadOlderComments(button) {
+    // Busca a página anterior de comentários e insere acima dos já exibidos
+    button.disabled = true;
+    fetch(button.dataset.url, {headers: {'Accept': 'application/json'}})
+    .then(response => {
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        return response.json();
+    })
+    .then(data => {
+        const list = button.parentElement.querySelector('.comment-list');
+        list.insertAdjacentHTML('afterbegin', data.html);
+        if (data.next_url) {
+            button.dataset.url = data.next_url;
+            button.disabled = false;
+        } else {
+            button.remove();
+        }
+    })
+    .catch(() => { button.disabled = false; });
+}
+
+function submitComment(form, postId) {
+    // Envia sem recarregar a página; sem JavaScript o formulário segue normal
+    const input = form.querySelector('input[name="content"]');
+    if (!input.value.trim()) {
+        return false;
+    }
+    fetch(form.action, {
+        method: 'POST',
+        headers: {'Accept': 'application/json'},
+        body: new FormData(form)
+    })
+    .then(response => {
+        if (response.ok) {
+            return response.json();
+        }
+        // Erros previstos vêm em JSON; um erro do servidor pode vir em HTML
+        return response.json()
+            .catch(() => ({}))
+            .then(data => { throw new Error(data.error || 'Não foi possível enviar o comentário.'); });
+    })
+    .then(data => {
+        document.querySelector(`#comments-${postId} .comment-list`).insertAdjacentHTML('beforeend', data.html);
+        document.querySelector(`#comment-count-${postId}`).textContent = data.comments_count;
+        input.value = '';
+    })
+    .catch(error => alert(error.message));
+    return false;
+}
@@ -0,0 +1,117 @@
+import hashlib
+import io
+import os
+import tempfile
+
+from flask import current_app
+
+CHUNK_SIZE = 64 * 1024
+
+
+class BlobStore:
+    """Armazenamento de arquivos endereçado pelo conteúdo (sha256).
+
+    Conteúdos idênticos geram a mesma chave e são gravados uma única vez.
+    """
+
+    def put(self, data):
+        raise NotImplementedError
+
+    def open(self, key):
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def size(self, key):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def modified(self, key):
+        # Instante (time.time) da última gravação; ``put`` de um conteúdo já
+        # existente conta como gravação
+        raise NotImplementedError
+
+    def local_path(self, key):
+        # Caminho no disco, quando houver; permite servir com Range e sendfile
+        return None
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['BLOB_STORAGE_PATH'])
+
+    def path(self, key):
+        # Espalha os arquivos em subpastas para não lotar um único diretório
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def put(self, data):
+        # Aceita bytes ou um arquivo aberto; grava em partes num temporário
+        # enquanto calcula o hash e só então move para o lugar definitivo
+        stream = io.BytesIO(data) if isinstance(data, (bytes, bytearray)) else data
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            key = digest.hexdigest()
+            final_path = self.path(key)
+            if os.path.exists(final_path):
+                os.remove(tmp_path)
+                # Renova a data: a limpeza de órfãos não apaga um arquivo
+                # que um envio em andamento acabou de reaproveitar
+                os.utime(final_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(tmp_path, final_path)
+            return key
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def local_path(self, key):
+        return self.path(key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def size(self, key):
+        return os.path.getsize(self.path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def modified(self, key):
+        return os.path.getmtime(self.path(key))
+
+
+BACKENDS = {
+    'local': LocalBlobStore,
+}
+
+
+def init_app(app):
+    app.config.setdefault('BLOB_STORAGE_BACKEND', 'local')
+    app.config.setdefault('BLOB_STORAGE_PATH', os.path.join(app.instance_path, 'blobs'))
+    backend = BACKENDS[app.config['BLOB_STORAGE_BACKEND']]
+    app.extensions['blob_store'] = backend.from_config(app.config)
+
+
+def blob_store():
+    return current_app.extensions['blob_store']
@@ -0,0 +1,82 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+# Banco principal e réplica em dois arquivos SQLite; precisa estar no
+# ambiente antes de importar o app, que lê a configuração no import
+TMP_DIR = tempfile.mkdtemp(prefix='nossoanuncio-tests-')
+PRIMARY = os.path.join(TMP_DIR, 'primary.db')
+REPLICA = os.path.join(TMP_DIR, 'replica.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{PRIMARY}'
+os.environ['DATABASE_REPLICA_URL'] = f'sqlite:///{REPLICA}'
+os.environ['REQUEST_LOG'] = 'false'
+os.environ['PROFILE_DIR'] = os.path.join(TMP_DIR, 'profiles')
+os.environ['UPLOAD_TMP_DIR'] = TMP_DIR
+
+import app as application  # noqa: E402
+import migrations  # noqa: E402
+import storage  # noqa: E402
+from models import db, Post, User  # noqa: E402
+
+flask_app = application.app
+flask_app.config['TESTING'] = True
+flask_app.config['BLOB_STORAGE_PATH'] = os.path.join(TMP_DIR, 'blobs')
+storage.init_app(flask_app)
+
+
+def _dispose():
+    with flask_app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def reset_database(schema=None):
+    """Apaga os dois arquivos; com ``schema`` (SQL) o principal começa com ele."""
+    _dispose()
+    for path in (PRIMARY, REPLICA):
+        if os.path.exists(path):
+            os.remove(path)
+    if schema:
+        with sqlite3.connect(PRIMARY) as connection:
+            connection.executescript(schema)
+    application.fragment_cache.backend.clear()
+    application.sidebar_cache.clear()
+
+
+def replicate():
+    # "Replicação": a réplica passa a ser uma cópia do principal
+    _dispose()
+    shutil.copy(PRIMARY, REPLICA)
+
+
+@pytest.fixture
+def app():
+    reset_database()
+    with flask_app.app_context():
+        migrations.upgrade(log=lambda message: None)
+    replicate()
+    yield flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def logged_in(app, client):
+    """Usuária ``ana`` com um anúncio, logada no ``client``; devolve o id do anúncio."""
+    with app.app_context():
+        user = User(username='ana', password=generate_password_hash('senha'), location='Recife')
+        db.session.add(user)
+        db.session.flush()
+        post = Post(content='Bicicleta', price=300, user_id=user.id)
+        db.session.add(post)
+        db.session.commit()
+        post_id = post.id
+    client.post('/login', data={'username': 'ana', 'password': 'senha'})
+    return post_id
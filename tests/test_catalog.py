@@ -0,0 +1,25 @@
+import json
+
+from models import Post
+
+
+def test_broken_manifest_lines_count_as_failed(app, logged_in, tmp_path):
+    manifest = tmp_path / 'anuncios.jsonl'
+    manifest.write_text('\n'.join([
+        json.dumps({'content': 'Mesa de jantar', 'price': 450}),
+        '{"content": "Cadeira", "price": ',
+        json.dumps(['não', 'é', 'objeto']),
+        json.dumps({'content': 5, 'price': 10}),
+        json.dumps({'content': 'Sofá', 'price': 900, 'images': 'sofa.jpg'}),
+        json.dumps({'content': 'Estante', 'price': 300}),
+    ]) + '\n', encoding='utf-8')
+
+    result = app.test_cli_runner().invoke(
+        args=['import-catalog', str(manifest), '--images', str(tmp_path), '--user', 'ana', '--workers', '1'])
+
+    assert result.exception is None, result.output
+    assert '2 anúncio(s) importado(s), 4 ignorado(s)' in result.output
+    assert 'Registro 2 ignorado: JSON inválido' in result.output
+    assert 'Registro 3 ignorado: registro não é um objeto JSON' in result.output
+    with app.app_context():
+        assert {post.content for post in Post.query.filter(Post.id != logged_in)} == {'Mesa de jantar', 'Estante'}
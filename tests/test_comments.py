@@ -0,0 +1,23 @@
+from models import Comment
+
+
+def test_comment_json(client, logged_in):
+    post_id = logged_in
+
+    response = client.post(f'/post/{post_id}/comment', data={'content': 'Ainda disponível?'},
+                           headers={'Accept': 'application/json'})
+
+    assert response.status_code == 201
+    assert response.json['comments_count'] == 1
+    assert 'Ainda disponível?' in response.json['html']
+
+
+def test_comment_on_missing_post(app, client, logged_in):
+    response = client.post('/post/999/comment', data={'content': 'Oi'}, headers={'Accept': 'application/json'})
+    assert response.status_code == 404
+    assert response.json == {'error': 'Postagem não encontrada'}
+
+    response = client.post('/post/999/comment', data={'content': 'Oi'})
+    assert response.status_code == 302
+    with app.app_context():
+        assert Comment.query.count() == 0
@@ -0,0 +1,25 @@
+from conftest import replicate
+from models import db, Curriculo, User
+
+PDF = b'%PDF-1.4\n' + b'0' * 2048
+
+
+def test_legacy_pdf_can_be_downloaded(app, client):
+    with app.app_context():
+        user = User(username='ana', password='x', location='Recife')
+        db.session.add(user)
+        db.session.flush()
+        # Currículo de antes do storage: o PDF ainda está na tabela
+        curriculo = Curriculo(user_id=user.id, nome_completo='Ana Souza', email='ana@example.com',
+                              area_profissional='Design', experiencia='-', formacao='-',
+                              habilidades='-', objetivo='-', curriculo_pdf=PDF)
+        db.session.add(curriculo)
+        db.session.commit()
+        curriculo_id = curriculo.id
+    replicate()
+
+    body = client.get('/curriculos').data.decode()
+
+    assert 'Baixar PDF' in body and '(2.0 KB)' in body
+    response = client.get(f'/curriculo/{curriculo_id}/download')
+    assert response.status_code == 200 and response.data == PDF
@@ -0,0 +1,25 @@
+from database import pool_stats
+
+
+def test_reads_after_write_go_to_primary(app, client, logged_in):
+    # Usuário e anúncio só no principal: a réplica está atrasada
+    post_id = logged_in
+    anonymous = app.test_client()
+    replica_checkouts = pool_stats.checkouts['replica']
+
+    assert 'Bicicleta' not in anonymous.get('/').data.decode()
+    assert pool_stats.checkouts['replica'] > replica_checkouts
+    assert 'Bicicleta' not in client.get('/').data.decode()
+
+    client.post(f'/post/{post_id}/comment', data={'content': 'Ainda disponível?'})
+    body = client.get('/').data.decode()
+    assert 'Bicicleta' in body and 'Ainda disponível?' in body
+    assert 'Bicicleta' not in anonymous.get('/').data.decode()
+
+    # Passada a janela, quem escreveu volta a ler da réplica
+    window = app.config['REPLICA_READ_YOUR_WRITES_SECONDS']
+    app.config['REPLICA_READ_YOUR_WRITES_SECONDS'] = -1
+    try:
+        assert 'Bicicleta' not in client.get('/').data.decode()
+    finally:
+        app.config['REPLICA_READ_YOUR_WRITES_SECONDS'] = window
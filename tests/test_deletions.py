@@ -0,0 +1,69 @@
+import io
+from datetime import datetime, timedelta
+
+from PIL import Image, ImageDraw
+
+import deletions
+import storage
+from models import db, DeletionJob, Photo, Post
+
+
+def photo():
+    img = Image.new('RGB', (640, 480), 'white')
+    ImageDraw.Draw(img).ellipse((100, 50, 400, 300), fill='teal')
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def create_post(client, data):
+    client.post('/create_post', data={
+        'content': 'Mesa de jantar', 'price': '450', 'images': [(io.BytesIO(data), 'mesa.jpg')],
+    }, content_type='multipart/form-data')
+
+
+def delete_post(app, post_id):
+    with app.app_context():
+        job = deletions.schedule('post', post_id)
+        return deletions.run(job.id, log=lambda message: None).blobs_deleted
+
+
+def test_recent_blob_is_swept_later(app, client, monkeypatch, logged_in):
+    data = photo()
+    create_post(client, data)
+    with app.app_context():
+        post_id = Post.query.filter_by(content='Mesa de jantar').one().id
+        blob_hash = Photo.query.filter_by(post_id=post_id).one().blob_hash
+
+    # Outro envio da mesma foto pode estar gravando a linha agora
+    assert delete_post(app, post_id) == 0
+    with app.app_context():
+        assert storage.blob_store().exists(blob_hash)
+        assert deletions.sweep_blobs() == 0
+        assert deletions.status(DeletionJob.query.one())['blobs_pending'] > 0
+
+    monkeypatch.setattr(deletions, 'ORPHAN_GRACE_SECONDS', -60)
+    with app.app_context():
+        assert deletions.sweep_blobs() > 0
+        assert not storage.blob_store().exists(blob_hash)
+        job = DeletionJob.query.one()
+        assert job.pending_blobs is None and job.blobs_deleted > 0
+
+
+def test_running_job_is_resumed_only_after_lease(app, logged_in):
+    post_id = logged_in
+    with app.app_context():
+        job = deletions.schedule('post', post_id)
+        job.status = 'running'
+        db.session.commit()
+
+        # Outro processo está com o job: nem listado, nem assumido
+        assert deletions.resumable() == []
+        assert deletions.run(job.id) is None
+        assert db.session.get(Post, post_id) is not None
+
+        job.heartbeat_at = datetime.utcnow() - timedelta(seconds=deletions.LEASE_SECONDS + 1)
+        db.session.commit()
+        assert deletions.resumable() == [job.id]
+        assert deletions.run(job.id, log=lambda message: None).status == 'done'
+        assert db.session.get(Post, post_id) is None
@@ -0,0 +1,44 @@
+import io
+
+from PIL import Image, ImageDraw
+
+from models import Photo, Post
+
+
+def jpeg(img):
+    buffer = io.BytesIO()
+    img.convert('RGB').save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def create_post(client, *images):
+    return client.post('/create_post', data={
+        'content': 'Mesa de jantar', 'price': '450',
+        'images': [(io.BytesIO(data), f'foto{i}.jpg') for i, data in enumerate(images)],
+    }, content_type='multipart/form-data', follow_redirects=True)
+
+
+def test_plain_photos_are_not_duplicates(app, client, logged_in):
+    white = jpeg(Image.new('RGB', (640, 480), 'white'))
+    gradient = jpeg(Image.linear_gradient('L').resize((640, 480)))
+
+    response = create_post(client, white, gradient)
+    response = create_post(client, white, gradient)
+
+    assert 'Atenção' not in response.data.decode()
+    with app.app_context():
+        assert Photo.query.count() == 4
+
+
+def test_repeated_photo_is_accepted_with_warning(app, client, logged_in):
+    img = Image.new('RGB', (640, 480), 'white')
+    ImageDraw.Draw(img).rectangle((100, 50, 400, 300), fill='navy')
+    photo = jpeg(img)
+
+    response = create_post(client, photo)
+    assert 'Atenção' not in response.data.decode()
+    response = create_post(client, photo)
+
+    assert 'uma das fotos parece já estar em outro anúncio seu' in response.data.decode()
+    with app.app_context():
+        assert Post.query.filter_by(content='Mesa de jantar').count() == 2
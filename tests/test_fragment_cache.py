@@ -0,0 +1,55 @@
+import fragment_cache
+from fragment_cache import FragmentCache, LRUBackend, RedisBackend
+
+
+class FakeRedis:
+    """O mínimo do cliente Redis que o RedisBackend usa, com expiração."""
+
+    def __init__(self):
+        self.now = 0
+        self.items = {}
+
+    def mget(self, keys):
+        return [self._get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        self.items[key] = (value.encode(), self.now + ex if ex else None)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.items.pop(key, None)
+
+    def _get(self, key):
+        value, expires_at = self.items.get(key, (None, None))
+        if expires_at is not None and expires_at <= self.now:
+            return None
+        return value
+
+
+def test_lru_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(fragment_cache.time, 'monotonic', lambda: now[0])
+    backend = LRUBackend(max_entries=10, ttl=60)
+    backend.set('a', '<div>a</div>')
+
+    assert backend.get_many(['a']) == {'a': '<div>a</div>'}
+    now[0] += 61
+    assert backend.get_many(['a']) == {}
+
+
+def test_redis_invalidation_reaches_every_worker():
+    client = FakeRedis()
+    # Dois workers, cada um com o seu FragmentCache, no mesmo Redis
+    first = FragmentCache(RedisBackend(client, ttl=3600))
+    second = FragmentCache(RedisBackend(client, ttl=3600))
+
+    first.set(7, 'anon', '<div>Bicicleta</div>')
+    assert second.get_many([7, 8], 'anon') == {7: '<div>Bicicleta</div>'}
+    assert second.stats() == {'hits': 1, 'misses': 1}
+
+    second.invalidate(7)
+    assert first.get_many([7], 'anon') == {}
+
+    first.set(7, 'member', '<div>Bicicleta</div>')
+    client.now += 3601
+    assert second.get_many([7], 'member') == {}
@@ -0,0 +1,87 @@
+import json
+import os
+import re
+
+import pytest
+
+import metrics
+from conftest import replicate
+
+
+@pytest.fixture
+def token(app):
+    app.config['METRICS_TOKEN'] = 'segredo'
+    yield {'Authorization': 'Bearer segredo'}
+    app.config['METRICS_TOKEN'] = None
+
+
+def test_server_timing_header(client):
+    response = client.get('/')
+
+    assert response.status_code == 200
+    timing = response.headers['Server-Timing']
+    assert re.match(r'db;dur=[\d.]+;desc="\d+ queries", render;dur=[\d.]+, total;dur=[\d.]+$', timing)
+    queries = int(re.search(r'"(\d+) queries"', timing).group(1))
+    assert queries > 0
+
+
+def _sample(body, metric):
+    # O registro é do processo: os testes comparam antes e depois
+    match = re.search(rf'^nossoanuncio_{re.escape(metric)} (\S+)$', body, re.M)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_metrics_exports_requests(client, token):
+    before = client.get('/metrics', headers=token).data.decode()
+    client.get('/')
+    client.get('/')
+
+    body = client.get('/metrics', headers=token).data.decode()
+
+    for metric in ('requests_total{endpoint="index",method="GET",status="200"}',
+                   'request_duration_seconds_count{endpoint="index"}'):
+        assert _sample(body, metric) - _sample(before, metric) == 2
+    assert _sample(body, 'sql_queries_total{endpoint="index"}') > _sample(before, 'sql_queries_total{endpoint="index"}')
+    assert '# TYPE nossoanuncio_request_duration_seconds histogram' in body
+    assert '# TYPE nossoanuncio_db_pool_checkouts_total counter' in body
+
+
+def test_streamed_response_bytes(client, token, logged_in):
+    replicate()
+    metric = 'response_bytes_total{endpoint="api_posts"}'
+    before = _sample(client.get('/metrics', headers=token).data.decode(), metric)
+
+    response = client.get('/api/posts?format=ndjson')
+    assert response.is_streamed and len(response.data) > 0
+
+    body = client.get('/metrics', headers=token).data.decode()
+    assert _sample(body, metric) - before == len(response.data)
+
+
+def test_metrics_token(client, app):
+    # Sem token configurado o endpoint não existe
+    assert client.get('/metrics').status_code == 404
+    app.config['METRICS_TOKEN'] = 'segredo'
+    try:
+        assert client.get('/metrics').status_code == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer segredo'}).status_code == 200
+    finally:
+        app.config['METRICS_TOKEN'] = None
+
+
+def test_registry_sums_workers(tmp_path):
+    registry = metrics.Registry(directory=str(tmp_path))
+    registry.collector('queue', 'gauge', 'Fila', lambda: 2)
+    registry.collector('done_total', 'counter', 'Feitos', lambda: 5)
+    registry.observe('index', 'GET', 200, 0.01, 3, 0.001, 1, 100)
+    # Worker que já saiu: os contadores continuam, o gauge não
+    gone = dict(registry.snapshot(), pid=2 ** 22 + 1)
+    (tmp_path / 'outro.json').write_text(json.dumps(gone))
+
+    body = registry.render()
+
+    assert _sample(body, 'requests_total{endpoint="index",method="GET",status="200"}') == 2
+    assert _sample(body, 'response_bytes_total{endpoint="index"}') == 200
+    assert _sample(body, 'done_total') == 10
+    assert _sample(body, 'queue') == 2
+    assert f'{os.getpid()}.json' in os.listdir(tmp_path)
@@ -0,0 +1,135 @@
+import io
+import sqlite3
+
+import pytest
+from PIL import Image
+from werkzeug.security import generate_password_hash
+
+import migrations
+from conftest import PRIMARY, flask_app, replicate, reset_database
+from models import db, Photo, Post, ProfilePhoto
+
+# Esquema criado pelo db.create_all() da primeira versão do models.py
+BASELINE_SCHEMA = '''
+CREATE TABLE "usuários" (
+    id INTEGER NOT NULL, username VARCHAR(80) NOT NULL, password VARCHAR(120) NOT NULL,
+    location VARCHAR(100), is_admin BOOLEAN, created_at DATETIME,
+    PRIMARY KEY (id), UNIQUE (username)
+);
+CREATE TABLE fotos_perfil (
+    id INTEGER NOT NULL, user_id INTEGER, image_data BLOB NOT NULL,
+    created_at DATETIME, updated_at DATETIME,
+    PRIMARY KEY (id), UNIQUE (user_id), FOREIGN KEY(user_id) REFERENCES "usuários" (id) ON DELETE CASCADE
+);
+CREATE TABLE posts (
+    id INTEGER NOT NULL, content TEXT NOT NULL, price NUMERIC(10, 2) NOT NULL,
+    user_id INTEGER, created_at DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES "usuários" (id) ON DELETE CASCADE
+);
+CREATE TABLE fotos_anuncio (
+    id INTEGER NOT NULL, post_id INTEGER, image_data BLOB NOT NULL, is_main BOOLEAN, created_at DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(post_id) REFERENCES posts (id) ON DELETE CASCADE
+);
+CREATE TABLE gosta (
+    id INTEGER NOT NULL, user_id INTEGER, post_id INTEGER, created_at DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES "usuários" (id) ON DELETE CASCADE,
+    FOREIGN KEY(post_id) REFERENCES posts (id) ON DELETE CASCADE
+);
+CREATE TABLE nao_gosta (
+    id INTEGER NOT NULL, user_id INTEGER, post_id INTEGER, created_at DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES "usuários" (id) ON DELETE CASCADE,
+    FOREIGN KEY(post_id) REFERENCES posts (id) ON DELETE CASCADE
+);
+CREATE TABLE comentarios (
+    id INTEGER NOT NULL, content TEXT NOT NULL, user_id INTEGER, post_id INTEGER, created_at DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES "usuários" (id) ON DELETE CASCADE,
+    FOREIGN KEY(post_id) REFERENCES posts (id) ON DELETE CASCADE
+);
+CREATE TABLE curriculos (
+    id INTEGER NOT NULL, user_id INTEGER, nome_completo VARCHAR(100) NOT NULL, email VARCHAR(120) NOT NULL,
+    telefone VARCHAR(20), area_profissional VARCHAR(100) NOT NULL, experiencia TEXT NOT NULL,
+    formacao TEXT NOT NULL, habilidades TEXT NOT NULL, objetivo TEXT NOT NULL, curriculo_pdf BLOB,
+    created_at DATETIME, updated_at DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES "usuários" (id) ON DELETE CASCADE
+);
+'''
+
+
+def photo(seed):
+    buffer = io.BytesIO()
+    Image.effect_noise((64, 48), 40 + seed).convert('RGB').save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def legacy_db():
+    reset_database(BASELINE_SCHEMA)
+    with sqlite3.connect(PRIMARY) as connection:
+        connection.execute("INSERT INTO \"usuários\" (id, username, password, location) VALUES (1, 'ana', ?, 'Recife')",
+                           (generate_password_hash('senha'),))
+        connection.execute("INSERT INTO posts (id, content, price, user_id, created_at) "
+                           "VALUES (1, 'Bicicleta', 300, 1, '2024-01-01 10:00:00')")
+        connection.execute('INSERT INTO fotos_anuncio (id, post_id, image_data, is_main) VALUES (1, 1, ?, 1)',
+                           (photo(1),))
+        # Foto de um anúncio já apagado, de quando as chaves estrangeiras não valiam
+        connection.execute('INSERT INTO fotos_anuncio (id, post_id, image_data, is_main) VALUES (2, 99, ?, 1)',
+                           (photo(2),))
+        connection.execute('INSERT INTO fotos_perfil (id, user_id, image_data) VALUES (1, 1, ?)', (photo(3),))
+    yield
+    reset_database()
+
+
+def test_upgrade_baseline_sqlite_then_post_and_migrate_blobs(legacy_db):
+    runner = flask_app.test_cli_runner()
+    result = runner.invoke(args=['db-upgrade'])
+    assert result.exception is None, result.output
+    assert 'fotos_anuncio: 1 linha(s) órfã(s) descartada(s)' in result.output
+    replicate()
+
+    with sqlite3.connect(PRIMARY) as connection:
+        for table in ('fotos_anuncio', 'fotos_perfil'):
+            columns = {row[1]: row[3] for row in connection.execute(f'PRAGMA table_info({table})')}
+            assert columns['image_data'] == 0
+        indexes = {row[0] for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'fotos_anuncio'")}
+        assert {'ix_fotos_anuncio_blob_hash', 'ix_fotos_anuncio_post_id', 'ix_fotos_anuncio_phash_0'} <= indexes
+
+    client = flask_app.test_client()
+    client.post('/login', data={'username': 'ana', 'password': 'senha'})
+    response = client.post('/create_post', data={
+        'content': 'Mesa de jantar', 'price': '450',
+        'images': [(io.BytesIO(photo(4)), 'mesa.jpg')],
+    }, content_type='multipart/form-data')
+    assert response.status_code == 302
+
+    result = runner.invoke(args=['migrate-blobs'])
+    assert result.exception is None, result.output
+    assert 'fotos_anuncio: 1 arquivo(s) migrado(s)' in result.output
+    assert 'fotos_perfil: 1 arquivo(s) migrado(s)' in result.output
+
+    with flask_app.app_context():
+        post = Post.query.filter_by(content='Mesa de jantar').one()
+        photos = Photo.query.order_by(Photo.id).all()
+        assert [p.post_id for p in photos] == [1, post.id]
+        assert all(p.blob_hash and p.image_data is None for p in photos)
+        assert ProfilePhoto.query.one().blob_hash
+        assert migrations.pending_migrations(db.engine) == []
+
+
+def test_merge_legacy_reactions(legacy_db):
+    with sqlite3.connect(PRIMARY) as connection:
+        connection.execute("INSERT INTO \"usuários\" (id, username, password) VALUES (2, 'bia', 'x')")
+        # Ana curtiu e depois não curtiu: fica a mais recente
+        connection.execute("INSERT INTO gosta (user_id, post_id, created_at) VALUES (1, 1, '2024-01-02 10:00:00')")
+        connection.execute("INSERT INTO nao_gosta (user_id, post_id, created_at) VALUES (1, 1, '2024-01-03 10:00:00')")
+        connection.execute("INSERT INTO gosta (user_id, post_id, created_at) VALUES (2, 1, '2024-01-02 10:00:00')")
+
+    result = flask_app.test_cli_runner().invoke(args=['db-upgrade'])
+    assert result.exception is None, result.output
+
+    with sqlite3.connect(PRIMARY) as connection:
+        assert sorted(connection.execute('SELECT user_id, post_id, kind FROM reacoes')) == [
+            (1, 1, 'dislike'), (2, 1, 'like')]
+        assert connection.execute('SELECT likes_count, dislikes_count FROM posts WHERE id = 1').fetchone() == (1, 1)
+        tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert not {'gosta', 'nao_gosta'} & tables
@@ -0,0 +1,82 @@
+import io
+import os
+from datetime import datetime, timedelta
+
+from PIL import Image
+
+import app as application
+import uploads
+from models import db, Photo, Post
+
+
+def jpeg():
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), 'navy').save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def mark_pending(post_id, age=timedelta(0)):
+    post = db.session.get(Post, post_id)
+    post.photos_pending = 1
+    post.created_at = datetime.utcnow() - age
+    db.session.commit()
+
+
+def test_failed_photo_job_clears_pending(app, logged_in, monkeypatch):
+    def broken(variants):
+        raise OSError('disco cheio')
+
+    monkeypatch.setattr(application, 'store_image', broken)
+    with app.app_context():
+        mark_pending(logged_in)
+        paths = uploads.spool_pending(logged_in, [jpeg()])
+
+        application.finish_post_photos(logged_in, paths)
+
+        assert db.session.get(Post, logged_in).photos_pending == 0
+        assert not os.path.exists(uploads.pending_dir(logged_in))
+
+
+def test_resume_photos_processes_stale_posts(app, logged_in):
+    with app.app_context():
+        mark_pending(logged_in, age=timedelta(hours=1))
+        uploads.spool_pending(logged_in, [jpeg()])
+
+    result = app.test_cli_runner().invoke(args=['resume-photos'])
+
+    assert f'Anúncio {logged_in}: 1 foto(s) processada(s)' in result.output
+    with app.app_context():
+        assert db.session.get(Post, logged_in).photos_pending == 0
+        assert Photo.query.filter_by(post_id=logged_in).count() == 1
+        assert uploads.pending_sources(logged_in) == []
+
+
+def test_resume_photos_releases_posts_without_files(app, logged_in):
+    with app.app_context():
+        mark_pending(logged_in, age=timedelta(hours=1))
+
+    result = app.test_cli_runner().invoke(args=['resume-photos'])
+
+    assert 'fotos perdidas' in result.output
+    with app.app_context():
+        assert db.session.get(Post, logged_in).photos_pending == 0
+
+
+def test_background_photos_are_spooled_until_processed(app, client, logged_in, monkeypatch):
+    jobs = []
+    monkeypatch.setitem(app.config, 'IMAGE_PROCESSING_ASYNC', True)
+    monkeypatch.setattr(application.photo_jobs, 'submit', lambda *args: jobs.append(args))
+
+    client.post('/create_post', data={
+        'content': 'Mesa de jantar', 'price': '450', 'images': [(io.BytesIO(jpeg()), 'mesa.jpg')],
+    }, content_type='multipart/form-data')
+
+    with app.app_context():
+        post = Post.query.filter_by(content='Mesa de jantar').one()
+        assert post.photos_pending == 1
+        assert len(uploads.pending_sources(post.id)) == 1
+    func, *args = jobs[0]
+    func(*args)
+    with app.app_context():
+        assert Photo.query.filter_by(post_id=post.id).count() == 1
+        assert uploads.pending_sources(post.id) == []
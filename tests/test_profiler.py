@@ -0,0 +1,29 @@
+import app as application
+import profiler
+
+
+def profiled_requests():
+    return sum(application.request_profiler.requests.values())
+
+
+def test_header_ignored_unless_enabled(app, client):
+    token = profiler.make_token(app.config['SECRET_KEY'])
+    before = profiled_requests()
+
+    client.get('/', headers={profiler.HEADER: token})
+
+    assert profiled_requests() == before
+    result = app.test_cli_runner().invoke(args=['profile-token'])
+    assert result.exit_code != 0
+    assert 'PROFILE_HEADER_ENABLED' in result.output
+
+
+def test_signed_header_profiles_when_enabled(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'PROFILE_HEADER_ENABLED', True)
+    token = app.test_cli_runner().invoke(args=['profile-token']).output.splitlines()[0]
+    before = profiled_requests()
+
+    client.get('/', headers={profiler.HEADER: 'adulterado'})
+    assert profiled_requests() == before
+    client.get('/', headers={profiler.HEADER: token})
+    assert profiled_requests() == before + 1
@@ -0,0 +1,50 @@
+from models import db, Post, Reaction
+
+
+def counts(app, post_id):
+    with app.app_context():
+        post = db.session.get(Post, post_id)
+        return post.likes_count, post.dislikes_count
+
+
+def test_toggle_reaction(app, client, logged_in):
+    post_id = logged_in
+
+    assert client.post(f'/post/{post_id}/like').json == {'action': 'liked'}
+    assert counts(app, post_id) == (1, 0)
+    # Descurtir troca a reação, sem somar as duas
+    assert client.post(f'/post/{post_id}/dislike').json == {'action': 'disliked'}
+    assert counts(app, post_id) == (0, 1)
+    assert client.post(f'/post/{post_id}/dislike').json == {'action': 'undisliked'}
+    assert counts(app, post_id) == (0, 0)
+    with app.app_context():
+        assert Reaction.query.count() == 0
+
+    assert client.post('/post/999/like').status_code == 404
+
+
+def test_batch_reactions(app, client, logged_in):
+    post_id = logged_in
+
+    response = client.post('/reactions', json={'reactions': [
+        {'post_id': post_id, 'kind': 'dislike'},
+        {'post_id': post_id, 'kind': 'like'},
+        {'post_id': 999, 'kind': 'like'},
+    ]})
+
+    assert response.status_code == 200
+    assert response.json['reactions'] == [
+        {'post_id': post_id, 'kind': 'like', 'likes_count': 1, 'dislikes_count': 0},
+        {'post_id': 999, 'error': 'Postagem não encontrada'},
+    ]
+    # Reenviar o mesmo lote não muda nada
+    client.post('/reactions', json={'reactions': [{'post_id': post_id, 'kind': 'like'}]})
+    assert counts(app, post_id) == (1, 0)
+
+
+def test_batch_reactions_rejects_invalid_body(app, client, logged_in):
+    for body in ([1, 2], 'like', {'reactions': []}, {'reactions': [{'post_id': True, 'kind': 'like'}]},
+                 {'reactions': [{'post_id': '1', 'kind': 'like'}]}, {'reactions': [{'post_id': 1, 'kind': 'love'}]}):
+        assert client.post('/reactions', json=body).status_code == 400, body
+    with app.app_context():
+        assert Reaction.query.count() == 0
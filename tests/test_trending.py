@@ -0,0 +1,85 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+import trending
+from conftest import replicate
+from models import db, Post, TrendingEpoch, User
+
+
+def test_record_rebases_stale_epoch(app):
+    with app.app_context():
+        user = User(username='ana', password='x', location='Recife')
+        db.session.add(user)
+        db.session.flush()
+        post = Post(content='Bicicleta', price=300, user_id=user.id)
+        db.session.add(post)
+        db.session.flush()
+        # Job parado por 2000 meias-vidas: 2 ** 2000 estouraria o float
+        stale = datetime.utcnow() - timedelta(hours=2000 * app.config['TRENDING_HALF_LIFE_HOURS'])
+        trending.current_epoch()
+        db.session.execute(update(TrendingEpoch).where(TrendingEpoch.id == 1).values(epoch=stale))
+        db.session.commit()
+
+        trending.record(post.id, ('comment', datetime.utcnow(), 1))
+        db.session.commit()
+
+        assert trending.current_epoch() > datetime.utcnow() - timedelta(minutes=1)
+        db.session.refresh(post)
+        assert post.trending_score == pytest.approx(trending.WEIGHTS['comment'], rel=1e-3)
+        assert trending.weight('like', datetime.utcnow(), stale) == 2 ** trending.MAX_EXPONENT
+
+
+def test_concurrent_rebase_applies_decay_once(app):
+    with app.app_context():
+        user = User(username='ana', password='x', location='Recife')
+        db.session.add(user)
+        db.session.flush()
+        post = Post(content='Bicicleta', price=300, user_id=user.id, trending_score=1024.0)
+        db.session.add(post)
+        db.session.flush()
+        stale = datetime.utcnow() - timedelta(hours=10 * app.config['TRENDING_HALF_LIFE_HOURS'])
+        trending.current_epoch()
+        db.session.execute(update(TrendingEpoch).where(TrendingEpoch.id == 1).values(epoch=stale))
+        db.session.commit()
+
+        def rebase_in_thread():
+            with app.app_context():
+                trending.rebase()
+
+        # Segura a época enquanto outro rebase começa: ele tem de esperar e
+        # ver a época nova, não a antiga
+        epoch = trending._lock_epoch()
+        other = threading.Thread(target=rebase_in_thread)
+        other.start()
+        time.sleep(0.3)
+        trending._rescale(epoch, datetime.utcnow())
+        db.session.commit()
+        other.join()
+
+        db.session.refresh(post)
+        assert post.trending_score == pytest.approx(1.0, rel=1e-3)
+
+
+def test_trending_cursor_restarts_after_rebase(app, client, logged_in):
+    with app.app_context():
+        user = User.query.filter_by(username='ana').one()
+        for i in range(app.config['POSTS_PER_PAGE'] + 5):
+            db.session.add(Post(content=f'Anúncio {i}', price=10, user_id=user.id, trending_score=float(i)))
+        trending.current_epoch()
+        db.session.commit()
+    replicate()
+
+    first = client.get('/api/posts?order=trending').get_json()
+    second = client.get(f"/api/posts?order=trending&cursor={first['next_cursor']}").get_json()
+    assert second['items'][0]['id'] not in [item['id'] for item in first['items']]
+
+    with app.app_context():
+        trending.rebase()
+    replicate()
+
+    restarted = client.get(f"/api/posts?order=trending&cursor={first['next_cursor']}").get_json()
+    assert [item['id'] for item in restarted['items']] == [item['id'] for item in first['items']]
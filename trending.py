@@ -0,0 +1,167 @@
+"""Pontuação de tendência das postagens, com decaimento exponencial no tempo.
+
+Cada interação vale ``WEIGHTS[tipo] * 2 ** ((instante - época) / meia-vida)``.
+Todas as postagens decaem no mesmo ritmo, então ordenar por essa soma dá a
+mesma ordem que a pontuação decaída até agora: uma curtida ou comentário só
+soma um termo a ``posts.trending_score`` (um UPDATE) e a listagem é uma
+leitura pelo índice ``ix_posts_trending_score_id``, paginada por cursor.
+
+Os termos novos crescem com o tempo; ``rebase`` (o job periódico) traz a
+época para agora e multiplica todas as pontuações pelo mesmo fator, sem
+mudar a ordem. Se o job ficar parado por REBASE_HALF_LIVES meias-vidas,
+o próximo ``record`` reescala antes de somar, para ``2 ** expoente`` não
+estourar o float (em ~1024 meias-vidas).
+
+O job em segundo plano do app e o ``flask decay-trending`` podem coincidir:
+quem reescala trava a época para escrita antes de lê-la (``_lock_epoch``),
+então o segundo ``rebase`` vê a época nova e só aplica o decaimento desde o
+primeiro. Os cursores da listagem levam a época (ver ``feed_scope`` no app).
+"""
+from collections import defaultdict
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import bindparam, insert, select, update
+
+from models import db, Comment, Post, Reaction, TrendingEpoch
+
+WEIGHTS = {
+    'post': 1.0,
+    'like': 1.0,
+    'dislike': -1.0,
+    'comment': 2.0,
+}
+# Idade da época (em meias-vidas) a partir da qual ``record`` reescala
+REBASE_HALF_LIVES = 64
+# Teto do expoente em ``weight``: 2 ** 1024 já não cabe num float
+MAX_EXPONENT = 1000
+
+
+def half_life():
+    return current_app.config['TRENDING_HALF_LIFE_HOURS'] * 3600
+
+
+def weight(kind, at, epoch):
+    # Interações sem data (linhas antigas) contam como feitas na época
+    exponent = ((at or epoch) - epoch).total_seconds() / half_life()
+    return WEIGHTS[kind] * 2 ** min(exponent, MAX_EXPONENT)
+
+
+def current_epoch(executor=None, lock=False):
+    # ``lock`` segura a época (FOR SHARE no Postgres) até o commit: um
+    # rebase em andamento não reescala a pontuação no meio de um incremento
+    executor = executor if executor is not None else db.session
+    query = select(TrendingEpoch.epoch).where(TrendingEpoch.id == 1)
+    if lock:
+        query = query.with_for_update(read=True)
+    epoch = executor.execute(query).scalar()
+    if epoch is None:
+        epoch = datetime.utcnow()
+        executor.execute(insert(TrendingEpoch).values(id=1, epoch=epoch))
+    return epoch
+
+
+def record(post_id, *events):
+    """Soma à pontuação da postagem os eventos ``(tipo, instante, sinal)``.
+
+    Sinal -1 desfaz uma interação (reação removida), com o mesmo peso que
+    ela somou. Quem chama faz o commit.
+    """
+    now = datetime.utcnow()
+    if _rebase_due(current_epoch(), now):
+        # O job periódico não rodou: reescala aqui, na transação de quem
+        # chamou. Trava para escrita direto, sem FOR SHARE antes: promover
+        # o lock compartilhado a exclusivo dá deadlock entre duas reações
+        epoch = _lock_epoch()
+        if _rebase_due(epoch, now):
+            _rescale(epoch, now)
+            epoch = now
+    else:
+        epoch = current_epoch(lock=True)
+    delta = sum(sign * weight(kind, at, epoch) for kind, at, sign in events)
+    if delta:
+        db.session.execute(
+            update(Post)
+            .where(Post.id == post_id)
+            .values(trending_score=Post.trending_score + delta)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def rebase(min_age=0):
+    """Traz a época para agora, reescalando todas as pontuações.
+
+    Não faz nada se a época tem menos de ``min_age`` segundos. Devolve True
+    se reescalou. Faz o commit.
+    """
+    epoch = _lock_epoch()
+    now = datetime.utcnow()
+    if epoch is None:
+        current_epoch()
+        db.session.commit()
+        return False
+    age = (now - epoch).total_seconds()
+    if age < min_age:
+        db.session.rollback()
+        return False
+    _rescale(epoch, now)
+    db.session.commit()
+    return True
+
+
+def _rebase_due(epoch, now):
+    return (now - epoch).total_seconds() >= REBASE_HALF_LIVES * half_life()
+
+
+def _lock_epoch():
+    # Lê a época já travada para escrita até o commit. O SQLite ignora o
+    # FOR UPDATE: um UPDATE sem efeito pega antes o lock de escrita do banco,
+    # e um segundo rebase espera aqui em vez de ler a época antiga
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(
+            update(TrendingEpoch).where(TrendingEpoch.id == 1).values(epoch=TrendingEpoch.epoch)
+        )
+    return db.session.execute(
+        select(TrendingEpoch.epoch).where(TrendingEpoch.id == 1).with_for_update()
+    ).scalar()
+
+
+def _rescale(epoch, now):
+    # Multiplica as pontuações pelo decaimento de ``epoch`` até ``now`` e
+    # move a época; quem chama segura a época com ``_lock_epoch``
+    factor = 2 ** (-(now - epoch).total_seconds() / half_life())
+    db.session.execute(
+        update(Post)
+        .where(Post.trending_score != 0)
+        .values(trending_score=Post.trending_score * factor)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(update(TrendingEpoch).where(TrendingEpoch.id == 1).values(epoch=now))
+
+
+def recompute(post_ids=None, connection=None):
+    # Recalcula a pontuação a partir das postagens, reações e comentários
+    # (todas, ou só ``post_ids``); com ``connection`` roda dentro da
+    # transação de quem chamou (migrações). Quem chama faz o commit.
+    executor = connection if connection is not None else db.session
+    epoch = current_epoch(executor)
+
+    def only(query, column):
+        return query.where(column.in_(post_ids)) if post_ids is not None else query
+
+    scores = defaultdict(float)
+    for post_id, created_at in executor.execute(only(select(Post.id, Post.created_at), Post.id)):
+        scores[post_id] += weight('post', created_at, epoch)
+    for post_id, kind, created_at in executor.execute(
+        only(select(Reaction.post_id, Reaction.kind, Reaction.created_at), Reaction.post_id)
+    ):
+        scores[post_id] += weight(kind, created_at, epoch)
+    for post_id, created_at in executor.execute(only(select(Comment.post_id, Comment.created_at), Comment.post_id)):
+        scores[post_id] += weight('comment', created_at, epoch)
+
+    if scores:
+        table = Post.__table__
+        executor.execute(
+            table.update().where(table.c.id == bindparam('post_id')).values(trending_score=bindparam('score')),
+            [{'post_id': post_id, 'score': score} for post_id, score in scores.items()],
+        )
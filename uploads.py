@@ -0,0 +1,86 @@
+import io
+import os
+import shutil
+import tempfile
+
+from flask import Request, current_app
+
+
+class UploadRequest(Request):
+    """Request que grava uploads grandes direto em arquivo temporário.
+
+    Corpos até UPLOAD_SPOOL_THRESHOLD ficam na memória; acima disso cada
+    arquivo vai para um temporário com nome, que o pool de imagens abre
+    pelo caminho. O Werkzeug apaga os temporários ao fim da requisição.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        config = current_app.config
+        if total_content_length is not None and total_content_length <= config['UPLOAD_SPOOL_THRESHOLD']:
+            return io.BytesIO()
+        return tempfile.NamedTemporaryFile('wb+', prefix='upload-', dir=config['UPLOAD_TMP_DIR'])
+
+
+def upload_source(file, keep=False):
+    """Conteúdo do upload para o processamento: bytes ou caminho em disco.
+
+    Com ``keep=True`` um upload em disco é copiado para um temporário que
+    sobrevive à requisição (processamento em segundo plano); quem chama
+    apaga com ``discard_source``.
+    """
+    stream = file.stream
+    if isinstance(stream, io.BytesIO):
+        return stream.getvalue()
+    stream.flush()
+    if not keep:
+        return stream.name
+    stream.seek(0)
+    fd, path = tempfile.mkstemp(prefix='upload-', dir=current_app.config['UPLOAD_TMP_DIR'])
+    with os.fdopen(fd, 'wb') as copy:
+        shutil.copyfileobj(stream, copy)
+    return path
+
+
+def discard_source(source):
+    if isinstance(source, str):
+        try:
+            os.remove(source)
+        except FileNotFoundError:
+            pass
+
+
+def pending_dir(post_id):
+    # Fotos do anúncio à espera do processamento em segundo plano
+    base = current_app.config['UPLOAD_TMP_DIR'] or tempfile.gettempdir()
+    return os.path.join(base, 'fotos-pendentes', str(post_id))
+
+
+def spool_pending(post_id, sources):
+    """Move as fontes para a pasta do anúncio, na ordem do envio.
+
+    Em disco elas sobrevivem a um reinício do worker e o
+    ``flask resume-photos`` consegue processá-las. Devolve os caminhos.
+    """
+    directory = pending_dir(post_id)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i, source in enumerate(sources):
+        path = os.path.join(directory, f'{i:03d}')
+        if isinstance(source, str):
+            shutil.move(source, path)
+        else:
+            with open(path, 'wb') as f:
+                f.write(source)
+        paths.append(path)
+    return paths
+
+
+def pending_sources(post_id):
+    directory = pending_dir(post_id)
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))]
+
+
+def discard_pending(post_id):
+    shutil.rmtree(pending_dir(post_id), ignore_errors=True)